@@ -0,0 +1 @@
+# Performance benchmarks for the flight app. See benchmarks/harness.py.
@@ -0,0 +1,258 @@
+# File: bench_async_checkout.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Load test of concurrent checkouts against a slow local SerpAPI stub
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from benchmarks.harness import setup_django, benchmark_database, percentile, write_report
+
+"""
+Usage:
+    python -m benchmarks.bench_async_checkout --output async.json                 # Async views, one event loop
+    python -m benchmarks.bench_async_checkout --mode sync --threads 8 --output sync.json
+    python -m benchmarks.compare sync.json async.json
+
+Gives every simulated user a cart with --lines flights on their own dates,
+so no checkout is answered from the SerpAPI response cache, and points the
+SerpAPI clients at a local stub that answers after --upstream-ms. Each
+round then sends one checkout per user at once, --concurrency users per
+round, and reports wall time, throughput and p50/p95 latency counted from
+the start of the round.
+
+In async mode the requests go through Django's async handler and
+AsyncCheckoutView on a single event loop, like one ASGI worker. In sync
+mode they go through the WSGI handler and CheckoutView on --threads
+threads, like one sync worker with that many threads. The sync run needs
+about users / threads upstream delays per round. The async run finishes
+small rounds in about one delay; large ones are bound by the Django work
+around each checkout (sessions, queries, rendering), which one process
+does on one core, so add worker processes before raising the pool size.
+
+The test database is an SQLite file, since the requests run on several threads.
+"""
+
+
+def serve_upstream(delay, ports, requests):
+    """
+    Runs the stub SerpAPI server, answering every query after `delay` seconds.
+    Puts the port it listens on in `ports` and counts queries in `requests`.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep connections alive
+
+        def do_GET(self):
+            query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            with requests.get_lock():
+                requests.value += 1
+            time.sleep(delay)
+            dep, arr, day = query["departure_id"], query["arrival_id"], query["outbound_date"]
+            body = json.dumps({"best_flights": [{"price": 300, "flights": [{
+                "flight_number": "ZZ 1",
+                "departure_airport": {"id": dep, "name": f"{dep} Airport", "time": f"{day} 08:00"},
+                "arrival_airport": {"id": arr, "name": f"{arr} Airport", "time": f"{day} 11:00"},
+            }]}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024  # Accept a burst of connections
+
+    server = Server(("127.0.0.1", 0), Handler)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+class SlowUpstream:
+    """
+    Local SerpAPI stand-in that answers every query after `delay` seconds. It
+    runs in its own process, so serving the stub does not compete with Django
+    for the interpreter lock and skew the timings.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._requests = multiprocessing.Value("i", 0)
+
+    @property
+    def requests(self):
+        return self._requests.value
+
+    def __enter__(self):
+        ports = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve_upstream, args=(self.delay, ports, self._requests), daemon=True,
+        )
+        self.process.start()
+        self.endpoint = f"http://127.0.0.1:{ports.get(timeout=10)}/search"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+def create_shoppers(count, lines):
+    """
+    Creates `count` users whose carts hold `lines` flights each, every flight on
+    its own date, and returns the users.
+    """
+    from django.contrib.auth.models import User
+    from flights.models import Airport, AircraftType, Flight, ShoppingCart, ShoppingCartFlight
+
+    origin = Airport.objects.create(code="BOS", name="Boston Logan", city="Boston", country="USA")
+    destination = Airport.objects.create(code="HND", name="Tokyo Haneda", city="Tokyo", country="Japan")
+    aircraft = AircraftType.objects.create(model="Boeing 787", seat_capacity=250)
+    start = datetime(2031, 1, 1, 9, tzinfo=timezone.utc)
+    flights = Flight.objects.bulk_create([
+        Flight(
+            flight_number=f"LT{n}", departure_airport=origin, arrival_airport=destination,
+            departure_time=start + timedelta(days=n), arrival_time=start + timedelta(days=n, hours=13),
+            cost=900, aircraft=aircraft, seats_left=200,
+        )
+        for n in range(count * lines)
+    ])
+    users = User.objects.bulk_create([User(username=f"shopper{n}") for n in range(count)])
+    carts = ShoppingCart.objects.bulk_create([ShoppingCart(user=user) for user in users])
+    ShoppingCartFlight.objects.bulk_create([
+        ShoppingCartFlight(cart=cart, flight=flights[n * lines + line])
+        for n, cart in enumerate(carts)
+        for line in range(lines)
+    ])
+    return users
+
+
+def summarize(latencies, wall, errors):
+    """
+    Returns the statistics of one round.
+    """
+    return {
+        "runs": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+    }
+
+
+def run_async(loop, clients, url):
+    """
+    Sends one checkout per client at once through the async handler on `loop`.
+    Returns each request's (milliseconds since the round started, status code)
+    and the round's wall time.
+    """
+    async def checkout(client, started):
+        response = await client.get(url)
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    async def round_(started):
+        return await asyncio.gather(*(checkout(client, started) for client in clients))
+
+    started = time.perf_counter()
+    outcomes = loop.run_until_complete(round_(started))
+    return outcomes, time.perf_counter() - started
+
+
+def run_sync(clients, url, threads):
+    """
+    Sends one checkout per client through the WSGI handler on `threads` threads.
+    Latencies count from the start of the round, so they include the time a
+    request waited for a free thread, as it would behind a real server.
+    """
+    def checkout(client):
+        response = client.get(url)
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(checkout, clients))
+    return outcomes, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=("async", "sync"), default="async")
+    parser.add_argument("--concurrency", default="10,50,200", help="Comma-separated users per round")
+    parser.add_argument("--lines", type=int, default=2, help="Flights in each cart")
+    parser.add_argument("--upstream-ms", type=int, default=1000, help="Stub SerpAPI response time")
+    parser.add_argument("--threads", type=int, default=8, help="Worker threads in sync mode")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    rounds = [int(n) for n in args.concurrency.split(",")]
+
+    # The URLs pick the async views from this setting when they are loaded
+    os.environ["FLIGHTS_ASYNC_VIEWS"] = "1" if args.mode == "async" else "0"
+    setup_django()
+    from django.core.cache import caches
+    from django.test import AsyncClient, Client
+    from django.urls import reverse
+    from flights.serpapi_async import AsyncSerpApiClient
+    from flights.serpapi_client import SerpApiClient
+
+    with tempfile.TemporaryDirectory() as tmp, benchmark_database(test_name=os.path.join(tmp, "bench.sqlite3")):
+        users = create_shoppers(max(rounds), args.lines)
+        url = reverse("checkout")
+
+        results = {}
+        loop = asyncio.new_event_loop()  # One loop for every round, like a long-running ASGI worker
+        with SlowUpstream(args.upstream_ms / 1000) as upstream:
+            if args.mode == "async":
+                patcher = mock.patch("flights.views.get_async_client", return_value=AsyncSerpApiClient(
+                    api_key="benchmark", endpoint=upstream.endpoint, retries=0,
+                ))
+            else:
+                patcher = mock.patch("flights.views.get_client", return_value=SerpApiClient(
+                    api_key="benchmark", endpoint=upstream.endpoint, retries=0,
+                ))
+            with patcher:
+                for warmup, concurrency in [(True, 1)] + [(False, n) for n in rounds]:
+                    caches["serpapi"].clear()
+                    clients = []
+                    for user in users[:concurrency]:
+                        client = AsyncClient() if args.mode == "async" else Client()
+                        client.force_login(user)
+                        clients.append(client)
+                    if args.mode == "async":
+                        outcomes, wall = run_async(loop, clients, url)
+                    else:
+                        outcomes, wall = run_sync(clients, url, args.threads)
+                    if warmup:
+                        continue  # Only there to open connections and fill lazy caches
+                    errors = sum(1 for _, status in outcomes if status != 200)
+                    results[f"checkout[concurrency={concurrency}]"] = summarize(
+                        [latency for latency, _ in outcomes], wall, errors,
+                    )
+                    print(f"{concurrency} users: {wall:.2f} s", file=sys.stderr)
+        loop.close()
+        upstream_requests = upstream.requests
+
+        write_report({
+            "benchmark": "async_checkout",
+            "mode": args.mode,
+            "threads": args.threads if args.mode == "sync" else None,
+            "upstream_ms": args.upstream_ms,
+            "lines": args.lines,
+            "upstream_requests": upstream_requests,
+            "results": results,
+        }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# File: bench_itineraries.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Benchmark for the multi-leg itinerary search
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from benchmarks.harness import setup_django, benchmark_database, percentile, write_report
+
+"""
+Usage:
+    python -m benchmarks.bench_itineraries                 # 5k airports, 1M flights, in memory
+    python -m benchmarks.bench_itineraries --database --flights 200000
+
+By default a hub-and-spoke network is generated straight into a FlightGraph,
+which measures the search itself. With --database the flights are written to
+a test database first, so the report also covers building the graph from the
+database and refreshing it after new flights are added.
+"""
+
+BASE_TIME = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+def generate_rows(airports, flights, days, hubs, seed):
+    """
+    Returns (rows, min_connection) for a synthetic network in which most
+    flights touch one of the hub airports, like a real airline schedule.
+    Rows are sorted the way FlightGraph.load expects.
+    """
+    rng = random.Random(seed)
+    airport_ids = list(range(1, airports + 1))
+    hub_ids = airport_ids[:hubs]
+    start = int(BASE_TIME.timestamp())
+    rows = []
+    for flight_id in range(1, flights + 1):
+        roll = rng.random()
+        if roll < 0.6:  # Spoke <-> hub
+            a, b = rng.choice(hub_ids), rng.choice(airport_ids)
+        elif roll < 0.85:  # Hub <-> hub
+            a, b = rng.sample(hub_ids, 2)
+        else:  # Spoke <-> spoke
+            a, b = rng.sample(airport_ids, 2)
+        if a == b:
+            b = airport_ids[(b % airports)]  # Next airport over
+        origin, destination = (a, b) if rng.random() < 0.5 else (b, a)
+        departs = start + rng.randrange(days * 86400 // 300) * 300
+        arrives = departs + rng.randint(45, 900) * 60
+        rows.append((flight_id, origin, departs, arrives, rng.randint(5000, 300000), destination))
+    rows.sort(key=lambda row: (row[1], row[2]))
+    min_connection = {airport_id: rng.randint(5, 45) * 60 for airport_id in airport_ids}
+    return rows, min_connection
+
+
+def time_searches(graph, airport_ids, queries, days, seed, sort, k, max_legs):
+    """
+    Runs `queries` random searches and returns latency statistics in milliseconds.
+    """
+    rng = random.Random(seed)
+    samples = []
+    found = 0
+    for _ in range(queries):
+        origin, destination = rng.sample(airport_ids, 2)
+        day_start = int((BASE_TIME + timedelta(days=rng.randrange(days))).timestamp())
+        started = time.perf_counter()
+        results = graph.search(origin, destination, day_start, day_start + 86400, k=k, max_legs=max_legs, sort=sort)
+        samples.append((time.perf_counter() - started) * 1000)
+        found += bool(results)
+    return {
+        "queries": queries,
+        "found_ratio": round(found / queries, 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--airports", type=int, default=5000)
+    parser.add_argument("--flights", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=30, help="Days the schedule is spread over")
+    parser.add_argument("--hubs", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-legs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=412)
+    parser.add_argument("--database", action="store_true", help="Load the flights through a test database")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from flights.itineraries import FlightGraph
+
+    report = {"benchmark": "itineraries", "dataset": {
+        "airports": args.airports, "flights": args.flights, "days": args.days, "hubs": args.hubs,
+    }}
+
+    def run_searches(graph, airport_ids):
+        report["graph_bytes"] = sum(len(d) for d in graph.departures.values()) * 5 * 8 + graph.origins.itemsize * len(graph.origins)
+        report["results"] = {
+            f"search[{sort},k={args.k},legs<={args.max_legs}]": time_searches(
+                graph, airport_ids, args.queries, args.days, args.seed, sort, args.k, args.max_legs
+            )
+            for sort in ("cheapest", "fastest")
+        }
+
+    if not args.database:
+        started = time.perf_counter()
+        rows, min_connection = generate_rows(args.airports, args.flights, args.days, args.hubs, args.seed)
+        report["generate_seconds"] = round(time.perf_counter() - started, 2)
+        graph = FlightGraph()
+        started = time.perf_counter()
+        graph.load(rows, min_connection)
+        report["build_seconds"] = round(time.perf_counter() - started, 2)
+        del rows
+        run_searches(graph, list(min_connection))
+        write_report(report, args.output)
+        return
+
+    from benchmarks.dataset import generate, create_flights
+    from flights.models import Airport, AircraftType
+
+    with benchmark_database():
+        started = time.perf_counter()
+        generate(airports=args.airports, flights=args.flights, seed=args.seed, days=args.days)
+        report["generate_seconds"] = round(time.perf_counter() - started, 2)
+        graph = FlightGraph()
+        started = time.perf_counter()
+        graph.refresh()
+        report["build_seconds"] = round(time.perf_counter() - started, 2)
+
+        # Incremental refresh after an import of 1,000 new flights
+        airport_ids = list(Airport.objects.values_list("pk", flat=True))
+        aircraft_ids = list(AircraftType.objects.values_list("pk", flat=True))
+        create_flights(1000, airport_ids, aircraft_ids, random.Random(args.seed + 1), days=args.days, prefix="NEW")
+        started = time.perf_counter()
+        graph.refresh()
+        report["refresh_1000_new_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        run_searches(graph, airport_ids)
+        write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
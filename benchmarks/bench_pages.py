@@ -0,0 +1,233 @@
+# File: bench_pages.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: End-to-end benchmark of the flight app pages through the Django test client
+
+import argparse
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from benchmarks.harness import setup_django, benchmark_database, measure, profile, write_report
+
+"""
+Usage:
+    python -m benchmarks.bench_pages                                # 5k airports, 1M flights, 100k carts
+    python -m benchmarks.bench_pages --flights 50000 --carts 5000 --output before.json
+    python -m benchmarks.compare before.json after.json
+
+Loads a seeded catalog with users and filled shopping carts, then requests
+the key pages through the Django test client as a logged-in user: the
+flight list with each filter, sort and a deep page, flight detail, airport
+detail, the fare calendar, the shopping cart, adding a flight to the cart and a flight import.
+Imports are queued through the import form and run by the job worker
+against a local stub of the SerpAPI endpoint, so no network or API key is
+needed.
+
+Every path reports p50/p95 latency over --repeat requests, plus the queries
+and peak Python memory of one extra request. Pages are measured with warm
+caches, the way a busy server sees them; pass --cold to clear the default
+cache before every request instead.
+"""
+
+# Flight list query strings. {dep} and {arr} are airport ids; {page} and {cursor}
+# point at the same deep page (page 500 when there are enough flights).
+FLIGHT_LIST_QUERIES = {
+    "all": "",
+    "text": "q=tokyo",
+    "departure_airport": "departure_airport={dep}",
+    "route": "departure_airport={dep}&arrival_airport={arr}",
+    "dates": "date_from=2030-03-01&date_to=2030-03-07",
+    "price": "min_cost=100&max_cost=300",
+    "sort_price": "sort=price",
+    "sort_latest": "sort=-departure",
+    "combined": "departure_airport={dep}&date_from=2030-01-01&date_to=2030-06-30&max_cost=1500&sort=price",
+    "deep_offset": "page={page}",
+    "deep_keyset": "pagination=keyset&cursor={cursor}",
+}
+
+
+class StubSerpApi:
+    """
+    Local stand-in for the SerpAPI endpoint. Answers every google_flights query
+    with `legs` one-leg itineraries for the requested route and date.
+    """
+
+    def __init__(self, legs=20):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive
+
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                body = json.dumps(stub_payload(
+                    query["departure_id"], query["arrival_id"], query["outbound_date"], legs
+                )).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/search"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def stub_payload(departure, arrival, day, legs):
+    """
+    Builds a google_flights payload with `legs` flights from departure to arrival on `day`.
+    Flight numbers include the date, so every date imports new flights.
+    """
+    return {
+        "best_flights": [
+            {
+                "price": 200 + n,
+                "flights": [{
+                    "flight_number": f"ZZ {day.replace('-', '')}{n}",
+                    "departure_airport": {"id": departure, "name": f"{departure} Airport", "time": f"{day} 08:00"},
+                    "arrival_airport": {"id": arrival, "name": f"{arrival} Airport", "time": f"{day} 11:30"},
+                    "airplane": "Boeing 787",
+                    "extensions": ["Wi-Fi", "Power outlets"],
+                }],
+            }
+            for n in range(legs)
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--airports", type=int, default=5000)
+    parser.add_argument("--aircraft", type=int, default=200)
+    parser.add_argument("--flights", type=int, default=1000000)
+    parser.add_argument("--carts", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=412)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--import-legs", type=int, default=20, help="Flights in each stubbed SerpAPI answer")
+    parser.add_argument("--cold", action="store_true", help="Clear the default cache before every request")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test import Client
+    from django.urls import reverse
+    from benchmarks.dataset import generate
+    from flights.fares import rebuild_route_fares
+    from flights.filters import SORT_ORDERINGS, DEFAULT_SORT
+    from flights.import_jobs import process_jobs
+    from flights.models import Airport, Flight, ImportJob, ShoppingCart
+    from flights.pagination import KeysetPaginator
+    from flights.search import drop_search_index, install_search_index, rebuild_search_index
+    from flights.serpapi_client import SerpApiClient
+
+    with benchmark_database():
+        started = time.perf_counter()
+        drop_search_index(connection)
+        counts = generate(
+            airports=args.airports, aircraft=args.aircraft, flights=args.flights, seed=args.seed, carts=args.carts,
+        )
+        install_search_index(connection)
+        rebuild_search_index(connection)
+        rebuild_route_fares()  # The generator bulk-creates flights, which skips the incremental upkeep
+        load_seconds = time.perf_counter() - started
+
+        # The first flight and its route, the row before the deep page and a user with a filled cart
+        flight = Flight.objects.order_by("pk").first()
+        dep, arr = flight.departure_airport_id, flight.arrival_airport_id
+        page = max(1, min(500, (args.flights - 1) // 10))
+        ordering = SORT_ORDERINGS[DEFAULT_SORT]
+        cursor = ""
+        if page > 1:
+            before = Flight.objects.order_by(*ordering)[(page - 1) * 10 - 1]
+            cursor = KeysetPaginator(Flight.objects.all(), 10, ordering=ordering).encode_cursor(before, "next")
+        cart = ShoppingCart.objects.filter(item_count__gt=0).select_related("user").first()
+        if cart is None:
+            raise SystemExit("No filled shopping cart was generated; run with --carts 1 or more.")
+
+        client = Client()
+        client.force_login(cart.user)
+
+        def get(url):
+            def request():
+                if args.cold:
+                    caches["default"].clear()
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise SystemExit(f"GET {url} answered {response.status_code}")
+            return request
+
+        def run(name, fn):
+            results[name] = {**measure(fn, repeat=args.repeat), **profile(fn)}
+
+        results = {}
+        for name, query in FLIGHT_LIST_QUERIES.items():
+            query = query.format(dep=dep, arr=arr, page=page, cursor=cursor)
+            run(f"flight_list[{name}]", get(f"{reverse('all_flights')}?{query}"))
+        run("flight_detail", get(reverse("flight_detail", kwargs={"pk": flight.pk})))
+        run("airport_detail", get(f"{reverse('airport_detail', kwargs={'pk': dep})}?start=2030-01-15"))
+        run("fare_calendar", get(
+            f"{reverse('fare_calendar')}?departure_airport={dep}&arrival_airport={arr}&month={flight.departure_time:%Y-%m}"
+        ))
+        run("shopping_cart", get(reverse("shopping_cart")))
+
+        # Every add holds a seat; give the flight enough for warm-up, timed and profiled requests
+        Flight.objects.filter(pk=flight.pk).update(seats_left=args.repeat + 10)
+        add_url = reverse("add_to_cart", kwargs={"pk": flight.pk})
+
+        def add_to_cart():
+            if args.cold:
+                caches["default"].clear()
+            response = client.post(add_url)
+            if response.status_code != 302 or response.url != reverse("shopping_cart"):
+                raise SystemExit(f"POST {add_url} did not add the flight to the cart")
+
+        run("add_to_cart", add_to_cart)
+
+        # Imports: queue a job through the form and run it with the worker, one new date per request
+        codes = dict(Airport.objects.filter(pk__in=[dep, arr]).values_list("pk", "code"))
+        days = iter(date(2031, 1, 1) + timedelta(days=n) for n in range(100000))
+
+        def import_flights():
+            if args.cold:
+                caches["default"].clear()
+            response = client.post(reverse("import-flights"), {
+                "departure_id": codes[dep], "arrival_id": codes[arr], "outbound_date": next(days).isoformat(),
+            })
+            if response.status_code != 302 or process_jobs(once=True) != 1:
+                raise SystemExit("Flight import was not queued and processed")
+            job = ImportJob.objects.latest("pk")
+            if job.status != ImportJob.STATUS_SUCCEEDED:
+                raise SystemExit(f"Flight import failed: {job.error}")
+
+        with StubSerpApi(legs=args.import_legs) as stub:
+            stub_client = SerpApiClient(api_key="benchmark", endpoint=stub.endpoint, retries=0)
+            with mock.patch("flights.import_jobs.get_client", return_value=stub_client):
+                run("import_flights", import_flights)
+            stub_client.close()
+
+        write_report({
+            "benchmark": "pages",
+            "vendor": connection.vendor,
+            "dataset": counts,
+            "cache": "cold" if args.cold else "warm",
+            "load_seconds": round(load_seconds, 1),
+            "results": results,
+        }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# File: bench_search.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Benchmark for the full-text flight search
+
+import argparse
+import time
+from benchmarks.harness import setup_django, benchmark_database, measure, write_report
+
+"""
+Usage:
+    python -m benchmarks.bench_search --flights 500000
+
+Loads a synthetic catalog, then times ranked search_flights() lookups and
+the flight list queryset with a text search. The full-text triggers are
+dropped during the load and the index is rebuilt in one pass afterwards.
+
+Selective searches (flight numbers, airport codes, cities) should stay
+under 10 ms. Terms shared by a large part of the catalog, like amenities,
+cost time in proportion to the number of flights they match.
+"""
+
+QUERIES = {
+    "flight_number": "KE120",
+    "airport_code": "BAF",
+    "city": "tokyo",
+    "city_and_amenity": "seoul lie flat",
+    "two_cities": "boston singapore",
+    "amenity_only": "lie flat",  # Matches about a third of all flights
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flights", type=int, default=500000)
+    parser.add_argument("--airports", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from benchmarks.dataset import generate
+    from flights.filters import FlightFilter
+    from flights.models import Flight
+    from flights.search import search_flights, drop_search_index, install_search_index, rebuild_search_index
+    from django.http import QueryDict
+
+    with benchmark_database():
+        started = time.perf_counter()
+        drop_search_index(connection)
+        counts = generate(airports=args.airports, flights=args.flights)
+        install_search_index(connection)
+        rebuild_search_index(connection)
+        load_seconds = time.perf_counter() - started
+
+        results = {}
+        for name, text in QUERIES.items():
+            results[f"search_flights[{name}]"] = measure(lambda: search_flights(text, 20), repeat=args.repeat)
+            queryset = Flight.objects.select_related("departure_airport", "arrival_airport")
+            for sort in ("departure", "relevance"):
+                flight_filter = FlightFilter(QueryDict(f"q={text}&sort={sort}"))
+                page = flight_filter.apply(queryset).order_by(*flight_filter.ordering)
+                results[f"flight_list[{name},sort={sort}]"] = measure(lambda: list(page[:10]), repeat=args.repeat)
+
+        write_report({
+            "benchmark": "search",
+            "vendor": connection.vendor,
+            "dataset": counts,
+            "load_seconds": round(load_seconds, 1),
+            "results": results,
+        }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# File: bench_seat_holds.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Contention benchmark for seat holds on a single flight
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from benchmarks.harness import setup_django, benchmark_database, percentile, write_report
+
+"""
+Usage:
+    python -m benchmarks.bench_seat_holds                       # 300 threads, 200 seats, 5 rounds
+    python -m benchmarks.bench_seat_holds --threads 500 --attempts 4
+
+Every round refills one flight with --seats seats and starts --threads
+threads at once, each with its own cart, each trying to hold a seat
+--attempts times the way AddFlightToCartView does. Demand is larger than
+supply, so a correct run sells exactly --seats seats and turns the rest
+away; any difference is reported as oversold. Per-round throughput and
+latency show whether contention degrades as rounds repeat. The report
+ends with the time the sweeper takes to release --expired expired holds.
+
+The test database is an SQLite file (or whatever DATABASES points at), since
+threads cannot share SQLite's in-memory test database.
+"""
+
+
+def run_round(flight_id, cart_ids, seats, attempts):
+    """
+    Refills the flight, lets one thread per cart race for its seats and returns the round's statistics.
+    """
+    from django.db import connection, transaction, OperationalError
+    from flights.models import Flight, SeatHold, ShoppingCartFlight
+    from flights.seat_holds import hold_seats, SeatsUnavailable
+
+    SeatHold.objects.all().delete()
+    ShoppingCartFlight.objects.all().delete()
+    Flight.objects.filter(pk=flight_id).update(seats_left=seats)
+
+    barrier = threading.Barrier(len(cart_ids) + 1)
+    lock = threading.Lock()
+    outcomes = {"held": 0, "sold_out": 0, "errors": 0}
+    samples = []
+
+    def adder(cart_id):
+        from flights.models import ShoppingCart
+        cart = ShoppingCart(pk=cart_id)
+        barrier.wait()
+        try:
+            for _ in range(attempts):
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        hold_seats(cart, flight_id)
+                        ShoppingCartFlight.objects.create(cart=cart, flight_id=flight_id)
+                    outcome = "held"
+                except SeatsUnavailable:
+                    outcome = "sold_out"
+                except OperationalError:  # e.g. SQLite's busy timeout
+                    outcome = "errors"
+                with lock:
+                    outcomes[outcome] += 1
+                    samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=adder, args=(cart_id,)) for cart_id in cart_ids]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    seats_left = Flight.objects.values_list("seats_left", flat=True).get(pk=flight_id)
+    held = sum(SeatHold.objects.values_list("seats", flat=True))
+    return {
+        **outcomes,
+        "seats_left": seats_left,
+        "oversold": max(0, held - seats),
+        "consistent": held + seats_left == seats == outcomes["held"] + seats_left,
+        "seconds": round(elapsed, 3),
+        "attempts_per_second": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def time_sweep(flight_id, cart_ids, expired):
+    """
+    Creates `expired` expired holds and times the sweeper releasing them.
+    """
+    from django.utils import timezone
+    from flights.models import Flight, SeatHold
+    from flights.seat_holds import release_expired_holds
+
+    SeatHold.objects.all().delete()
+    Flight.objects.filter(pk=flight_id).update(seats_left=0)
+    past = timezone.now() - timedelta(minutes=1)
+    SeatHold.objects.bulk_create(
+        [SeatHold(cart_id=cart_ids[n % len(cart_ids)], flight_id=flight_id, expires_at=past) for n in range(expired)],
+        batch_size=5000,
+    )
+    started = time.perf_counter()
+    released = release_expired_holds()
+    elapsed = time.perf_counter() - started
+    return {
+        "released": released,
+        "seconds": round(elapsed, 3),
+        "seats_restored": Flight.objects.values_list("seats_left", flat=True).get(pk=flight_id) == expired,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=300, help="Concurrent adders, one cart each")
+    parser.add_argument("--attempts", type=int, default=2, help="Holds each adder tries per round")
+    parser.add_argument("--seats", type=int, default=200, help="Seats on the flight at the start of each round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--expired", type=int, default=20000, help="Expired holds for the sweeper")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from benchmarks.dataset import generate
+    from flights.models import Flight, ShoppingCart
+
+    report = {"benchmark": "seat_holds", "threads": args.threads, "attempts": args.attempts, "seats": args.seats}
+    with tempfile.TemporaryDirectory() as directory:
+        with benchmark_database(os.path.join(directory, "bench_seat_holds.sqlite3")):
+            generate(airports=10, aircraft=2, flights=10)
+            flight_id = Flight.objects.values_list("pk", flat=True).first()
+            User.objects.bulk_create([User(username=f"bench{n}") for n in range(args.threads)])
+            ShoppingCart.objects.bulk_create([ShoppingCart(user=user) for user in User.objects.all()])
+            cart_ids = list(ShoppingCart.objects.values_list("pk", flat=True))
+
+            report["rounds"] = [run_round(flight_id, cart_ids, args.seats, args.attempts) for _ in range(args.rounds)]
+            report["oversold"] = sum(result["oversold"] for result in report["rounds"])
+            report["sweep"] = time_sweep(flight_id, cart_ids, args.expired)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# File: compare.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Compares two benchmark reports
+
+import argparse
+import json
+from pathlib import Path
+
+"""
+Usage:
+    python -m benchmarks.compare before.json after.json
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Prints, for every result both reports share, the p50 and p95 latency and,
+when reported, the query count and peak memory of each run and how they
+changed. A path is flagged as a regression when its p95 latency grew by
+more than --threshold percent or it runs more queries; the command exits
+with status 1 if any path regressed, so it can gate a CI job.
+"""
+
+METRICS = ("p50_ms", "p95_ms", "queries", "peak_kb")
+
+
+def change(old, new):
+    """
+    Returns the change from old to new as a signed percentage string.
+    """
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(before, after, threshold):
+    """
+    Returns (table lines, names of regressed results) for two reports.
+    """
+    lines = [f"{'result':<40} " + " ".join(f"{metric:>26}" for metric in METRICS)]
+    regressions = []
+    for name in sorted(set(before["results"]) & set(after["results"])):
+        old, new = before["results"][name], after["results"][name]
+        cells = []
+        for metric in METRICS:
+            if metric in old and metric in new:
+                cells.append(f"{old[metric]:>9} -> {new[metric]:<9} {change(old[metric], new[metric]):>6}")
+            else:
+                cells.append(f"{'-':>26}")
+        slower = "p95_ms" in old and new.get("p95_ms", 0) > old["p95_ms"] * (1 + threshold / 100)
+        more_queries = "queries" in old and new.get("queries", 0) > old["queries"]
+        if slower or more_queries:
+            regressions.append(name)
+        lines.append(f"{name:<40} " + " ".join(cells) + ("  REGRESSION" if slower or more_queries else ""))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed p95 slowdown in percent")
+    args = parser.parse_args()
+
+    before = json.loads(Path(args.before).read_text())
+    after = json.loads(Path(args.after).read_text())
+    for key in ("benchmark", "vendor", "dataset", "cache"):
+        if before.get(key) != after.get(key):
+            print(f"Warning: {key} differs: {before.get(key)} vs {after.get(key)}")
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    lines, regressions = compare(before, after, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# File: dataset.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Seeded synthetic data for the flight app benchmarks
+
+import random
+from datetime import datetime, timedelta, timezone
+
+"""
+Generates airports, aircraft types, flights and users with filled shopping
+carts with bulk_create. The same seed always produces the same rows, so
+numbers from different commits are comparable.
+"""
+
+CITIES = [
+    ("Boston", "USA"), ("Tokyo", "Japan"), ("Seoul", "South Korea"), ("London", "UK"),
+    ("Paris", "France"), ("Chicago", "USA"), ("Singapore", "Singapore"), ("Sydney", "Australia"),
+    ("Toronto", "Canada"), ("Dubai", "UAE"), ("Frankfurt", "Germany"), ("Madrid", "Spain"),
+    ("Mexico City", "Mexico"), ("Sao Paulo", "Brazil"), ("Mumbai", "India"), ("Bangkok", "Thailand"),
+]
+AMENITIES = ["Wi-Fi", "Power outlets", "In-seat video", "Lie-flat seats", "Free meals", "Lounge access"]
+AIRLINES = ["KE", "NH", "JL", "UA", "DL", "AA", "BA", "AF", "LH", "SQ", "QF", "EK"]
+BASE_TIME = datetime(2030, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 5000
+
+
+def airport_code(n):
+    """
+    Returns a unique three-or-more letter code for the n-th airport.
+    """
+    letters = ""
+    n += 26 * 26  # Start at three letters
+    while n:
+        n, rem = divmod(n, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def create_airports(count, rng):
+    """
+    Bulk-creates `count` airports and returns their ids.
+    """
+    from flights.models import Airport
+
+    airports = []
+    for n in range(count):
+        code = airport_code(n)
+        city, country = CITIES[n % len(CITIES)]
+        if n >= len(CITIES):
+            city = f"{code.title()}ville"  # Real cities have one or two airports, not hundreds
+        airports.append(Airport(
+            code=code,
+            name=f"{city} {code} International",
+            city=city,
+            country=country,
+            amenities=", ".join(rng.sample(AMENITIES, 2)),
+            avg_security_time=timedelta(minutes=rng.randint(5, 45)),
+        ))
+    Airport.objects.bulk_create(airports, batch_size=BATCH_SIZE)
+    return list(Airport.objects.order_by("pk").values_list("pk", flat=True))
+
+
+def create_aircraft(count):
+    """
+    Bulk-creates `count` aircraft types and returns their ids.
+    """
+    from flights.models import AircraftType
+
+    AircraftType.objects.bulk_create(
+        [AircraftType(model=f"Model {n}", seat_capacity=100 + n % 300) for n in range(count)],
+        batch_size=BATCH_SIZE,
+    )
+    return list(AircraftType.objects.order_by("pk").values_list("pk", flat=True))
+
+
+def create_flights(count, airport_ids, aircraft_ids, rng, days=365, prefix=None):
+    """
+    Bulk-creates `count` flights between random airports over `days` days.
+    Flight numbers start with `prefix`, or a rotating airline code when it is None.
+    """
+    from flights.models import Flight
+
+    batch = []
+    for n in range(count):
+        departure, arrival = rng.sample(airport_ids, 2)
+        departs = BASE_TIME + timedelta(minutes=rng.randrange(days * 24 * 60))
+        batch.append(Flight(
+            flight_number=f"{prefix or AIRLINES[n % len(AIRLINES)]}{n}",
+            departure_airport_id=departure,
+            arrival_airport_id=arrival,
+            departure_time=departs,
+            arrival_time=departs + timedelta(minutes=rng.randint(45, 900)),
+            cost=rng.randint(50, 3000),
+            aircraft_id=rng.choice(aircraft_ids),
+            amenities=", ".join(rng.sample(AMENITIES, 2)),
+            seats_left=rng.randint(0, 300),
+        ))
+        if len(batch) >= BATCH_SIZE:
+            Flight.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Flight.objects.bulk_create(batch)
+
+
+def create_carts(count, rng, max_lines=3):
+    """
+    Bulk-creates `count` users, each with a shopping cart holding up to
+    `max_lines` random flights, and returns the number of cart lines.
+    bulk_create skips the signals that maintain cart totals, so the totals
+    are computed here from the flights' costs.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db.models import Max, Min
+    from flights.models import Flight, ShoppingCart, ShoppingCartFlight
+
+    bounds = Flight.objects.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        max_lines = 0
+    password = make_password("benchmark")  # Hashing is slow, so every user shares one hash
+    lines = 0
+    for start in range(0, count, BATCH_SIZE):
+        users = User.objects.bulk_create([
+            User(username=f"bench{n}", password=password)
+            for n in range(start, min(start + BATCH_SIZE, count))
+        ])
+        picks = [
+            [(rng.randint(bounds["low"], bounds["high"]), rng.randint(1, 2)) for _ in range(rng.randint(0, max_lines))]
+            for _ in users
+        ]
+        costs = dict(Flight.objects.filter(
+            pk__in={flight_id for cart_lines in picks for flight_id, _ in cart_lines}
+        ).values_list("pk", "cost"))
+        picks = [[(flight_id, quantity) for flight_id, quantity in cart_lines if flight_id in costs] for cart_lines in picks]
+        carts = ShoppingCart.objects.bulk_create([
+            ShoppingCart(
+                user=user,
+                item_count=sum(quantity for _, quantity in cart_lines),
+                subtotal=sum(quantity * costs[flight_id] for flight_id, quantity in cart_lines),
+            )
+            for user, cart_lines in zip(users, picks)
+        ])
+        cart_flights = [
+            ShoppingCartFlight(cart=cart, flight_id=flight_id, quantity=quantity)
+            for cart, cart_lines in zip(carts, picks)
+            for flight_id, quantity in cart_lines
+        ]
+        ShoppingCartFlight.objects.bulk_create(cart_flights)
+        lines += len(cart_flights)
+    return lines
+
+
+def generate(airports=500, aircraft=50, flights=10000, seed=412, days=365, carts=0):
+    """
+    Generates a catalog, and `carts` users with shopping carts, and returns the row counts.
+    """
+    rng = random.Random(seed)
+    airport_ids = create_airports(airports, rng)
+    aircraft_ids = create_aircraft(aircraft)
+    create_flights(flights, airport_ids, aircraft_ids, rng, days=days)
+    counts = {"airports": airports, "aircraft": aircraft, "flights": flights}
+    if carts:
+        counts["carts"] = carts
+        counts["cart_lines"] = create_carts(carts, rng)
+    return counts
@@ -0,0 +1,138 @@
+# File: harness.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Shared setup and timing helpers for the flight app benchmarks
+
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+"""
+Benchmarks run against a throwaway test database created the same way the
+test runner creates one, so they never touch db.sqlite3. Run them from the
+repository root, for example:
+
+    python -m benchmarks.bench_search --flights 500000
+
+Set DJANGO_SETTINGS_MODULE to benchmark against other settings. Reports
+record the commit they were run on; compare two of them with
+`python -m benchmarks.compare old.json new.json`.
+"""
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """
+    Configures Django for a standalone benchmark script.
+    """
+    import django
+
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cs412.settings")
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(test_name=None):
+    """
+    Creates a migrated test database for the duration of the block and destroys it afterwards.
+    `test_name` overrides the test database name, e.g. to give multithreaded
+    benchmarks an SQLite file instead of the shared in-memory database.
+    """
+    from django.db import connection
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if test_name:
+        connection.settings_dict["TEST"]["NAME"] = test_name
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def percentile(values, pct):
+    """
+    Returns the pct-th percentile of values using the nearest-rank method.
+    """
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def measure(fn, repeat=50, warmup=3):
+    """
+    Calls fn repeatedly and returns latency statistics in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def profile(fn):
+    """
+    Calls fn once and returns the number of database queries it ran and the
+    peak memory it allocated in KiB. Tracing memory slows Python down, so
+    this is kept apart from measure().
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"queries": len(queries), "peak_kb": round(peak / 1024, 1)}
+
+
+def git_revision():
+    """
+    Returns the checked-out commit, with a "-dirty" suffix when the tree has
+    uncommitted changes, or None outside a git checkout.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def write_report(report, path=None):
+    """
+    Prints the report as JSON, and also writes it to `path` when one is given.
+    The report is stamped with the current commit unless it already names one.
+    """
+    report.setdefault("commit", git_revision())
+    text = json.dumps(report, indent=2, sort_keys=True, default=str)
+    print(text)
+    if path:
+        Path(path).write_text(text + "\n")
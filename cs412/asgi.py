@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cs412.settings")
+os.environ.setdefault("FLIGHTS_ASYNC_VIEWS", "1")  # Serve the async checkout and import views
 
 application = get_asgi_application()
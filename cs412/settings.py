@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "flights.metrics.RequestMetricsMiddleware",  # First, so its timings cover the other middleware
+    "flights.databases.ReplicaRoutingMiddleware",  # Picks the database read-only requests read from
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -62,7 +65,7 @@ ROOT_URLCONF = "cs412.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "flights.metrics.TimedDjangoTemplates",  # DjangoTemplates, with render times for the metrics
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -74,6 +77,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "flights.context_processors.cart_summary",
             ],
         },
     },
@@ -89,7 +93,120 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    # Local read replica, filled from db.sqlite3 by `python manage.py sync_replicas`.
+    # Only read once listed in FLIGHTS_DATABASES["REPLICAS"].
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_replica.sqlite3",
+    },
+}
+
+# Writes go to the primary, read-only requests to a replica (see flights/databases.py)
+DATABASE_ROUTERS = ["flights.databases.PrimaryReplicaRouter"]
+
+FLIGHTS_DATABASES = {
+    "PRIMARY": "default",
+    "REPLICAS": [],  # e.g. ["replica"]; run sync_replicas first
+    "STICKY_SECONDS": 15,  # Users read the primary this long after writing
+    "SQLITE_PRAGMAS": {"journal_mode": "wal", "busy_timeout": 5000, "synchronous": "normal"},
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # SerpAPI responses. Switch to FileBasedCache or DatabaseCache to share
+    # them between gunicorn workers.
+    "serpapi": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "serpapi",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+
+# Google Flights response cache used by the flights app
+FLIGHTS_SERPAPI_CACHE = {
+    "ALIAS": "serpapi",
+    "TTL": 15 * 60,  # Seconds
+    "MAX_ENTRIES": 512,  # Responses tracked per process before LRU eviction
+}
+
+
+# SerpAPI (Google Flights) client used by the flights app
+SERPAPI_API_KEY = os.environ.get(
+    "SERPAPI_API_KEY",
+    "d764904413d0f85fcb35954a94356a3cb2c27e21726f437941bcdbfdeb166d3d",
+)
+FLIGHTS_SERPAPI_CLIENT = {
+    "ENDPOINT": "https://serpapi.com/search.json",
+    "POOL_SIZE": 10,  # Keep-alive connections per host
+    "CONNECT_TIMEOUT": 3.05,  # Seconds
+    "READ_TIMEOUT": 20,  # Seconds
+    "RETRIES": 3,  # Retries on connection errors, 429 and 5xx
+    "BACKOFF_FACTOR": 0.5,  # Exponential backoff base in seconds
+    "BACKOFF_JITTER": 0.25,  # Random extra backoff in seconds
+    "ASYNC_POOL_SIZE": 100,  # Connections per event loop for the async views
+    "ASYNC_POOLS": 10,  # httpx clients sharing those connections
+}
+
+# Serve the async checkout and import views (see flights/views.py). cs412/asgi.py
+# turns this on, since async views only pay off under an ASGI server.
+FLIGHTS_ASYNC_VIEWS = os.environ.get("FLIGHTS_ASYNC_VIEWS") == "1"
+
+# Flight list pagination: "offset" (numbered pages) or "keyset" (cursor
+# pages that stay fast however deep they go)
+FLIGHTS_LIST_PAGINATION = "offset"
+
+# Departure and arrival boards on the airport pages
+FLIGHTS_AIRPORT_BOARDS = {
+    "CACHE_ALIAS": "default",
+    "WINDOW_HOURS": 24,  # Default window length
+    "MAX_WINDOW_HOURS": 72,
+    "PAGE_SIZE": 20,  # Flights per board page
+    "BUCKET_MINUTES": 15,  # Window starts are rounded down to this for caching
+}
+
+# In-memory flight network used by the connecting flight search
+FLIGHTS_ITINERARY_GRAPH = {
+    "MAX_AGE": 15 * 60,  # Seconds before a full rebuild from the database
+    "MAX_PENDING": 50000,  # Changed flights beyond which a full rebuild is used
+}
+
+# Cached flight cards and board rows (see flights/fragments.py)
+FLIGHTS_FRAGMENT_CACHE = {
+    "CACHE_ALIAS": "default",  # Django cache alias holding the fragments
+    "TIMEOUT": 60 * 60,  # Seconds a fragment is kept
+}
+
+# Request timings, Server-Timing header and /flights/metrics (see flights/metrics.py)
+FLIGHTS_METRICS = {
+    "ENABLED": True,
+    "SERVER_TIMING": True,
+    # Scraper addresses allowed besides staff users, matched against REMOTE_ADDR. Behind
+    # a reverse proxy every client arrives from the proxy, so never list loopback there.
+    "ALLOWED_IPS": (),
+}
+
+# Cached airport list and <option> tags for dropdowns (see flights/airport_catalog.py)
+FLIGHTS_AIRPORT_CATALOG = {
+    "CACHE_ALIAS": "default",  # Django cache alias holding the catalog
+    "TIMEOUT": 24 * 60 * 60,  # Seconds a catalog is kept
+}
+
+# Seats held when a flight is added to a cart, released by `release_expired_holds`
+FLIGHTS_SEAT_HOLDS = {
+    "HOLD_MINUTES": 15,  # How long added seats stay held
+    "SWEEP_BATCH_SIZE": 1000,  # Expired holds released per transaction
+}
+
+# Background flight imports run by `process_import_jobs` (see flights/import_jobs.py)
+FLIGHTS_IMPORT_JOBS = {
+    "STALE_MINUTES": 15,  # Running jobs claimed longer ago than this are failed
 }
 
 
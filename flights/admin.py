@@ -6,7 +6,9 @@ from .models import *
 admin.site.register(Airport)
 admin.site.register(AircraftType)
 admin.site.register(Flight)
+admin.site.register(FlightArchive)
 admin.site.register(AirplaneRental)
 admin.site.register(ShoppingCart)
 admin.site.register(ShoppingCartFlight)
 admin.site.register(ShoppingCartRental)
+admin.site.register(ImportJob)
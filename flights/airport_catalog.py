@@ -0,0 +1,117 @@
+# File: airport_catalog.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Cached list of airports for filter dropdowns and forms
+
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from .databases import primary_database
+from .models import Airport
+
+"""
+Every airport dropdown (flight list filters, import form, itinerary search,
+flight update form) needs the same (id, code, name) list, and the flight
+list renders it twice. The catalog reads that list once, renders the
+<option> tags once, and caches both under a catalog version:
+
+    airport-catalog:v<version>
+
+Saving, deleting or ingesting an airport bumps the version (see
+flights/signals.py). Each process also keeps the catalog it last loaded,
+so a request that finds the version unchanged costs one small cache read
+and no unpickling of the option HTML. Marking the selected airport is a
+string replace on the cached HTML, not a re-render.
+"""
+
+DEFAULT_CONFIG = {
+    "CACHE_ALIAS": "default",  # Django cache alias holding the catalog
+    "TIMEOUT": 24 * 60 * 60,  # Seconds a catalog is kept, even if no airport changes
+}
+VERSION_KEY = "airport-catalog-version"
+
+_loaded = (None, None)  # (version, AirportCatalog) last loaded by this process
+
+
+def catalog_config():
+    """
+    Returns the airport catalog settings merged over the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_AIRPORT_CATALOG", {})}
+
+
+class AirportCatalog:
+    """
+    The (id, code, name) of every airport, in name order, with the <option>
+    tags of a dropdown keyed on airport id and on airport code.
+    """
+
+    def __init__(self, airports):
+        self.airports = airports
+        self.option_html = {
+            'id': format_html_join('\n', '<option value="{}">{} ({})</option>', (
+                (airport_id, name, code) for airport_id, code, name in airports
+            )),
+            'code': format_html_join('\n', '<option value="{}">{} ({})</option>', (
+                (code, name, code) for _, code, name in airports
+            )),
+        }
+
+    def __len__(self):
+        return len(self.airports)
+
+    def options(self, selected=None, value='id'):
+        """
+        Returns the <option> tags with the airport whose id (or code, with
+        value='code') equals `selected` marked as selected.
+        """
+        html = self.option_html[value]
+        if selected not in (None, ''):
+            tag = format_html('<option value="{}">', selected)
+            html = html.replace(tag, f'{tag[:-1]} selected>', 1)
+        return mark_safe(html)
+
+    def choices(self):
+        """
+        Returns (id, "name (code)") pairs for a form's ChoiceField.
+        """
+        return [(airport_id, f"{name} ({code})") for airport_id, code, name in self.airports]
+
+
+def get_airport_catalog():
+    """
+    Returns the current AirportCatalog, from this process, the cache or the database.
+    """
+    global _loaded
+    config = catalog_config()
+    cache = caches[config["CACHE_ALIAS"]]
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock, so a version lost to eviction never reuses an old number
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY, 0)
+
+    loaded_version, catalog = _loaded
+    if loaded_version == version:
+        return catalog
+
+    key = f"airport-catalog:v{version}"
+    catalog = cache.get(key)
+    if catalog is None:
+        # From the primary, which the version bump is sure to be behind (see flights/databases.py)
+        airports = Airport.objects.using(primary_database()).order_by('name', 'pk').values_list('pk', 'code', 'name')
+        catalog = AirportCatalog(list(airports))
+        cache.set(key, catalog, config["TIMEOUT"])
+    _loaded = (version, catalog)
+    return catalog
+
+
+def invalidate_airport_catalog():
+    """
+    Retires the cached catalog after airports are added, changed or removed.
+    """
+    try:
+        caches[catalog_config()["CACHE_ALIAS"]].incr(VERSION_KEY)
+    except ValueError:  # No version yet, so nothing is cached under one either
+        pass
@@ -1,6 +1,27 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def reinstall_search_index(sender, using, **kwargs):
+    """
+    Recreates the full-text search triggers after migrate, since SQLite
+    table rebuilds drop the triggers attached to the rebuilt table.
+    """
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .search import install_search_index
+
+    applied = MigrationRecorder(connections[using]).applied_migrations()
+    if ("flights", "0008_flight_search_index") in applied:
+        install_search_index(connections[using])
 
 
 class FlightsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "flights"
+
+    def ready(self):
+        from . import signals  # noqa: F401 Connects the catalog change receivers
+        from . import databases  # noqa: F401 Connects the SQLite connection settings
+        from . import metrics  # noqa: F401 Connects the query timing wrapper
+        post_migrate.connect(reinstall_search_index, sender=self)
@@ -0,0 +1,136 @@
+# File: archive.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Moves departed flights out of the live flights table
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, Value
+from .conditional import bump_catalog_version
+from .fares import refresh_route_days, route_day
+from .models import Flight, FlightArchive, SeatHold, ShoppingCartFlight
+from .signals import flights_ingested
+
+"""
+Flights are never removed after they depart, so without archiving the
+flight list, the airport boards and the admin read a table that is mostly
+past flights. `python manage.py archive_flights --before <date>` moves the
+flights departing before a cutoff into FlightArchive, oldest first, a batch
+per transaction:
+
+  1. the batch's rows are copied to FlightArchive under the same ids,
+  2. cart lines holding them are pointed at the archive rows, so past carts
+     keep their flights and totals,
+  3. their seat holds are dropped (there is nothing left to hold seats for)
+     and the flights are deleted with one DELETE,
+  4. the fare calendar days they were on are recomputed, the catalog
+     version is bumped and, once committed, the caches of the catalog are
+     told through flights_ingested, as after an import.
+
+Every batch commits on its own, so an interrupted run keeps what it moved
+and the next run carries on from the oldest flight still left. Flight ids
+are never reused by the database, so an archived id cannot clash with a
+live one.
+
+Pages read the live table only. The flight list unions the archive in when
+asked to with ?history=1, through history_rows() and load_history_page().
+"""
+
+BATCH_SIZE = 1000  # Flights moved per transaction
+
+# Flight columns copied to FlightArchive
+ARCHIVED_FIELDS = [
+    'id', 'flight_number', 'departure_airport_id', 'arrival_airport_id', 'departure_time', 'arrival_time',
+    'cost', 'aircraft_id', 'amenities', 'seats_left', 'source_hash', 'updated_at',
+]
+
+# Columns of the flight list's history union; order by any of them but 'archived'
+HISTORY_COLUMNS = ('id', 'departure_time', 'cost', 'archived')
+
+
+def archive_batch(before, batch_size=BATCH_SIZE):
+    """
+    Moves up to `batch_size` of the oldest flights departing before `before`
+    into FlightArchive in one transaction. Returns the number moved.
+    """
+    with transaction.atomic():
+        rows = list(
+            Flight.objects.select_for_update()
+            .filter(departure_time__lt=before)
+            .order_by('departure_time', 'id')
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        flight_ids = [row['id'] for row in rows]
+
+        FlightArchive.objects.bulk_create([FlightArchive(**row) for row in rows], batch_size=batch_size)
+        ShoppingCartFlight.objects.filter(flight_id__in=flight_ids).update(
+            archived_flight_id=F('flight_id'), flight=None,
+        )
+        SeatHold.objects.filter(flight_id__in=flight_ids).delete()
+
+        # Deleting through the ORM would load every flight to send its delete signals;
+        # what those receivers do for a batch follows below
+        with connection.cursor() as cursor:
+            placeholders = ", ".join(["%s"] * len(flight_ids))
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(Flight._meta.db_table)} WHERE id IN ({placeholders})",
+                flight_ids,
+            )
+
+        refresh_route_days(
+            route_day(row['departure_airport_id'], row['arrival_airport_id'], row['departure_time']) for row in rows
+        )
+        bump_catalog_version()
+        route_airport_ids = sorted(
+            {row['departure_airport_id'] for row in rows} | {row['arrival_airport_id'] for row in rows}
+        )
+        transaction.on_commit(lambda: flights_ingested.send(
+            sender=Flight, flight_ids=flight_ids, airport_ids=[], route_airport_ids=route_airport_ids,
+        ))
+    return len(rows)
+
+
+def archive_flights(before, batch_size=BATCH_SIZE, progress=None):
+    """
+    Moves every flight departing before `before` into FlightArchive, `batch_size`
+    flights per transaction, calling `progress(moved so far)` after each batch.
+    Returns the number of flights moved.
+    """
+    moved = 0
+    while True:
+        count = archive_batch(before, batch_size)
+        moved += count
+        if count and progress:
+            progress(moved)
+        if count < batch_size:
+            return moved
+
+
+def history_rows(live, archived):
+    """
+    Returns the union of a Flight and a FlightArchive queryset as
+    HISTORY_COLUMNS rows, for the flight list to order and paginate.
+    """
+    def rows(queryset, flag):
+        return queryset.annotate(archived=Value(flag, BooleanField())).values_list(*HISTORY_COLUMNS)
+
+    return rows(live.order_by(), False).union(rows(archived.order_by(), True), all=True)
+
+
+def load_history_page(rows):
+    """
+    Returns the flights and archived flights of a page of history_rows(), in
+    order, with their airports, in at most two queries.
+    """
+    rows = list(rows)
+    live_ids = [row[0] for row in rows if not row[-1]]
+    archived_ids = [row[0] for row in rows if row[-1]]
+    live = Flight.objects.select_related('departure_airport', 'arrival_airport').in_bulk(live_ids) if live_ids else {}
+    archived = (
+        FlightArchive.objects.select_related('departure_airport', 'arrival_airport').in_bulk(archived_ids)
+        if archived_ids else {}
+    )
+    return [
+        (archived if row[-1] else live)[row[0]]
+        for row in rows if row[0] in (archived if row[-1] else live)
+    ]
@@ -0,0 +1,152 @@
+# File: boards.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Cached, time-windowed departure and arrival boards for airports
+
+import math
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from .databases import primary_database
+from .models import Flight
+
+"""
+An airport page used to list every flight that ever touched the airport.
+Boards instead show the flights departing (or arriving) in a time window,
+by default the next 24 hours, one page at a time, with both airports loaded
+in the same query.
+
+Each board page is cached under the airport, the window and a time bucket:
+the window start is rounded down to BUCKET_MINUTES, so everyone looking at
+an airport in the same bucket shares the entry. Every airport also has a
+version number in the cache that is part of the key. Saving, deleting or
+ingesting a flight bumps the version of the airports at both ends (see
+flights/signals.py), which retires their cached pages at once.
+"""
+
+DEFAULT_CONFIG = {
+    "CACHE_ALIAS": "default",  # Django cache alias holding board pages
+    "WINDOW_HOURS": 24,  # Default window length
+    "MAX_WINDOW_HOURS": 72,  # Longest window a visitor can ask for
+    "PAGE_SIZE": 20,  # Flights per board page
+    "BUCKET_MINUTES": 15,  # Window starts are rounded down to this, and pages cached for two buckets
+}
+BOARD_KINDS = {
+    # Board -> (airport field, time field)
+    'departures': ('departure_airport', 'departure_time'),
+    'arrivals': ('arrival_airport', 'arrival_time'),
+}
+
+
+def board_config():
+    """
+    Returns the board settings merged over the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_AIRPORT_BOARDS", {})}
+
+
+class BoardPage:
+    """
+    One page of a board, with the parts of Django's Page API the templates use.
+    """
+
+    def __init__(self, object_list, number, count, page_size, window_start, window_end):
+        self.object_list = object_list
+        self.number = number
+        self.count = count
+        self.num_pages = max(1, math.ceil(count / page_size))
+        self.window_start = window_start
+        self.window_end = window_end
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.number < self.num_pages
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def window_start_for(start=None):
+    """
+    Rounds `start` (default: now) down to the start of its cache bucket.
+    """
+    start = start or datetime.now(dt_timezone.utc)
+    bucket = board_config()["BUCKET_MINUTES"] * 60
+    return datetime.fromtimestamp(int(start.timestamp()) // bucket * bucket, tz=dt_timezone.utc)
+
+
+def get_board(airport_id, kind, page=1, start=None, hours=None):
+    """
+    Returns a BoardPage of the flights departing from ('departures') or arriving at
+    ('arrivals') an airport within `hours` of `start`, in time order.
+    Pages past the end are clamped to the last page.
+    """
+    config = board_config()
+    hours = min(max(1, hours or config["WINDOW_HOURS"]), config["MAX_WINDOW_HOURS"])
+    window_start = window_start_for(start)
+    latest = datetime.max.replace(tzinfo=dt_timezone.utc)
+    # Windows starting on the last representable day end with it
+    window_end = window_start + timedelta(hours=hours) if latest - window_start > timedelta(hours=hours) else latest
+    page_size = config["PAGE_SIZE"]
+    page = max(1, page)
+
+    cache = caches[config["CACHE_ALIAS"]]
+    key = (
+        f"board:{airport_id}:v{board_version(airport_id, cache)}:{kind}:"
+        f"{int(window_start.timestamp())}:{hours}:{page}"
+    )
+    cached = cache.get(key)
+    if cached is None:
+        airport_field, time_field = BOARD_KINDS[kind]
+        # From the primary, which the version bump is sure to be behind (see flights/databases.py)
+        flights = Flight.objects.using(primary_database()).filter(**{
+            airport_field: airport_id, f'{time_field}__gte': window_start, f'{time_field}__lt': window_end,
+        })
+        count = flights.count()
+        page = min(page, max(1, math.ceil(count / page_size)))
+        rows = list(
+            flights.select_related('departure_airport', 'arrival_airport')
+            .order_by(time_field, 'id')[(page - 1) * page_size:page * page_size]
+        )
+        cached = {"page": page, "count": count, "flights": rows}
+        cache.set(key, cached, config["BUCKET_MINUTES"] * 60 * 2)
+    return BoardPage(cached["flights"], cached["page"], cached["count"], page_size, window_start, window_end)
+
+
+def board_version(airport_id, cache=None):
+    """
+    Returns the current cache version of an airport's boards.
+    """
+    cache = cache or caches[board_config()["CACHE_ALIAS"]]
+    key = f"board-version:{airport_id}"
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock, so a version lost to eviction never reuses an old number
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def invalidate_boards(airport_ids):
+    """
+    Retires every cached board page of the given airports.
+    """
+    cache = caches[board_config()["CACHE_ALIAS"]]
+    for airport_id in set(airport_ids):
+        if airport_id is None:
+            continue
+        try:
+            cache.incr(f"board-version:{airport_id}")
+        except ValueError:  # No version yet, so nothing is cached under one either
+            pass
@@ -0,0 +1,133 @@
+# File: cart_totals.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Incrementally maintained shopping cart totals
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import ShoppingCart, ShoppingCartFlight, ShoppingCartRental
+
+"""
+ShoppingCart.item_count and ShoppingCart.subtotal are kept up to date as
+cart lines are added, changed and removed and as flight and rental prices
+change, so showing a cart total is a single-row read. A flight line counts
+`quantity` tickets at the flight's cost, a rental line one item at the
+rental cost times `rental_days`. Lines of archived flights keep counting
+at the flight's last cost, read from FlightArchive.
+
+Every change is applied as an F() expression in a single UPDATE, so
+concurrent changes to the same cart add up instead of overwriting each
+other. The line and price signals live in flights/signals.py, and the
+ingest engine reprices carts itself since its bulk upsert skips signals.
+`python manage.py reconcile_cart_totals` recomputes the totals from the
+lines to report and repair any drift.
+"""
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+# Cost of a cart line's flight, live or archived
+LINE_FLIGHT_COST = Coalesce('flight__cost', 'archived_flight__cost')
+
+
+def adjust_cart(cart_id, items=0, amount=0):
+    """
+    Adds `items` and `amount` (either may be negative) to a cart's totals.
+    """
+    if items or amount:
+        ShoppingCart.objects.filter(pk=cart_id).update(
+            item_count=F('item_count') + items,
+            subtotal=F('subtotal') + amount,
+        )
+
+
+def reprice_flights(cost_changes):
+    """
+    Applies flight price changes, {flight id: cost difference}, to every cart holding those flights.
+    """
+    cost_changes = {flight_id: delta for flight_id, delta in cost_changes.items() if delta}
+    if not cost_changes:
+        return
+    in_carts = ShoppingCartFlight.objects.filter(flight_id__in=cost_changes).values_list('flight_id', flat=True)
+    for flight_id in set(in_carts):
+        _reprice(ShoppingCartFlight, 'flight_id', flight_id, 'quantity', cost_changes[flight_id])
+
+
+def reprice_rental(rental_id, delta):
+    """
+    Applies a rental price change to every cart holding the rental.
+    """
+    if delta:
+        _reprice(ShoppingCartRental, 'rental_id', rental_id, 'rental_days', delta)
+
+
+def _reprice(line_model, field, value, units, delta):
+    """
+    Adds delta x the units (tickets or rental days) each cart holds of one flight or rental,
+    as one UPDATE over the affected carts.
+    """
+    lines = line_model.objects.filter(**{field: value})
+    units_per_cart = (
+        lines.filter(cart=OuterRef('pk')).order_by().values('cart')
+        .annotate(total=Sum(units)).values('total')
+    )
+    ShoppingCart.objects.filter(pk__in=lines.values('cart')).update(
+        subtotal=F('subtotal') + ExpressionWrapper(Subquery(units_per_cart) * Value(delta, MONEY), MONEY)
+    )
+
+
+def compute_totals(cart_ids=None):
+    """
+    Recomputes {cart id: (item_count, subtotal)} from the cart lines, for every
+    cart or only `cart_ids`. Carts without lines are left out.
+    """
+    flights = ShoppingCartFlight.objects.values('cart').annotate(
+        items=Sum('quantity'), amount=Sum(ExpressionWrapper(F('quantity') * LINE_FLIGHT_COST, MONEY)),
+    )
+    rentals = ShoppingCartRental.objects.values('cart').annotate(
+        items=Count('id'), amount=Sum(ExpressionWrapper(F('rental_days') * F('rental__rental_cost'), MONEY)),
+    )
+    if cart_ids is not None:
+        flights = flights.filter(cart__in=cart_ids)
+        rentals = rentals.filter(cart__in=cart_ids)
+
+    totals = defaultdict(lambda: (0, Decimal('0')))
+    for row in list(flights.order_by()) + list(rentals.order_by()):
+        items, amount = totals[row['cart']]
+        totals[row['cart']] = (items + row['items'], amount + row['amount'])
+    return dict(totals)
+
+
+def find_drift(batch_size=1000):
+    """
+    Yields (cart id, stored totals, expected totals) for every cart whose stored
+    totals do not match its lines, checking `batch_size` carts at a time.
+    """
+    last_id = 0
+    while True:
+        carts = list(
+            ShoppingCart.objects.filter(pk__gt=last_id).order_by('pk')
+            .values_list('pk', 'item_count', 'subtotal')[:batch_size]
+        )
+        if not carts:
+            return
+        expected = compute_totals([cart_id for cart_id, _, _ in carts])
+        for cart_id, item_count, subtotal in carts:
+            totals = expected.get(cart_id, (0, Decimal('0')))
+            if (item_count, subtotal) != totals:
+                yield cart_id, (item_count, subtotal), totals
+        last_id = carts[-1][0]
+
+
+def repair_cart(cart_id):
+    """
+    Recomputes a cart's totals from its lines and stores them. The cart row is
+    locked first, so a line change racing the repair is applied on top of it.
+    Returns the new (item_count, subtotal).
+    """
+    with transaction.atomic():
+        list(ShoppingCart.objects.select_for_update().filter(pk=cart_id).values_list('pk'))
+        totals = compute_totals([cart_id]).get(cart_id, (0, Decimal('0')))
+        ShoppingCart.objects.filter(pk=cart_id).update(item_count=totals[0], subtotal=totals[1])
+    return totals
@@ -0,0 +1,129 @@
+# File: conditional.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: ETags and Last-Modified dates for conditional GETs of catalog pages
+
+import hashlib
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import F
+from django.utils import timezone
+from .boards import window_start_for
+from .context_processors import get_cart_summary
+from .models import CatalogVersion, Flight
+
+"""
+Flight and airport pages answer conditional GETs (If-None-Match and
+If-Modified-Since) with 304 Not Modified when nothing they show has changed,
+through Django's condition() decorator, which checks the validators before
+the view runs, so a repeat visit never renders a template.
+
+A flight page depends on the flight and its two airports, whose updated_at
+columns are read in one primary key lookup. List pages and airport pages
+(whose boards also move with the clock, one BUCKET_MINUTES step at a time)
+depend on the whole catalog, tracked by the single CatalogVersion row that
+every flight and airport change bumps in the same transaction (see
+flights/signals.py and flights/ingest.py). ETags also cover the query
+string and, for logged-in users, the user, their CSRF cookie and their
+cart totals, which the navigation bar and forms show. Pages with a pending
+flash message are never answered with a 304. Last-Modified is only sent to
+anonymous visitors, since a date cannot capture a changed cart.
+"""
+
+
+def bump_catalog_version():
+    """
+    Marks the catalog as changed. Call inside the transaction that changes it.
+    """
+    updated = CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def catalog_version(request):
+    """
+    Returns (version, updated_at) of the catalog, read once per request.
+    """
+    if not hasattr(request, '_catalog_version'):
+        request._catalog_version = (
+            CatalogVersion.objects.filter(pk=1).values_list('version', 'updated_at').first() or (0, None)
+        )
+    return request._catalog_version
+
+
+def flight_versions(request, pk):
+    """
+    Returns the updated_at of a flight and of both its airports, read once per
+    request, or None when there is no such flight.
+    """
+    if not hasattr(request, '_flight_versions'):
+        request._flight_versions = Flight.objects.filter(pk=pk).values_list(
+            'updated_at', 'departure_airport__updated_at', 'arrival_airport__updated_at'
+        ).first()
+    return request._flight_versions
+
+
+def make_etag(request, *parts):
+    """
+    Returns an ETag over `parts`, the query string and what the page shows of
+    the visitor, or None (no conditional GET) when a flash message is pending.
+    """
+    if len(get_messages(request)):
+        return None
+    viewer = ['anonymous']
+    if request.user.is_authenticated:
+        cart = get_cart_summary(request)
+        viewer = [
+            request.user.pk,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            (cart.item_count, cart.subtotal) if cart else None,
+        ]
+    key = repr((parts, sorted(request.GET.lists()), viewer))
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag of a page showing catalog-wide data.
+    """
+    return make_etag(request, request.path, catalog_version(request)[0])
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    """
+    Last-Modified of a page showing catalog-wide data, for anonymous visitors.
+    """
+    if request.user.is_authenticated:
+        return None
+    return catalog_version(request)[1]
+
+
+def airport_etag(request, *args, **kwargs):
+    """
+    ETag of an airport page: the catalog and the current board time bucket.
+    """
+    return make_etag(request, request.path, catalog_version(request)[0], window_start_for().timestamp())
+
+
+def fare_calendar_etag(request, *args, **kwargs):
+    """
+    ETag of the fare calendar: the catalog and the current month, shown when no month is chosen.
+    """
+    return make_etag(request, request.path, catalog_version(request)[0], timezone.localdate().strftime('%Y-%m'))
+
+
+def flight_etag(request, pk, *args, **kwargs):
+    """
+    ETag of a flight page.
+    """
+    versions = flight_versions(request, pk)
+    return make_etag(request, request.path, versions) if versions else None
+
+
+def flight_last_modified(request, pk, *args, **kwargs):
+    """
+    Last-Modified of a flight page, for anonymous visitors.
+    """
+    versions = flight_versions(request, pk)
+    if request.user.is_authenticated or not versions:
+        return None
+    return max(versions)
@@ -0,0 +1,35 @@
+# File: context_processors.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Template context shared by every flight app page
+
+from django.utils.functional import SimpleLazyObject
+from .models import ShoppingCart
+
+"""
+The navigation bar shows the size and total of the user's shopping cart.
+Both are stored on the cart row (see flights/cart_totals.py), so this is a
+single-row read, made at most once per request and only if a template
+actually uses it. Views that need to know whether the user has a cart call
+get_cart_summary() and share the same row.
+"""
+
+
+def get_cart_summary(request):
+    """
+    Returns the user's ShoppingCart with only its totals loaded, or None for
+    anonymous users and users without a cart. Cached on the request.
+    """
+    if not hasattr(request, '_cart_summary'):
+        request._cart_summary = None
+        if request.user.is_authenticated:
+            request._cart_summary = (
+                ShoppingCart.objects.filter(user=request.user).only('id', 'item_count', 'subtotal').first()
+            )
+    return request._cart_summary
+
+
+def cart_summary(request):
+    """
+    Adds `cart_summary`, the lazily loaded cart totals, to every template context.
+    """
+    return {'cart_summary': SimpleLazyObject(lambda: get_cart_summary(request))}
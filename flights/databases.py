@@ -0,0 +1,204 @@
+# File: databases.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Primary/replica database routing and SQLite connection settings
+
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+"""
+Read-only requests (GET, HEAD, OPTIONS) read from one of the replica
+aliases in FLIGHTS_DATABASES["REPLICAS"], picked per request, so browsing
+does not queue behind import writes on the primary. Everything else reads
+and writes the primary: other request methods, management commands and
+workers, reads inside a transaction, and every read after the request has
+written anything. Views that must see the latest rows set
+`use_primary_database = True`.
+
+A request that writes sets a short-lived cookie, and requests carrying it
+read from the primary too, so users see their own cart changes and new
+sessions right away (sticky-after-write). Replicas must stay less than
+STICKY_SECONDS behind the primary.
+
+Shared caches are always filled from the primary. They are invalidated when
+a write commits there, and an entry rebuilt from a replica that has not
+caught up yet would keep the old rows under the new version until it
+expires. So the airport catalog and the boards read the primary on a miss,
+and fragments rendered from replica rows are rendered again from the
+primary before they are cached.
+
+With no replicas configured, every query goes to the primary. For a local
+setup, point a replica alias at a second SQLite file and copy the primary
+into it with `python manage.py sync_replicas --interval 2`; other databases
+keep their replicas in sync with their own replication.
+
+Every new SQLite connection also gets the PRAGMAs in SQLITE_PRAGMAS: WAL
+journaling lets readers carry on while a writer holds the lock, and
+busy_timeout makes writers wait for each other instead of failing with
+"database is locked".
+"""
+
+DEFAULT_CONFIG = {
+    "PRIMARY": "default",  # Alias that takes every write
+    "REPLICAS": [],  # Aliases read by read-only requests; empty reads the primary
+    "STICKY_SECONDS": 15,  # How long a user reads the primary after writing
+    "STICKY_COOKIE": "flights_primary",  # Cookie marking those users
+    "SQLITE_PRAGMAS": {
+        "journal_mode": "wal",
+        "busy_timeout": 5000,  # Milliseconds
+        "synchronous": "normal",  # Safe with WAL, and much faster than "full"
+    },
+}
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_routing = ContextVar("flights_database_routing", default=None)
+
+
+def database_config():
+    """
+    Returns the routing configuration, with FLIGHTS_DATABASES overriding the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_DATABASES", {})}
+
+
+def primary_database():
+    """
+    Returns the alias of the primary database, which shared caches are filled from.
+    """
+    return database_config()["PRIMARY"]
+
+
+class RequestRouting:
+    """
+    Where the current request reads from, and whether it has written.
+    """
+
+    def __init__(self, replica):
+        self.replica = replica  # None reads the primary
+        self.wrote = False
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending writes to the primary and the reads of read-only
+    requests to the replica chosen by ReplicaRoutingMiddleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        config = database_config()
+        routing = _routing.get()
+        if routing is None or routing.replica is None or connections[config["PRIMARY"]].in_atomic_block:
+            return config["PRIMARY"]
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            # Read what was just written from the primary for the rest of the request
+            routing.wrote = True
+            routing.replica = None
+        return database_config()["PRIMARY"]
+
+    def allow_relation(self, obj1, obj2, **hints):
+        config = database_config()
+        aliases = {config["PRIMARY"], *config["REPLICAS"]}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True  # Replicas hold the same rows as the primary
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Chooses the database the request reads from and sets the sticky-after-write
+    cookie on responses to requests that wrote.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = self.start(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(response, routing)
+
+    async def __acall__(self, request):
+        routing = self.start(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(response, routing)
+
+    def start(self, request):
+        """
+        Returns the routing of a new request: a random replica for read-only
+        requests from users who have not just written, otherwise the primary.
+        """
+        config = database_config()
+        replica = None
+        if config["REPLICAS"] and request.method in SAFE_METHODS and config["STICKY_COOKIE"] not in request.COOKIES:
+            replica = random.choice(config["REPLICAS"])
+        return RequestRouting(replica)
+
+    def finish(self, response, routing):
+        """
+        Sets the sticky-after-write cookie when the request wrote.
+        """
+        config = database_config()
+        if routing.wrote and config["REPLICAS"]:
+            response.set_cookie(
+                config["STICKY_COOKIE"], "1", max_age=config["STICKY_SECONDS"], httponly=True, samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Sends views marked with use_primary_database = True to the primary.
+        """
+        view_class = getattr(view_func, "view_class", None)
+        if getattr(view_class, "use_primary_database", False):
+            _routing.get().replica = None
+
+
+def sync_replica(alias, primary=None):
+    """
+    Copies the primary SQLite database into the replica `alias` with SQLite's
+    online backup API, which lets the primary keep serving while it copies.
+    """
+    source = connections[primary or database_config()["PRIMARY"]]
+    target = connections[alias]
+    if source.vendor != "sqlite" or target.vendor != "sqlite":
+        raise ImproperlyConfigured("Only SQLite replicas can be synced; use the database's own replication.")
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Applies SQLITE_PRAGMAS to every new SQLite connection.
+    """
+    if connection.vendor != "sqlite":
+        return
+    # On the raw connection, so the PRAGMAs are not counted as the request's queries
+    for name, value in database_config()["SQLITE_PRAGMAS"].items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,99 @@
+# File: export.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Machine-readable flight rows for the JSON API and the NDJSON/CSV exports
+
+import csv
+import json
+
+"""
+The JSON API and the exports share one row format: a flat dict per flight
+with airports as codes and the aircraft as its model name. Rows are read
+with queryset.values(), so the airports and aircraft come from joins in
+the same query and no model instances are built.
+
+Exports stream: flight_rows() reads the queryset with
+.iterator(chunk_size=...), which fetches a chunk of rows at a time (with a
+server-side cursor on PostgreSQL), and the line generators below hand the
+response one batch of encoded rows at a time. Memory stays flat however
+many flights are exported.
+"""
+
+# Output field -> values() lookup
+ROW_FIELDS = {
+    'id': 'id',
+    'flight_number': 'flight_number',
+    'departure_airport': 'departure_airport__code',
+    'arrival_airport': 'arrival_airport__code',
+    'departure_time': 'departure_time',
+    'arrival_time': 'arrival_time',
+    'cost': 'cost',
+    'aircraft': 'aircraft__model',
+    'amenities': 'amenities',
+    'seats_left': 'seats_left',
+}
+LINES_PER_CHUNK = 500  # Encoded rows handed to the response at a time
+
+
+def flight_values(queryset):
+    """
+    Returns the queryset as values() dicts with the ROW_FIELDS lookups.
+    """
+    return queryset.values(*ROW_FIELDS.values())
+
+
+def to_row(values):
+    """
+    Turns a flight_values() dict into an output row of JSON-friendly values.
+    """
+    row = {name: values[lookup] for name, lookup in ROW_FIELDS.items()}
+    row['departure_time'] = row['departure_time'].isoformat()
+    row['arrival_time'] = row['arrival_time'].isoformat()
+    row['cost'] = str(row['cost'])
+    return row
+
+
+def flight_rows(queryset, chunk_size=2000):
+    """
+    Yields an output row for every flight in the queryset, reading `chunk_size` rows at a time.
+    """
+    for values in flight_values(queryset).iterator(chunk_size=chunk_size):
+        yield to_row(values)
+
+
+def ndjson_lines(rows):
+    """
+    Yields the rows as newline-delimited JSON, in batches of lines.
+    """
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row, separators=(',', ':')) + '\n')
+        if len(batch) >= LINES_PER_CHUNK:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the written value, so csv.writer
+    can encode one row at a time without a buffer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    Yields the rows as CSV with a header line, in batches of lines.
+    """
+    writer = csv.writer(_Echo())
+    batch = [writer.writerow(list(ROW_FIELDS))]
+    for row in rows:
+        batch.append(writer.writerow(row.values()))
+        if len(batch) >= LINES_PER_CHUNK:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
@@ -0,0 +1,194 @@
+# File: fares.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Cheapest fare per route and day, for the fare calendar
+
+import calendar
+from datetime import date, datetime, timedelta
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Flight, RouteDayFare
+
+"""
+RouteDayFare holds one row per route (departure and arrival airport) and
+departure day with the lowest flight cost and the number of flights, so
+the fare calendar reads a month of a route as one range scan of the
+table's unique index instead of every Flight row on the route.
+
+A minimum cannot be adjusted by a difference the way cart totals are: when
+the cheapest flight gets dearer or goes away, the next cheapest is only
+known from the flights themselves. So every write recomputes the route days
+it touched, before and after the change, from the route index on Flight:
+flight saves and deletes through the signals in flights/signals.py, and
+ingested flights in flights/ingest.py, inside the writing transaction.
+`python manage.py rebuild_route_fares` recomputes the whole table with a
+single GROUP BY, after bulk loads or writes made behind the app's back
+(queryset.update() or raw SQL).
+
+Recomputes of the same route day are serialized: each first makes sure the
+day has a row (inserting a placeholder, ignoring conflicts), locks it with
+SELECT ... FOR UPDATE and only then reads the flights. A second writer waits
+for the first to commit and, under READ COMMITTED, reads the flights after
+that, so neither stores a minimum that misses the other's change. SQLite
+runs one write transaction at a time and needs no lock.
+
+Days are departure days in the site's time zone, as in the flight list's
+date filters.
+"""
+
+BATCH_SIZE = 500  # Rows per INSERT
+KEYS_PER_QUERY = 200  # Route days recomputed per query, well inside SQLite's expression depth limit
+
+
+def route_day(departure_airport_id, arrival_airport_id, departure_time):
+    """
+    Returns the (departure airport id, arrival airport id, day) key of a flight.
+    `departure_time` may be a datetime or an ISO string, as the ingest engine has them.
+    """
+    if isinstance(departure_time, str):
+        departure_time = parse_datetime(departure_time)
+    if timezone.is_naive(departure_time):
+        departure_time = timezone.make_aware(departure_time, timezone.get_default_timezone())
+    day = timezone.localtime(departure_time, timezone.get_default_timezone()).date()
+    return (departure_airport_id, arrival_airport_id, day)
+
+
+def day_bounds(day):
+    """
+    Returns the [start, end) departure_time range of a day in the site's time zone.
+    """
+    zone = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()), zone)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()), zone)
+    return start, end
+
+
+def grouped_fares(flights):
+    """
+    Returns the flights' (departure id, arrival id, day, min cost, count) rows,
+    grouped by route and departure day.
+    """
+    return (
+        flights.annotate(day=TruncDate('departure_time', tzinfo=timezone.get_default_timezone()))
+        .order_by()
+        .values_list('departure_airport_id', 'arrival_airport_id', 'day')
+        .annotate(min_cost=Min('cost'), flight_count=Count('id'))
+    )
+
+
+def refresh_route_days(keys):
+    """
+    Recomputes the RouteDayFare rows of the given (departure id, arrival id, day)
+    keys from their flights, deleting the rows of days left without flights.
+    Each batch locks its rows first, so concurrent recomputes of a day run one
+    after the other (see the module docstring).
+    """
+    keys = sorted({key for key in keys if None not in key})
+    for start in range(0, len(keys), KEYS_PER_QUERY):
+        batch = keys[start:start + KEYS_PER_QUERY]
+        flights = Q()
+        fares = Q()
+        for departure_id, arrival_id, day in batch:
+            start_time, end_time = day_bounds(day)
+            flights |= Q(
+                departure_airport_id=departure_id, arrival_airport_id=arrival_id,
+                departure_time__gte=start_time, departure_time__lt=end_time,
+            )
+            fares |= Q(departure_airport_id=departure_id, arrival_airport_id=arrival_id, date=day)
+        with transaction.atomic(savepoint=False):  # Locks last until the caller's transaction ends
+            _refresh_batch(batch, flights, fares)
+
+
+def _refresh_batch(batch, flights, fares):
+    """
+    Recomputes one batch of route days under a lock on their rows. `flights`
+    and `fares` select the batch's flights and RouteDayFare rows.
+    """
+    if connection.features.has_select_for_update:
+        # Every day needs a row to lock; placeholders are overwritten or deleted below
+        RouteDayFare.objects.bulk_create(
+            [
+                RouteDayFare(departure_airport_id=departure_id, arrival_airport_id=arrival_id, date=day,
+                             min_cost=0, flight_count=0)
+                for departure_id, arrival_id, day in batch
+            ],
+            ignore_conflicts=True,
+        )
+        list(RouteDayFare.objects.select_for_update().filter(fares).order_by('pk').values_list('pk', flat=True))
+
+    rows = {
+        (departure_id, arrival_id, day): (min_cost, count)
+        for departure_id, arrival_id, day, min_cost, count in grouped_fares(Flight.objects.filter(flights))
+    }
+    if rows:
+        RouteDayFare.objects.bulk_create(
+            [
+                RouteDayFare(departure_airport_id=departure_id, arrival_airport_id=arrival_id, date=day,
+                             min_cost=min_cost, flight_count=count)
+                for (departure_id, arrival_id, day), (min_cost, count) in rows.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['departure_airport', 'arrival_airport', 'date'],
+            update_fields=['min_cost', 'flight_count'],
+        )
+    empty = Q()
+    for departure_id, arrival_id, day in batch:
+        if (departure_id, arrival_id, day) not in rows:
+            empty |= Q(departure_airport_id=departure_id, arrival_airport_id=arrival_id, date=day)
+    if empty:
+        RouteDayFare.objects.filter(empty).delete()
+
+
+def rebuild_route_fares(batch_size=BATCH_SIZE):
+    """
+    Replaces every RouteDayFare row with ones computed by one GROUP BY over all
+    flights, in one transaction. Returns the number of route days written.
+    """
+    written = 0
+    with transaction.atomic():
+        RouteDayFare.objects.all().delete()
+        batch = []
+        for departure_id, arrival_id, day, min_cost, count in grouped_fares(Flight.objects.all()).iterator(batch_size):
+            batch.append(RouteDayFare(departure_airport_id=departure_id, arrival_airport_id=arrival_id, date=day,
+                                      min_cost=min_cost, flight_count=count))
+            if len(batch) == batch_size:
+                RouteDayFare.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        RouteDayFare.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def month_grid(departure_airport_id, arrival_airport_id, year, month):
+    """
+    Returns the weeks (Monday first) of a month's calendar page, each a list of
+    {'date', 'in_month', 'fare'} cells, where fare is the day's RouteDayFare or
+    None, and the cheapest fare of the month. Reads the fares of the whole page
+    in one query.
+    """
+    weeks = calendar.Calendar().monthdatescalendar(year, month)
+    fares = {
+        fare.date: fare
+        for fare in RouteDayFare.objects.filter(
+            departure_airport_id=departure_airport_id, arrival_airport_id=arrival_airport_id,
+            date__gte=weeks[0][0], date__lte=weeks[-1][-1],
+        )
+    }
+    in_month = [fare for day, fare in fares.items() if day.month == month]
+    cheapest = min(in_month, key=lambda fare: (fare.min_cost, fare.date)) if in_month else None
+    grid = [
+        [{'date': day, 'in_month': day.month == month, 'fare': fares.get(day)} for day in week]
+        for week in weeks
+    ]
+    return grid, cheapest
+
+
+def shift_month(first_day, months):
+    """
+    Returns the first day of the month `months` away from the month of `first_day`.
+    """
+    index = first_day.year * 12 + first_day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
@@ -0,0 +1,135 @@
+# File: filters.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Search filters and sort orders for the flight catalog
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import search
+
+"""
+FlightFilter turns the query string of the flight list into queryset filters
+and an ordering. Filters are written so the composite indexes on Flight can
+serve them: airports are matched on their ids, and the departure date range
+is turned into a departure_time range instead of using the __date transform,
+which would hide the column from the index. Text search goes through the
+full-text index in flights/search.py.
+"""
+
+# Sort option -> ordering. The trailing id makes every ordering unique for keyset pagination.
+SORT_ORDERINGS = {
+    'departure': ('departure_time', 'id'),
+    '-departure': ('-departure_time', '-id'),
+    'price': ('cost', 'id'),
+    '-price': ('-cost', '-id'),
+    'relevance': ('search_rank', 'id'),  # Only with a text search
+}
+SORT_CHOICES = [
+    ('departure', 'Departure (earliest first)'),
+    ('-departure', 'Departure (latest first)'),
+    ('price', 'Price (lowest first)'),
+    ('-price', 'Price (highest first)'),
+    ('relevance', 'Best match (when searching)'),
+]
+DEFAULT_SORT = 'departure'
+
+
+class FlightFilter:
+    """
+    Parses flight list filters from a QueryDict and applies them to a Flight queryset.
+
+    Supported parameters: q (full-text search), departure_airport, arrival_airport (airport ids or
+    'all'), date_from / date_to (YYYY-MM-DD, inclusive), min_cost / max_cost
+    and sort (one of SORT_ORDERINGS). Values that do not parse are ignored.
+    """
+
+    def __init__(self, params):
+        self.query = params.get('q', '').strip()
+        self.departure_airport = self._parse_id(params.get('departure_airport'))
+        self.arrival_airport = self._parse_id(params.get('arrival_airport'))
+        self.date_from = parse_date_or_none(params.get('date_from'))
+        self.date_to = parse_date_or_none(params.get('date_to'))
+        self.min_cost = self._parse_cost(params.get('min_cost'))
+        self.max_cost = self._parse_cost(params.get('max_cost'))
+        sort = params.get('sort', DEFAULT_SORT)
+        if sort not in SORT_ORDERINGS or (sort == 'relevance' and not self.query):
+            sort = DEFAULT_SORT
+        self.sort = sort
+
+    @property
+    def ordering(self):
+        """
+        Returns the ordering for the selected sort option.
+        """
+        return SORT_ORDERINGS[self.sort]
+
+    def apply(self, queryset):
+        """
+        Returns the queryset narrowed down by every filter that was given.
+        """
+        if self.query and self.sort == 'relevance':
+            queryset = search.rank_flights(queryset, self.query)  # Search and score matches
+        elif self.query:
+            queryset = search.filter_flights(queryset, self.query)  # Search flights and airports
+        return self._apply_fields(queryset)
+
+    def apply_archive(self, queryset):
+        """
+        Returns a FlightArchive queryset narrowed down by the same filters. The
+        full-text index only covers live flights, so the archive is searched without it.
+        """
+        if self.query:
+            queryset = search.filter_archived_flights(queryset, self.query)
+        return self._apply_fields(queryset)
+
+    def _apply_fields(self, queryset):
+        """
+        Applies the airport, date and cost filters.
+        """
+        if self.departure_airport:
+            queryset = queryset.filter(departure_airport_id=self.departure_airport)
+        if self.arrival_airport:
+            queryset = queryset.filter(arrival_airport_id=self.arrival_airport)
+        if self.date_from:
+            queryset = queryset.filter(departure_time__gte=start_of_day(self.date_from))
+        if self.date_to and self.date_to < date.max:  # No day follows date.max, and nothing departs after it
+            queryset = queryset.filter(departure_time__lt=start_of_day(self.date_to + timedelta(days=1)))
+        if self.min_cost is not None:
+            queryset = queryset.filter(cost__gte=self.min_cost)
+        if self.max_cost is not None:
+            queryset = queryset.filter(cost__lte=self.max_cost)
+        return queryset
+
+    def _parse_id(self, value):
+        """
+        Returns an airport id, or None for 'all', blanks and junk.
+        """
+        return int(value) if value and value.isdigit() else None
+
+    def _parse_cost(self, value):
+        """
+        Returns a non-negative Decimal, or None if the value does not parse.
+        """
+        try:
+            cost = Decimal(value)
+        except (TypeError, InvalidOperation):
+            return None
+        return cost if cost.is_finite() and cost >= 0 else None
+
+
+def parse_date_or_none(value):
+    """
+    Parses YYYY-MM-DD, returning None for blanks and invalid dates.
+    """
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
+
+
+def start_of_day(day):
+    """
+    Returns midnight at the start of `day` in the current time zone.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
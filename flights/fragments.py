@@ -0,0 +1,168 @@
+# File: fragments.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Cached HTML fragments for flights shown in lists and on boards
+
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .databases import primary_database
+from .models import Flight
+
+"""
+Flight cards on the flight list and rows on the airport boards are rendered
+once and cached, so a page mostly stitches cached HTML together. Every
+fragment is rendered from one flight and its two airports, and is cached
+under the template, the flight and a version number for each of the three:
+
+    fragment:flights/flight_card.html:42:v<flight>.<departure airport>.<arrival airport>
+
+Saving, deleting or ingesting a flight bumps the flight's version, and
+saving or deleting an airport bumps the airport's (see flights/signals.py),
+so stale fragments are simply never asked for again and age out. (A page
+that read a flight just before a change to it committed can still cache
+the old fragment under the new version; TIMEOUT bounds how long.) A page
+costs two cache round trips however many fragments it shows: one get_many
+for the versions and one for the fragments, plus a set_many for the misses.
+
+Hits and misses are counted per template in the cache itself, so
+fragment_stats() (and `python manage.py fragment_cache_stats`) reports them
+across every worker process.
+"""
+
+DEFAULT_CONFIG = {
+    "CACHE_ALIAS": "default",  # Django cache alias holding the fragments
+    "TIMEOUT": 60 * 60,  # Seconds a fragment is kept, even if its flight never changes
+}
+FRAGMENT_TEMPLATES = (
+    'flights/flight_card.html',
+    'flights/board_departure_row.html',
+    'flights/board_arrival_row.html',
+)
+
+
+def fragment_config():
+    """
+    Returns the fragment cache settings merged over the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_FRAGMENT_CACHE", {})}
+
+
+def render_fragments(template_name, flights):
+    """
+    Returns the HTML of `template_name` rendered for each flight, in order,
+    from the cache where possible. The template gets the flight as `flight`.
+    """
+    flights = list(flights)
+    if not flights:
+        return []
+    config = fragment_config()
+    cache = caches[config["CACHE_ALIAS"]]
+
+    versions = _versions(cache, flights)
+    keys = [
+        f"fragment:{template_name}:{flight.pk}:v{versions[_flight_key(flight.pk)]}."
+        f"{versions[_airport_key(flight.departure_airport_id)]}.{versions[_airport_key(flight.arrival_airport_id)]}"
+        for flight in flights
+    ]
+    cached = cache.get_many(keys)
+
+    # A replica may not have the change behind the current versions yet, so
+    # misses read from one are rendered from the primary (see flights/databases.py)
+    primary = primary_database()
+    replica_misses = [
+        flight.pk for key, flight in zip(keys, flights) if key not in cached and flight._state.db != primary
+    ]
+    fresh = (
+        Flight.objects.using(primary).select_related('departure_airport', 'arrival_airport').in_bulk(replica_misses)
+        if replica_misses else {}
+    )
+
+    rendered = {}
+    uncacheable = set()
+    for key, flight in zip(keys, flights):
+        if key not in cached and key not in rendered:
+            if flight._state.db != primary:
+                if flight.pk not in fresh:  # Deleted on the primary since
+                    uncacheable.add(key)
+                flight = fresh.get(flight.pk, flight)
+            rendered[key] = render_to_string(template_name, {'flight': flight})
+    if rendered:
+        cache.set_many({key: html for key, html in rendered.items() if key not in uncacheable}, config["TIMEOUT"])
+
+    _count(cache, template_name, hits=len(keys) - len(rendered), misses=len(rendered))
+    return [mark_safe(cached.get(key) or rendered[key]) for key in keys]
+
+
+def invalidate_fragments(flight_ids=(), airport_ids=()):
+    """
+    Retires the cached fragments of the given flights, and of every flight to or from the given airports.
+    """
+    cache = caches[fragment_config()["CACHE_ALIAS"]]
+    keys = [_flight_key(pk) for pk in set(flight_ids)] + [_airport_key(pk) for pk in set(airport_ids)]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:  # No version yet, so nothing is cached under one either
+            pass
+
+
+def fragment_stats():
+    """
+    Returns {template: {'hits', 'misses', 'hit_rate'}} counted since the cache was last cleared.
+    """
+    cache = caches[fragment_config()["CACHE_ALIAS"]]
+    counters = cache.get_many([f"fragment-stats:{name}:{kind}" for name in FRAGMENT_TEMPLATES for kind in ('hits', 'misses')])
+    stats = {}
+    for name in FRAGMENT_TEMPLATES:
+        hits = counters.get(f"fragment-stats:{name}:hits", 0)
+        misses = counters.get(f"fragment-stats:{name}:misses", 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
+
+
+def _flight_key(flight_id):
+    return f"fragment-version:flight:{flight_id}"
+
+
+def _airport_key(airport_id):
+    return f"fragment-version:airport:{airport_id}"
+
+
+def _versions(cache, flights):
+    """
+    Returns the current version of every flight and airport in `flights`,
+    starting missing ones from the clock so a version lost to eviction never
+    reuses an old number.
+    """
+    keys = set()
+    for flight in flights:
+        keys.update((
+            _flight_key(flight.pk), _airport_key(flight.departure_airport_id), _airport_key(flight.arrival_airport_id),
+        ))
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def _count(cache, template_name, hits, misses):
+    """
+    Adds to the hit and miss counters of a template.
+    """
+    for kind, amount in (('hits', hits), ('misses', misses)):
+        if not amount:
+            continue
+        key = f"fragment-stats:{template_name}:{kind}"
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, None):
+                cache.incr(key, amount)
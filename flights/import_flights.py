@@ -3,81 +3,32 @@
 # Description: Temporary code to import data for the flight app 
 # This code is put into FlightCreateView in views
 
-import requests
 from datetime import timedelta
-from flights.models import Airport, AircraftType, Flight
+from flights.ingest import ingest_payload
+from flights.serpapi_client import get_client
 
 # Example: Fetch data from an external API
 def fetch_flight_data():
-    api_key = "d764904413d0f85fcb35954a94356a3cb2c27e21726f437941bcdbfdeb166d3d"  # API
-    endpoint = "https://serpapi.com/search"
-    params = {
-        "engine": "google_flights",
-        "departure_id": "HND",  # Example departure airport code
-        "arrival_id": "ICN",   # Example arrival airport code
-        "outbound_date": "2024-12-23",
-        "return_date": "2024-12-31",
-        "currency": "USD",
-        "hl": "en",
-        "api_key": api_key,
-    }
-
-    response = requests.get(endpoint, params=params)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Error fetching flight data: {response.status_code}, {response.text}")
+    return get_client().google_flights(
+        "HND",  # Example departure airport code
+        "ICN",  # Example arrival airport code
+        "2024-12-23",
+        return_date="2024-12-31",
+        type=1,  # Round trip
+    )
 
 # Function to fetch and import flights into the database
 def fetch_and_import_flights():
     data = fetch_flight_data()
 
-    # Parse flight data
-    for flight_data in data.get("best_flights", []):
-        for leg in flight_data["flights"]:
-            # Handle departure airport
-            departure_airport, _ = Airport.objects.get_or_create(
-                name=leg["departure_airport"]["name"],
-                code=leg["departure_airport"]["id"],
-                city=leg.get("departure_city", "Unknown"),
-                country=leg.get("departure_country", "Unknown"),
-                amenities="",
-                avg_security_time=timedelta(minutes=30)  # Default to 30 minutes
-            )
-
-            # Handle arrival airport
-            arrival_airport, _ = Airport.objects.get_or_create(
-                name=leg["arrival_airport"]["name"],
-                code=leg["arrival_airport"]["id"],
-                city=leg.get("arrival_city", "Unknown"),
-                country=leg.get("arrival_country", "Unknown"),
-                amenities="",
-                avg_security_time=timedelta(minutes=30)  # Default to 30 minutes
-            )
-
-            # Handle aircraft type
-            aircraft, _ = AircraftType.objects.get_or_create(
-                manufacturer="Unknown",  # Replace with actual manufacturer if available
-                model=leg.get("airplane", "Unknown"),
-                seat_capacity=200,  # Replace with actual seat capacity if available
-            )
-
-            # Create or update the flight
-            flight, _ = Flight.objects.update_or_create(
-                flight_number=leg["flight_number"],
-                defaults={
-                    "departure_airport": departure_airport,
-                    "arrival_airport": arrival_airport,
-                    "departure_time": leg["departure_airport"]["time"],
-                    "arrival_time": leg["arrival_airport"]["time"],
-                    "cost": flight_data.get("price", 0.0),
-                    "aircraft": aircraft,
-                    "amenities": ", ".join(leg.get("extensions", [])),
-                    "seats_left": 100,  # Replace with actual seat data if available
-                },
-            )
-
-    print("Flight data imported successfully.")
+    # Parse and write the whole payload in one batched transaction
+    counts = ingest_payload(
+        data,
+        security_time=timedelta(minutes=30),  # Default to 30 minutes
+        seats_left=100,  # Replace with actual seat data if available
+    )
+
+    print(f"Flight data imported successfully: {counts}")
 
 
 
@@ -0,0 +1,151 @@
+# File: import_jobs.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Background processing of queued flight import jobs
+
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .ingest import ingest_payload
+from .models import ImportJob
+from .serpapi_client import get_client
+
+"""
+The import form only queues an ImportJob and returns. A separate worker
+process (`python manage.py process_import_jobs`) polls the table, claims
+queued jobs one at a time, fetches the flights from SerpAPI and writes them
+through the ingest engine, updating the job's progress, counts and error
+as it goes so the form page can poll for the outcome.
+
+A worker that dies mid-job leaves its job 'running'. Workers looking for
+work first fail running jobs claimed more than STALE_MINUTES ago, with the
+same kind of conditional UPDATE as a claim, so the status page reports the
+failure instead of showing the job in progress forever. They are failed
+rather than retried, so a job that kills its worker cannot take down every
+worker in turn; the user can queue it again.
+"""
+
+DEFAULT_CONFIG = {
+    "STALE_MINUTES": 15,  # Running jobs claimed longer ago than this are failed
+}
+
+STALE_ERROR = "The import worker stopped before finishing. Please try again."
+
+
+def import_jobs_config():
+    """
+    Returns the import job settings merged over the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_IMPORT_JOBS", {})}
+
+
+def enqueue_import(user, departure_code, arrival_code, outbound_date, departure_city="",
+                   departure_country="", arrival_city="", arrival_country=""):
+    """
+    Queues an import for one route and date and returns the ImportJob.
+    """
+    return ImportJob.objects.create(
+        user=user,
+        departure_code=departure_code,
+        arrival_code=arrival_code,
+        outbound_date=outbound_date,
+        departure_city=departure_city or "",
+        departure_country=departure_country or "",
+        arrival_city=arrival_city or "",
+        arrival_country=arrival_country or "",
+    )
+
+
+async def aenqueue_import(user, departure_code, arrival_code, outbound_date, departure_city="",
+                          departure_country="", arrival_city="", arrival_country=""):
+    """
+    Async version of enqueue_import(), for the async import view.
+    """
+    return await ImportJob.objects.acreate(
+        user=user,
+        departure_code=departure_code,
+        arrival_code=arrival_code,
+        outbound_date=outbound_date,
+        departure_city=departure_city or "",
+        departure_country=departure_country or "",
+        arrival_city=arrival_city or "",
+        arrival_country=arrival_country or "",
+    )
+
+
+def fail_stale_jobs(now=None):
+    """
+    Marks running jobs claimed more than STALE_MINUTES before `now` (default: the
+    current time) as failed, with one conditional UPDATE. Returns the number failed.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=import_jobs_config()["STALE_MINUTES"])
+    return ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=ImportJob.STATUS_FAILED, progress=100, error=STALE_ERROR, finished_at=now
+    )
+
+
+def claim_next_job():
+    """
+    Claims the oldest queued job and returns it, or None if the queue is empty.
+    The claim is a conditional UPDATE, so concurrent workers never run the same job.
+    Stale claims of dead workers are failed first (see fail_stale_jobs).
+    """
+    fail_stale_jobs()
+    queued = ImportJob.objects.filter(status=ImportJob.STATUS_QUEUED).order_by('pk')
+    for job_id in queued.values_list('pk', flat=True)[:10]:
+        claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_QUEUED).update(
+            status=ImportJob.STATUS_RUNNING, progress=10, started_at=timezone.now()
+        )
+        if claimed:
+            return ImportJob.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job):
+    """
+    Fetches and imports the flights for a claimed job, recording the outcome on the row.
+    The outcome is only recorded while the job is still running: a job failed as
+    stale in the meantime (see fail_stale_jobs) keeps that status, and is returned
+    as stored.
+    """
+    running = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_RUNNING)
+    try:
+        data = get_client().google_flights(job.departure_code, job.arrival_code, job.outbound_date)
+        running.update(progress=50)
+
+        job.counts = ingest_payload(
+            data, job.departure_city, job.departure_country, job.arrival_city, job.arrival_country
+        )
+        job.status = ImportJob.STATUS_SUCCEEDED
+    except Exception as e:
+        job.status = ImportJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.progress = 100
+    job.finished_at = timezone.now()
+    finished = running.update(
+        status=job.status, progress=job.progress, counts=job.counts, error=job.error, finished_at=job.finished_at
+    )
+    if not finished:  # Failed as stale while it ran
+        job.refresh_from_db()
+    return job
+
+
+def process_jobs(once=False, poll_interval=2.0, max_jobs=None):
+    """
+    Runs queued jobs until the queue is empty (once=True) or forever,
+    sleeping poll_interval seconds whenever there is nothing to do.
+    Returns the number of jobs processed.
+    """
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
@@ -0,0 +1,302 @@
+# File: ingest.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Batched ingest engine that writes SerpAPI Google Flights payloads
+# into the flight app models
+
+import hashlib
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from .cart_totals import reprice_flights
+from .conditional import bump_catalog_version
+from .fares import refresh_route_days, route_day
+from .models import Airport, AircraftType, Flight
+from .signals import flights_ingested
+
+"""
+This module turns a SerpAPI `google_flights` payload into Airport, AircraftType
+and Flight rows. The payload is normalized up front, airports and aircraft are
+resolved through code -> pk maps that are loaded once, and every row is written
+with `bulk_create` inside a single transaction. This replaces the per-leg
+`get_or_create` / `update_or_create` round trips the importers used to make.
+
+Every imported flight stores a hash of the upstream fields it was written
+from (Flight.source_hash). A re-import compares the new hashes with the
+stored ones, which it reads together with the existing rows anyway, and
+writes only new flights and flights whose upstream data changed; unchanged
+rows cost no write at all, and neither do the fare, cart, catalog version
+and cache updates that follow a write. Existing flights keep their
+seats_left unless the caller gives one (the random roll is only for new
+flights, and seat holds count down from it), and existing airports are
+never rewritten. Local edits to a flight stay until its upstream data changes.
+"""
+
+DEFAULT_SEAT_CAPACITY = 200  # Seat capacity given to aircraft types we have not seen
+BATCH_SIZE = 500  # Rows per INSERT statement
+
+# Flight columns refreshed when an already imported flight number shows up with changed upstream data
+FLIGHT_UPDATE_FIELDS = [
+    'departure_airport', 'arrival_airport', 'departure_time', 'arrival_time',
+    'cost', 'aircraft', 'amenities', 'seats_left', 'source_hash', 'updated_at',
+]
+
+# Fields of a normalized flight row that come from SerpAPI, in source_hash order
+HASHED_FIELDS = (
+    'flight_number', 'departure_code', 'arrival_code', 'departure_time', 'arrival_time',
+    'cost', 'aircraft_model', 'amenities',
+)
+
+
+def normalize_payload(data, departure_city=None, departure_country=None,
+                      arrival_city=None, arrival_country=None):
+    """
+    Flattens a SerpAPI payload into airport, aircraft and flight rows.
+
+    Returns a dict with:
+      - 'airports': code -> {'name', 'city', 'country'} (first occurrence wins)
+      - 'aircraft': list of distinct aircraft model names
+      - 'flights': flight number -> flight row (last occurrence wins, which
+        matches the old update_or_create behaviour)
+    """
+    airports = {}
+    aircraft = []
+    flights = {}
+
+    for flight_data in data.get("best_flights", []):
+        for leg in flight_data["flights"]:
+            departure = leg["departure_airport"]
+            arrival = leg["arrival_airport"]
+
+            airports.setdefault(departure["id"], {
+                "name": departure["name"],
+                "city": departure_city or "Unknown",
+                "country": departure_country or "Unknown",
+            })
+            airports.setdefault(arrival["id"], {
+                "name": arrival["name"],
+                "city": arrival_city or "Unknown",
+                "country": arrival_country or "Unknown",
+            })
+
+            model = leg.get("airplane", "Unknown")
+            if model not in aircraft:
+                aircraft.append(model)
+
+            flights[leg["flight_number"]] = {
+                "flight_number": leg["flight_number"],
+                "departure_code": departure["id"],
+                "arrival_code": arrival["id"],
+                "departure_time": departure["time"],
+                "arrival_time": arrival["time"],
+                "cost": flight_data.get("price", 0.0),
+                "aircraft_model": model,
+                "amenities": ", ".join(leg.get("extensions", [])),
+            }
+
+    return {"airports": airports, "aircraft": aircraft, "flights": flights}
+
+
+def source_hash(row):
+    """
+    Returns a stable hash of a normalized flight row's upstream fields.
+    """
+    values = {**row, "cost": Decimal(str(row["cost"])).quantize(Decimal("0.01"))}  # 420 and 420.0 are the same price
+    key = "\x1f".join(str(values[field]) for field in HASHED_FIELDS)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def _airport_map(codes):
+    """
+    Returns a code -> pk map for the given airport codes in one query.
+    """
+    return dict(Airport.objects.filter(code__in=codes).values_list('code', 'pk'))
+
+
+def _aircraft_map(models):
+    """
+    Returns a model name -> pk map for the given aircraft models in one query.
+    """
+    rows = AircraftType.objects.filter(
+        model__in=models, seat_capacity=DEFAULT_SEAT_CAPACITY
+    ).order_by('pk').values_list('model', 'pk')
+    aircraft = {}
+    for model, pk in rows:
+        aircraft.setdefault(model, pk)  # Keep the oldest row if there are duplicates
+    return aircraft
+
+
+def ingest_payload(data, departure_city=None, departure_country=None,
+                   arrival_city=None, arrival_country=None,
+                   security_time=None, seats_left=None):
+    """
+    Imports a whole SerpAPI payload in one transaction.
+
+    `security_time` is the avg_security_time given to new airports and
+    `seats_left` the seat count written to imported flights; when left as
+    None they are rolled randomly for new rows, as the import form has
+    always done, and existing flights keep theirs.
+
+    Returns per-entity counts, e.g.
+    {'airports': {'created': 2, 'updated': 0}, 'aircraft': {...},
+     'flights': {'created': 5, 'updated': 1, 'unchanged': 14}}.
+    """
+    rows = normalize_payload(data, departure_city, departure_country,
+                             arrival_city, arrival_country)
+    return ingest_rows(rows, security_time=security_time, seats_left=seats_left)
+
+
+def ingest_rows(rows, security_time=None, seats_left=None):
+    """
+    Writes rows produced by normalize_payload (or several payloads merged
+    together) to the database and returns the created/updated counts, and
+    for flights the number left unchanged.
+    """
+    counts = {
+        "airports": {"created": 0, "updated": 0},
+        "aircraft": {"created": 0, "updated": 0},
+        "flights": {"created": 0, "updated": 0, "unchanged": 0},
+    }
+    if not rows["flights"]:
+        return counts
+
+    with transaction.atomic():
+        # Airports: existing rows are left untouched, only new codes are inserted
+        airport_ids = _airport_map(rows["airports"].keys())
+        new_airports = [
+            Airport(
+                code=code,
+                name=airport["name"],
+                city=airport["city"],
+                country=airport["country"],
+                amenities="",
+                avg_security_time=security_time or timedelta(minutes=random.randint(5, 30)),
+            )
+            for code, airport in rows["airports"].items() if code not in airport_ids
+        ]
+        if new_airports:
+            Airport.objects.bulk_create(new_airports, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            # Rows skipped as conflicts are not known to have been inserted, so
+            # count the codes that were missing before and exist now
+            known_codes = airport_ids.keys()
+            airport_ids = _airport_map(rows["airports"].keys())
+            counts["airports"]["created"] = len(airport_ids.keys() - known_codes)
+
+        # Aircraft types: matched on model name at the default seat capacity
+        aircraft_ids = _aircraft_map(rows["aircraft"])
+        new_aircraft = [
+            AircraftType(model=model, seat_capacity=DEFAULT_SEAT_CAPACITY)
+            for model in rows["aircraft"] if model not in aircraft_ids
+        ]
+        if new_aircraft:
+            AircraftType.objects.bulk_create(new_aircraft, batch_size=BATCH_SIZE)
+            if all(aircraft.pk for aircraft in new_aircraft):
+                aircraft_ids.update((aircraft.model, aircraft.pk) for aircraft in new_aircraft)
+            else:  # Backends without RETURNING do not hand back primary keys
+                aircraft_ids = _aircraft_map(rows["aircraft"])
+            counts["aircraft"]["created"] = len(new_aircraft)
+
+        # Flights: rows whose upstream data hashes the same as what is stored are skipped,
+        # the rest go out as one upsert keyed on the unique flight number
+        hashes = {number: source_hash(row) for number, row in rows["flights"].items()}
+        existing = {}
+        unchanged = set()
+        for number, flight_id, departure_id, arrival_id, cost, departure_time, stored_hash in (
+            Flight.objects.filter(flight_number__in=rows["flights"].keys())
+            .values_list('flight_number', 'id', 'departure_airport_id', 'arrival_airport_id', 'cost',
+                         'departure_time', 'source_hash')
+        ):
+            if stored_hash == hashes[number]:
+                unchanged.add(number)
+            else:
+                existing[number] = (flight_id, departure_id, arrival_id, cost, departure_time)
+        flights = [
+            Flight(
+                flight_number=number,
+                departure_airport_id=airport_ids[row["departure_code"]],
+                arrival_airport_id=airport_ids[row["arrival_code"]],
+                departure_time=row["departure_time"],
+                arrival_time=row["arrival_time"],
+                cost=row["cost"],
+                aircraft_id=aircraft_ids[row["aircraft_model"]],
+                amenities=row["amenities"],
+                seats_left=seats_left if seats_left is not None else random.randint(50, 200),
+                source_hash=hashes[number],
+            )
+            for number, row in rows["flights"].items() if number not in unchanged
+        ]
+        counts["flights"]["unchanged"] = len(unchanged)
+        counts["flights"]["updated"] = len(existing)
+        counts["flights"]["created"] = len(flights) - len(existing)
+        if not flights and not new_airports:
+            return counts  # Nothing was written, so the fares, carts and caches are still current
+
+        Flight.objects.bulk_create(
+            flights,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['flight_number'],
+            # The random seat count is only for new flights; updates keep the seats holds have counted down
+            update_fields=[
+                field for field in FLIGHT_UPDATE_FIELDS if seats_left is not None or field != 'seats_left'
+            ],
+        )
+
+        if all(flight.pk for flight in flights):
+            flight_ids = [flight.pk for flight in flights]
+        else:  # Backends without RETURNING do not hand back primary keys
+            flight_ids = list(
+                Flight.objects.filter(flight_number__in=[flight.flight_number for flight in flights])
+                .values_list('pk', flat=True)
+            )
+        # Carts holding re-priced flights get the difference applied in this transaction
+        reprice_flights({
+            flight_id: Decimal(str(rows["flights"][number]["cost"])).quantize(Decimal("0.01")) - cost
+            for number, (flight_id, _, _, cost, _) in existing.items()
+        })
+
+        # Route days the flights left or joined get their cheapest fares recomputed
+        refresh_route_days(
+            [route_day(departure_id, arrival_id, departure_time)
+             for _, departure_id, arrival_id, _, departure_time in existing.values()]
+            + [route_day(flight.departure_airport_id, flight.arrival_airport_id, flight.departure_time)
+               for flight in flights]
+        )
+
+        # bulk_create skips the model signals, so mark the catalog changed here
+        bump_catalog_version()
+
+        # and tell caches of the catalog what changed once committed
+        new_airport_ids = [airport_ids[airport.code] for airport in new_airports]
+        route_airport_ids = {
+            airport_id for _, departure_id, arrival_id, _, _ in existing.values() for airport_id in (departure_id, arrival_id)
+        }
+        route_airport_ids.update(flight.departure_airport_id for flight in flights)
+        route_airport_ids.update(flight.arrival_airport_id for flight in flights)
+        transaction.on_commit(lambda: flights_ingested.send(
+            sender=Flight, flight_ids=flight_ids, airport_ids=new_airport_ids,
+            route_airport_ids=sorted(route_airport_ids),
+        ))
+
+    return counts
+
+
+def merge_rows(target, rows):
+    """
+    Merges rows from normalize_payload into `target` so that several payloads
+    can be written with a single ingest_rows call. Returns `target`.
+    """
+    for code, airport in rows["airports"].items():
+        target["airports"].setdefault(code, airport)
+    for model in rows["aircraft"]:
+        if model not in target["aircraft"]:
+            target["aircraft"].append(model)
+    target["flights"].update(rows["flights"])
+    return target
+
+
+def empty_rows():
+    """
+    Returns an empty row set in the shape produced by normalize_payload.
+    """
+    return {"airports": {}, "aircraft": [], "flights": {}}
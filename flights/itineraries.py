@@ -0,0 +1,382 @@
+# File: itineraries.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Multi-leg itinerary search over the flight network
+
+import heapq
+import itertools
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from .filters import start_of_day
+from .models import Airport, Flight
+
+"""
+Customers looking for BOS -> ICN via any hub should not have to stitch
+single flights together by hand. This module keeps the flight network in
+memory as a time-expanded graph: for every airport, the flights leaving it
+sorted by departure time, stored column by column in compact arrays (about
+40 bytes per flight). Finding the onward flights that can be caught after
+landing is then a binary search.
+
+FlightGraph.search() is a label-setting, time-dependent Dijkstra search. A
+label is a partial itinerary (where it is, when it got there, what it cost).
+Labels are expanded best first, cheapest or fastest, so the first k that
+reach the destination are the k best itineraries. A connection is feasible
+when the next flight leaves at least the airport's avg_security_time after
+landing and no later than the maximum layover. Labels that k others beat on
+arrival time, the sort criterion and number of legs are pruned.
+
+The graph is built once per process and refreshed incrementally: flights
+saved, deleted or ingested in this process are reloaded by id (see
+flights/signals.py), new flights from other processes are picked up by id,
+and the whole graph is rebuilt once it is older than MAX_AGE seconds so
+changes made elsewhere are never missed for long.
+"""
+
+DEFAULT_CONFIG = {
+    "MAX_AGE": 15 * 60,  # Seconds before a full rebuild
+    "MAX_PENDING": 50000,  # Changed flights beyond which a rebuild is cheaper than reloading them
+}
+SORT_OPTIONS = ('cheapest', 'fastest')
+DEFAULT_MAX_LEGS = 3
+DEFAULT_MAX_LAYOVER = timedelta(hours=24)
+MAX_LABELS = 200000  # Partial itineraries expanded before a search gives up
+
+
+class Departures:
+    """
+    The flights leaving one airport, sorted by departure time.
+    """
+
+    __slots__ = ('times', 'arrivals', 'costs', 'destinations', 'flight_ids')
+
+    def __init__(self):
+        self.times = array('q')  # Departure, epoch seconds
+        self.arrivals = array('q')  # Arrival, epoch seconds
+        self.costs = array('q')  # Cost in cents
+        self.destinations = array('q')  # Arrival airport id
+        self.flight_ids = array('q')
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, flight_id, departs, arrives, cost, destination):
+        """
+        Adds a flight that departs no earlier than the last one.
+        """
+        self.times.append(departs)
+        self.arrivals.append(arrives)
+        self.costs.append(cost)
+        self.destinations.append(destination)
+        self.flight_ids.append(flight_id)
+
+    def insert(self, flight_id, departs, arrives, cost, destination):
+        """
+        Adds a flight at its place in departure order.
+        """
+        i = bisect_right(self.times, departs)
+        self.times.insert(i, departs)
+        self.arrivals.insert(i, arrives)
+        self.costs.insert(i, cost)
+        self.destinations.insert(i, destination)
+        self.flight_ids.insert(i, flight_id)
+
+    def remove(self, flight_id):
+        """
+        Removes a flight if it is present.
+        """
+        try:
+            i = self.flight_ids.index(flight_id)
+        except ValueError:
+            return
+        for column in (self.times, self.arrivals, self.costs, self.destinations, self.flight_ids):
+            del column[i]
+
+    def copy(self):
+        """
+        Returns an independent copy, so refreshes never change arrays a search is reading.
+        """
+        other = Departures()
+        for name in self.__slots__:
+            getattr(other, name).extend(getattr(self, name))
+        return other
+
+
+class FlightGraph:
+    """
+    In-memory flight network: airport id -> Departures, plus minimum connection times.
+    """
+
+    def __init__(self, max_age=None, max_pending=None):
+        config = {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_ITINERARY_GRAPH", {})}
+        self.max_age = max_age if max_age is not None else config["MAX_AGE"]
+        self.max_pending = max_pending if max_pending is not None else config["MAX_PENDING"]
+        self.departures = {}
+        self.min_connection = {}  # Airport id -> seconds
+        self.origins = array('q')  # Flight id -> departure airport id, 0 when not in the graph
+        self.max_flight_id = 0
+        self.built_at = None
+        self._pending = set()  # Flight ids to reload on the next refresh
+        self._airports_changed = False
+        self._lock = threading.Lock()
+
+    def mark_changed(self, flight_ids):
+        """
+        Queues flights that were saved, deleted or ingested for the next refresh.
+        """
+        with self._lock:
+            self._pending.update(flight_ids)
+
+    def mark_airports_changed(self):
+        """
+        Reloads minimum connection times on the next refresh.
+        """
+        self._airports_changed = True
+
+    def invalidate(self):
+        """
+        Forces a full rebuild on the next refresh.
+        """
+        with self._lock:
+            self.built_at = None
+
+    def refresh(self):
+        """
+        Builds the graph on first use and when it is too old, otherwise applies pending changes
+        and flights added since the last refresh.
+        """
+        with self._lock:
+            expired = self.built_at is None or time.monotonic() - self.built_at > self.max_age
+            if expired or len(self._pending) > self.max_pending:
+                self._build()
+                return
+            if self._airports_changed:
+                self._airports_changed = False
+                self.min_connection = self._load_min_connection()
+
+            pending, self._pending = self._pending, set()
+            queryset = Flight.objects.filter(id__gt=self.max_flight_id)
+            if pending:
+                queryset = queryset | Flight.objects.filter(id__in=pending)
+            rows = list(self._rows(queryset))
+            self._apply(pending | {row[0] for row in rows}, rows)
+
+    def _build(self):
+        """
+        Loads every flight from the database, replacing the current graph.
+        """
+        self.load(
+            self._rows(Flight.objects.order_by('departure_airport_id', 'departure_time')),
+            self._load_min_connection(),
+        )
+
+    def load(self, rows, min_connection):
+        """
+        Replaces the graph with `rows` of (id, departure airport, departs, arrives, cost in cents,
+        arrival airport), sorted by departure airport and departure time.
+        """
+        departures = {}
+        origins = array('q')
+        max_flight_id = 0
+        for flight_id, origin, departs, arrives, cost, destination in rows:
+            if origin not in departures:
+                departures[origin] = Departures()
+            departures[origin].append(flight_id, departs, arrives, cost, destination)
+            _store(origins, flight_id, origin)
+            max_flight_id = max(max_flight_id, flight_id)
+
+        self.min_connection = min_connection
+        self._airports_changed = False
+        self._pending = set()
+        self.departures = departures
+        self.origins = origins
+        self.max_flight_id = max_flight_id
+        self.built_at = time.monotonic()
+
+    def _apply(self, flight_ids, rows):
+        """
+        Removes `flight_ids` from the graph and inserts their current `rows`.
+        Touched airports are copied and swapped in, so searches in progress are unaffected.
+        """
+        touched = {}
+
+        def editable(airport_id):
+            if airport_id not in touched:
+                current = self.departures.get(airport_id)
+                touched[airport_id] = current.copy() if current is not None else Departures()
+            return touched[airport_id]
+
+        for flight_id in flight_ids:
+            origin = self.origins[flight_id] if flight_id < len(self.origins) else 0
+            if origin:
+                editable(origin).remove(flight_id)
+                self.origins[flight_id] = 0
+        for flight_id, origin, departs, arrives, cost, destination in rows:
+            editable(origin).insert(flight_id, departs, arrives, cost, destination)
+            _store(self.origins, flight_id, origin)
+            self.max_flight_id = max(self.max_flight_id, flight_id)
+
+        for airport_id, departures in touched.items():
+            self.departures[airport_id] = departures
+
+    def _rows(self, queryset):
+        """
+        Yields (id, departure airport, departs, arrives, cost in cents, arrival airport) for flights.
+        """
+        rows = queryset.values_list(
+            'id', 'departure_airport_id', 'departure_time', 'arrival_time', 'cost', 'arrival_airport_id'
+        )
+        for flight_id, origin, departs, arrives, cost, destination in rows.iterator(chunk_size=10000):
+            yield flight_id, origin, int(departs.timestamp()), int(arrives.timestamp()), int(cost * 100), destination
+
+    def _load_min_connection(self):
+        """
+        Returns airport id -> minimum connection time in seconds.
+        """
+        return {
+            airport_id: int(security_time.total_seconds())
+            for airport_id, security_time in Airport.objects.values_list('id', 'avg_security_time')
+        }
+
+    def search(self, origin, destination, depart_from, depart_until, k=5, max_legs=DEFAULT_MAX_LEGS,
+               sort='cheapest', max_layover=DEFAULT_MAX_LAYOVER):
+        """
+        Returns up to k tuples of flight ids from `origin` to `destination`, best first.
+
+        The first flight departs in [depart_from, depart_until) (epoch seconds) and
+        itineraries have at most `max_legs` flights and never visit an airport twice.
+        `sort` is 'cheapest' (total cost, then duration) or 'fastest' (duration, then cost).
+        """
+        departures = self.departures  # Refreshes swap whole entries, never edit them
+        start = departures.get(origin)
+        if start is None or origin == destination or max_legs < 1:
+            return []
+
+        fastest = sort == 'fastest'
+        layover = int(max_layover.total_seconds())
+        tie = itertools.count()  # Keeps heap order stable without comparing labels
+        heap = []
+
+        def push(airport, arrives, departs, cost, flights, visited):
+            key = (arrives - departs, cost) if fastest else (cost, arrives - departs)
+            heapq.heappush(heap, (key, next(tie), airport, arrives, departs, cost, flights, visited))
+
+        for i in range(bisect_left(start.times, depart_from), bisect_left(start.times, depart_until)):
+            to = start.destinations[i]
+            if to != origin and (max_legs > 1 or to == destination):
+                push(to, start.arrivals[i], start.times[i], start.costs[i], (start.flight_ids[i],), (origin, to))
+
+        results = []
+        settled = {}  # Airport id -> (arrives, departs, cost, legs) of labels expanded there
+        expanded = 0
+        while heap and len(results) < k and expanded < MAX_LABELS:
+            _, _, airport, arrives, departs, cost, flights, visited = heapq.heappop(heap)
+            if airport == destination:
+                results.append(flights)
+                continue
+
+            # Labels popped earlier are at least as good on the sort key; prune once k also
+            # arrive no later with no more legs (and, for fastest, set off no earlier).
+            legs = len(flights)
+            seen = settled.setdefault(airport, [])
+            beaten = 0
+            for seen_arrives, seen_departs, seen_cost, seen_legs in seen:
+                if seen_arrives <= arrives and seen_legs <= legs and (
+                    seen_departs >= departs if fastest else seen_cost <= cost
+                ):
+                    beaten += 1
+                    if beaten >= k:
+                        break
+            if beaten >= k:
+                continue
+            seen.append((arrives, departs, cost, legs))
+            expanded += 1
+
+            onward = departures.get(airport)
+            if onward is None or legs >= max_legs:
+                continue
+            ready = arrives + self.min_connection.get(airport, 0)
+            last = bisect_right(onward.times, arrives + layover)
+            for i in range(bisect_left(onward.times, ready), last):
+                to = onward.destinations[i]
+                if to in visited or (legs + 1 == max_legs and to != destination):
+                    continue
+                push(to, onward.arrivals[i], departs, cost + onward.costs[i],
+                     flights + (onward.flight_ids[i],), visited + (to,))
+        return results
+
+
+class Itinerary:
+    """
+    One or more connecting flights from an origin to a destination.
+    """
+
+    def __init__(self, flights):
+        self.flights = flights
+        self.total_cost = sum((flight.cost for flight in flights), Decimal('0'))
+        self.departure_time = flights[0].departure_time
+        self.arrival_time = flights[-1].arrival_time
+        self.duration = self.arrival_time - self.departure_time
+        self.stops = len(flights) - 1
+        # (connecting airport, time on the ground) for every connection
+        self.layovers = [
+            (first.arrival_airport, second.departure_time - first.arrival_time)
+            for first, second in zip(flights, flights[1:])
+        ]
+
+
+def _store(origins, flight_id, origin):
+    """
+    Records a flight's departure airport, growing the id-indexed array as needed.
+    """
+    if flight_id >= len(origins):
+        origins.frombytes(bytes(origins.itemsize * max(flight_id + 1 - len(origins), len(origins))))
+    origins[flight_id] = origin
+
+
+def _still_connects(flights):
+    """
+    Checks that loaded flights still form a bookable itinerary, in case they
+    changed in another process after the graph was refreshed.
+    """
+    if any(flight.seats_left == 0 for flight in flights):
+        return False
+    return all(
+        first.arrival_airport_id == second.departure_airport_id and first.arrival_time < second.departure_time
+        for first, second in zip(flights, flights[1:])
+    )
+
+
+itinerary_graph = FlightGraph()
+
+
+def find_itineraries(origin_id, destination_id, day, k=5, max_legs=DEFAULT_MAX_LEGS, sort='cheapest',
+                     max_layover=DEFAULT_MAX_LAYOVER, graph=None):
+    """
+    Returns up to k Itinerary objects from one airport to another, with the first
+    flight departing on `day` (a date in the current time zone).
+    """
+    graph = graph or itinerary_graph
+    graph.refresh()
+    depart_from = int(start_of_day(day).timestamp())
+    if day < date.max:
+        depart_until = int(start_of_day(day + timedelta(days=1)).timestamp())
+    else:  # The next day is past datetime.max; the graph only needs the timestamp
+        depart_until = depart_from + 24 * 60 * 60
+    paths = graph.search(
+        origin_id, destination_id, depart_from, depart_until,
+        k=k, max_legs=max_legs, sort=sort, max_layover=max_layover,
+    )
+
+    flight_ids = {flight_id for path in paths for flight_id in path}
+    flights = Flight.objects.select_related('departure_airport', 'arrival_airport').in_bulk(flight_ids)
+    itineraries = []
+    for path in paths:
+        legs = [flights.get(flight_id) for flight_id in path]
+        if None not in legs and _still_connects(legs):
+            itineraries.append(Itinerary(legs))
+    return itineraries
@@ -0,0 +1,76 @@
+# File: archive_flights.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that moves departed flights into the archive table
+
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from flights.archive import BATCH_SIZE, archive_flights
+
+"""
+Usage:
+    python manage.py archive_flights --before 2024-12-01             # Flights departing before that day
+    python manage.py archive_flights --before 2024-12-01T06:00:00Z
+    python manage.py archive_flights --before now --batch-size 5000
+
+Moves flights departing before the cutoff from the live flights table into
+FlightArchive, a batch per transaction (see flights/archive.py). Carts
+holding them keep their lines. An interrupted run can simply be started
+again; it picks up with the oldest flight still in the live table.
+"""
+
+
+class Command(BaseCommand):
+    """
+    Archives departed flights in batches.
+    """
+    help = "Move flights departing before a cutoff into the flight archive."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--before", required=True,
+                            help="Cutoff: YYYY-MM-DD (midnight, site time zone), an ISO datetime or 'now'")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Flights moved per transaction")
+
+    def handle(self, *args, **options):
+        """
+        Archives every flight before the cutoff and reports how many were moved.
+        """
+        before = self.parse_cutoff(options["before"])
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if before > timezone.now():
+            raise CommandError("--before is in the future; only departed flights can be archived.")
+
+        started = time.perf_counter()
+        moved = archive_flights(
+            before, batch_size=options["batch_size"],
+            progress=lambda moved: self.stdout.write(f"Archived {moved} flights..."),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} flights departing before {before.isoformat()} "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def parse_cutoff(self, value):
+        """
+        Returns the cutoff as an aware datetime.
+        """
+        if value == "now":
+            return timezone.now()
+        try:
+            moment = parse_datetime(value)
+            day = None if moment else parse_date(value)
+        except ValueError:
+            moment = day = None
+        if day:
+            moment = datetime.combine(day, datetime.min.time())
+        if moment is None:
+            raise CommandError(f"Invalid --before value: {value!r}")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment, timezone.get_default_timezone())
+        return moment
@@ -0,0 +1,38 @@
+# File: fragment_cache_stats.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that reports the fragment cache hit rates
+
+import json
+from django.core.management.base import BaseCommand
+from flights.fragments import fragment_stats
+
+"""
+Usage:
+    python manage.py fragment_cache_stats           # One line per fragment template
+    python manage.py fragment_cache_stats --json
+"""
+
+
+class Command(BaseCommand):
+    """
+    Prints the hits, misses and hit rate of every cached fragment template.
+    """
+    help = "Report hit rates of the cached flight cards and board rows."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--json", action="store_true", help="Print the counters as JSON")
+
+    def handle(self, *args, **options):
+        """
+        Reads the counters from the cache and prints them.
+        """
+        stats = fragment_stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        for name, counters in stats.items():
+            rate = "n/a" if counters["hit_rate"] is None else f"{counters['hit_rate']:.1%}"
+            self.stdout.write(f"{name}: {counters['hits']} hits, {counters['misses']} misses, hit rate {rate}")
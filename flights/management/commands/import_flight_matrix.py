@@ -0,0 +1,140 @@
+# File: import_flight_matrix.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that imports flights for every route and
+# date in a matrix, fetching from SerpAPI in parallel
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from flights.ingest import normalize_payload, ingest_rows, merge_rows, empty_rows
+from flights.serpapi_client import SerpApiClient
+
+"""
+Usage:
+    python manage.py import_flight_matrix --routes BOS-HND,HND-ICN \
+        --start-date 2024-12-20 --end-date 2024-12-27 --concurrency 8
+
+Every (route, date) pair becomes one SerpAPI query. Queries run on a bounded
+thread pool that shares one pooled SerpApiClient, while the main thread acts
+as the single database writer, merging payloads and flushing them through the
+ingest engine every --batch-size results. The response cache is bypassed so
+every run sees fresh fares.
+"""
+
+
+def parse_routes(value):
+    """
+    Parses 'BOS-HND,HND-ICN' into [('BOS', 'HND'), ('HND', 'ICN')].
+    """
+    routes = []
+    for item in value.replace("\n", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            departure, arrival = [code.strip().upper() for code in item.split("-")]
+        except ValueError:
+            raise CommandError(f"Invalid route '{item}', expected ORIGIN-DESTINATION")
+        routes.append((departure, arrival))
+    return routes
+
+
+def date_range(start, end):
+    """
+    Returns every date from start to end, inclusive.
+    """
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+class Command(BaseCommand):
+    """
+    Imports flights for a route x date matrix with concurrent SerpAPI queries.
+    """
+    help = "Import flights for every route and date in a range using parallel SerpAPI queries."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        routes = parser.add_mutually_exclusive_group(required=True)
+        routes.add_argument("--routes", help="Comma separated routes, e.g. BOS-HND,HND-ICN")
+        routes.add_argument("--routes-file", help="File with one ORIGIN-DESTINATION route per line")
+        parser.add_argument("--start-date", required=True, type=date.fromisoformat, help="First outbound date (YYYY-MM-DD)")
+        parser.add_argument("--end-date", type=date.fromisoformat, help="Last outbound date (defaults to --start-date)")
+        parser.add_argument("--concurrency", type=int, default=8, help="Number of queries in flight at once")
+        parser.add_argument("--batch-size", type=int, default=50, help="Payloads merged into each database write")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+        parser.add_argument("--endpoint", help="SerpAPI search endpoint (defaults to the configured endpoint)")
+        parser.add_argument("--api-key", help="SerpAPI key (defaults to settings.SERPAPI_API_KEY)")
+
+    def handle(self, *args, **options):
+        """
+        Fans the queries out over the thread pool and writes the results in batches.
+        """
+        if options["routes_file"]:
+            with open(options["routes_file"]) as f:
+                routes = parse_routes(f.read())
+        else:
+            routes = parse_routes(options["routes"])
+        end_date = options["end_date"] or options["start_date"]
+        if end_date < options["start_date"]:
+            raise CommandError("--end-date must not be before --start-date")
+        if options["concurrency"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--concurrency and --batch-size must be positive")
+
+        jobs = [(departure, arrival, day) for departure, arrival in routes
+                for day in date_range(options["start_date"], end_date)]
+
+        client = SerpApiClient(
+            api_key=options["api_key"],
+            endpoint=options["endpoint"],
+            pool_size=options["concurrency"],
+            read_timeout=options["timeout"],
+            cache=None,
+        )
+        started = time.perf_counter()
+        totals = {"queries": len(jobs), "failed": 0, "flights_created": 0, "flights_updated": 0,
+                  "flights_unchanged": 0}
+        pending = empty_rows()
+        pending_payloads = 0
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            futures = {
+                pool.submit(client.google_flights, departure, arrival, day.isoformat()): (departure, arrival, day)
+                for departure, arrival, day in jobs
+            }
+            for future in as_completed(futures):
+                departure, arrival, day = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    totals["failed"] += 1
+                    self.stderr.write(f"{departure}-{arrival} {day}: {e}")
+                    continue
+
+                merge_rows(pending, normalize_payload(data))
+                pending_payloads += 1
+                if pending_payloads >= options["batch_size"]:
+                    self.flush(pending, totals)
+                    pending, pending_payloads = empty_rows(), 0
+
+        self.flush(pending, totals)
+        client.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['queries']} queries ({totals['failed']} failed) in {elapsed:.2f}s "
+            f"({totals['queries'] / elapsed if elapsed else 0:.1f} queries/s): "
+            f"{totals['flights_created']} flights created, {totals['flights_updated']} updated, "
+            f"{totals['flights_unchanged']} unchanged."
+        ))
+
+    def flush(self, rows, totals):
+        """
+        Writes the merged rows through the ingest engine on the calling thread.
+        """
+        counts = ingest_rows(rows)
+        totals["flights_created"] += counts["flights"]["created"]
+        totals["flights_updated"] += counts["flights"]["updated"]
+        totals["flights_unchanged"] += counts["flights"]["unchanged"]
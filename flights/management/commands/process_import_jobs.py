@@ -0,0 +1,41 @@
+# File: process_import_jobs.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that runs queued flight import jobs
+
+from django.core.management.base import BaseCommand
+from flights.import_jobs import process_jobs
+
+"""
+Usage:
+    python manage.py process_import_jobs            # Poll forever
+    python manage.py process_import_jobs --once     # Drain the queue and exit
+
+Run one or more of these next to the web workers. Jobs are claimed with a
+conditional UPDATE, so several workers can poll the same table safely.
+"""
+
+
+class Command(BaseCommand):
+    """
+    Worker loop that processes ImportJob rows queued by the import form.
+    """
+    help = "Process queued flight import jobs."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--max-jobs", type=int, help="Exit after processing this many jobs")
+
+    def handle(self, *args, **options):
+        """
+        Runs the worker loop.
+        """
+        processed = process_jobs(
+            once=options["once"],
+            poll_interval=options["poll_interval"],
+            max_jobs=options["max_jobs"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} import jobs."))
@@ -0,0 +1,40 @@
+# File: rebuild_route_fares.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that recomputes the fare calendar table from the flights
+
+import time
+from django.core.management.base import BaseCommand
+from flights.fares import rebuild_route_fares
+
+"""
+Usage:
+    python manage.py rebuild_route_fares
+
+RouteDayFare rows are kept up to date as flights are saved, deleted and
+imported (see flights/fares.py). After bulk loads or writes made behind the
+app's back, such as raw SQL or queryset.update() on prices, this command
+recomputes every row with one GROUP BY over the flights.
+"""
+
+
+class Command(BaseCommand):
+    """
+    Replaces the RouteDayFare table with fares computed from the flights.
+    """
+    help = "Recompute the cheapest fare of every route and day from the flights."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows per INSERT")
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the table and reports how many route days it holds.
+        """
+        started = time.perf_counter()
+        written = rebuild_route_fares(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} route days in {time.perf_counter() - started:.1f}s."
+        ))
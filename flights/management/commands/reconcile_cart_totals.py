@@ -0,0 +1,51 @@
+# File: reconcile_cart_totals.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that checks stored cart totals against the cart lines
+
+from django.core.management.base import BaseCommand
+from flights.cart_totals import find_drift, repair_cart
+
+"""
+Usage:
+    python manage.py reconcile_cart_totals          # Report carts whose totals drifted
+    python manage.py reconcile_cart_totals --fix    # Report and repair them
+
+Cart totals are updated incrementally (see flights/cart_totals.py). Changes
+made behind the app's back, such as raw SQL or queryset.update() on prices,
+can make them drift; this command recomputes them from the lines.
+"""
+
+
+class Command(BaseCommand):
+    """
+    Compares ShoppingCart.item_count and subtotal with totals computed from the lines.
+    """
+    help = "Detect (and with --fix, repair) drift in stored shopping cart totals."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--fix", action="store_true", help="Overwrite drifted totals with recomputed ones")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Carts checked per query")
+
+    def handle(self, *args, **options):
+        """
+        Reports every drifted cart and exits with a summary line.
+        """
+        drifted = 0
+        for cart_id, stored, expected in find_drift(batch_size=options["batch_size"]):
+            drifted += 1
+            if options["fix"]:
+                expected = repair_cart(cart_id)
+            self.stdout.write(
+                f"Cart {cart_id}: stored {stored[0]} items / ${stored[1]}, "
+                f"lines add up to {expected[0]} items / ${expected[1]}"
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All cart totals match their lines."))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {drifted} carts."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{drifted} carts have drifted totals. Run with --fix to repair them."))
@@ -0,0 +1,41 @@
+# File: release_expired_holds.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that gives the seats of expired holds back to their flights
+
+import time
+from django.core.management.base import BaseCommand
+from flights.seat_holds import release_expired_holds
+
+"""
+Usage:
+    python manage.py release_expired_holds                  # Release expired holds and exit
+    python manage.py release_expired_holds --interval 60    # Keep sweeping every minute
+
+Run it from cron, or as a long-running process with --interval. Several
+sweepers can run at once without giving a hold's seats back twice.
+"""
+
+
+class Command(BaseCommand):
+    """
+    Sweeper that releases SeatHold rows past their expiry.
+    """
+    help = "Release expired seat holds and return their seats to the flights."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--interval", type=float, help="Sweep every this many seconds instead of once")
+        parser.add_argument("--batch-size", type=int, help="Holds released per transaction")
+
+    def handle(self, *args, **options):
+        """
+        Runs one sweep, or sweeps forever when an interval is given.
+        """
+        while True:
+            released = release_expired_holds(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Released {released} expired seat holds."))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
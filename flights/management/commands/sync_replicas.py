@@ -0,0 +1,55 @@
+# File: sync_replicas.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Management command that copies the primary SQLite database into its replicas
+
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from flights.databases import database_config, sync_replica
+
+"""
+Usage:
+    python manage.py sync_replicas                          # Copy the primary into every replica once
+    python manage.py sync_replicas --interval 2             # Keep copying every two seconds
+    python manage.py sync_replicas --replica replica        # Only this alias
+
+Keeps local SQLite replicas (FLIGHTS_DATABASES["REPLICAS"], or the aliases
+given with --replica) close behind the primary, standing in for the
+replication a production database would do. Run it once before listing a
+replica in REPLICAS, then with an interval well under STICKY_SECONDS.
+"""
+
+
+class Command(BaseCommand):
+    """
+    Copies the primary database into each replica.
+    """
+    help = "Copy the primary SQLite database into its read replicas."
+
+    def add_arguments(self, parser):
+        """
+        Defines the command line options.
+        """
+        parser.add_argument("--replica", action="append", dest="replicas", help="Replica alias (repeatable)")
+        parser.add_argument("--interval", type=float, help="Copy every this many seconds instead of once")
+
+    def handle(self, *args, **options):
+        """
+        Syncs every replica once, or forever when an interval is given.
+        """
+        replicas = options["replicas"] or database_config()["REPLICAS"]
+        if not replicas:
+            raise CommandError("No replicas to sync; pass --replica or set FLIGHTS_DATABASES['REPLICAS'].")
+        while True:
+            for alias in replicas:
+                started = time.perf_counter()
+                try:
+                    sync_replica(alias)
+                except ImproperlyConfigured as e:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.SUCCESS(
+                    f"Synced {alias} in {(time.perf_counter() - started) * 1000:.0f} ms."
+                ))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,349 @@
+# File: metrics.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Per-request timings, the Server-Timing header and Prometheus metrics
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+"""
+RequestMetricsMiddleware splits the time spent on each request into database
+queries (counted and timed by an execute wrapper installed on every new
+connection, see record_queries()), template rendering (timed by the
+TimedDjangoTemplates backend) and outbound HTTP requests (timed by the
+SerpAPI clients through outbound_request()). The
+split is sent back in a Server-Timing header, which browser developer tools
+show next to the request, and added to per-view histograms that
+/flights/metrics serves in the Prometheus text format, together with the
+fragment cache hit counters (see flights/fragments.py).
+
+Histograms live in process memory, like a Prometheus client library's, so
+each worker process reports its own; scrape every worker, or sum them in
+the query. Recording a request costs a few dictionary updates and a clock
+read per query and render, cheap enough to leave on in production.
+Durations end when the view returns its response, so streamed bodies are
+not included.
+
+Configuration comes from the FLIGHTS_METRICS setting.
+"""
+
+DEFAULT_CONFIG = {
+    "ENABLED": True,  # Record requests at all
+    "SERVER_TIMING": True,  # Add the Server-Timing header to responses
+    # Clients allowed to read /flights/metrics besides staff users, matched against REMOTE_ADDR.
+    # Empty by default: behind a reverse proxy every request comes from the proxy's address,
+    # so listing loopback there would make the metrics public.
+    "ALLOWED_IPS": (),
+    "SECONDS_BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "COUNT_BUCKETS": (0, 1, 2, 5, 10, 20, 50, 100, 200),  # For queries and outbound requests per request
+}
+
+# Histogram name -> (RequestTimings attribute or None for the request duration, buckets setting, help text)
+HISTOGRAMS = {
+    "request_duration_seconds": (None, "SECONDS_BUCKETS", "Time spent handling a request."),
+    "db_query_seconds": ("db_seconds", "SECONDS_BUCKETS", "Time spent in database queries per request."),
+    "db_queries": ("db_queries", "COUNT_BUCKETS", "Database queries per request."),
+    "template_render_seconds": ("template_seconds", "SECONDS_BUCKETS", "Time spent rendering templates per request."),
+    "http_request_seconds": ("http_seconds", "SECONDS_BUCKETS", "Time spent in outbound HTTP requests per request."),
+    "http_requests": ("http_requests", "COUNT_BUCKETS", "Outbound HTTP requests per request."),
+}
+
+UNMATCHED_VIEW = "<unmatched>"  # Label for requests that did not resolve to a view
+
+_current = ContextVar("flights_request_timings", default=None)
+
+
+def metrics_config():
+    """
+    Returns the metrics configuration, with FLIGHTS_METRICS overriding the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_METRICS", {})}
+
+
+class RequestTimings:
+    """
+    Query, template and outbound HTTP counts and times for one request.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.http_requests = 0
+        self.http_seconds = 0.0
+        self._rendering = False
+        self._lock = threading.Lock()  # Outbound requests may run on worker threads
+
+    def add_http(self, seconds):
+        """
+        Records one outbound HTTP request.
+        """
+        with self._lock:
+            self.http_requests += 1
+            self.http_seconds += seconds
+
+    def server_timing(self, duration):
+        """
+        Returns the Server-Timing header value for a request that took `duration` seconds.
+        """
+        parts = [
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f"tpl;dur={self.template_seconds * 1000:.1f}",
+        ]
+        if self.http_requests:
+            parts.append(f'http;dur={self.http_seconds * 1000:.1f};desc="{self.http_requests} requests"')
+        parts.append(f"total;dur={duration * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that counts and times each query of the current request.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    """
+    Installs record_query() on every new database connection. Connections are
+    per thread, and async views run their queries on other threads than the
+    middleware, so the wrapper stays installed and looks up the current request
+    (the context variable follows the request into those threads).
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def current_timings():
+    """
+    Returns the RequestTimings of the request being handled, or None outside a request.
+    """
+    return _current.get()
+
+
+@contextmanager
+def outbound_request():
+    """
+    Times the block as one outbound HTTP request of the current request, if any.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_http(time.perf_counter() - started)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Yields (upper bound label, observations at or below it) for each bucket and +Inf.
+        """
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield str(bound), total
+
+
+class MetricsRegistry:
+    """
+    Per-view request histograms and response counters for this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}  # View name -> {histogram name: Histogram}
+        self._responses = {}  # (view name, status code) -> count
+
+    def observe(self, view, status, duration, timings):
+        """
+        Adds one finished request to the view's histograms.
+        """
+        config = metrics_config()
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    name: Histogram(config[buckets]) for name, (_, buckets, _) in HISTOGRAMS.items()
+                }
+            for name, (attribute, _, _) in HISTOGRAMS.items():
+                histograms[name].observe(duration if attribute is None else getattr(timings, attribute))
+            self._responses[(view, status)] = self._responses.get((view, status), 0) + 1
+
+    def reset(self):
+        """
+        Forgets everything recorded so far.
+        """
+        with self._lock:
+            self._views.clear()
+            self._responses.clear()
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        from .fragments import fragment_stats
+
+        lines = []
+        with self._lock:
+            for name, (_, _, help_text) in HISTOGRAMS.items():
+                lines += [f"# HELP flights_{name} {help_text}", f"# TYPE flights_{name} histogram"]
+                for view in sorted(self._views):
+                    histogram = self._views[view][name]
+                    label = f'view="{_escape(view)}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'flights_{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f"flights_{name}_sum{{{label}}} {histogram.sum:.6g}")
+                    lines.append(f"flights_{name}_count{{{label}}} {histogram.count}")
+            lines += ["# HELP flights_responses_total Responses by view and status code.",
+                      "# TYPE flights_responses_total counter"]
+            for (view, status), count in sorted(self._responses.items()):
+                lines.append(f'flights_responses_total{{view="{_escape(view)}",status="{status}"}} {count}')
+
+        for kind in ("hits", "misses"):
+            lines += [f"# HELP flights_fragment_cache_{kind}_total Fragment cache {kind} since the cache was cleared.",
+                      f"# TYPE flights_fragment_cache_{kind}_total counter"]
+            for template, stats in fragment_stats().items():
+                lines.append(f'flights_fragment_cache_{kind}_total{{template="{_escape(template)}"}} {stats[kind]}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metrics_allowed(request):
+    """
+    Returns True if the request may read the metrics: staff users and clients in
+    ALLOWED_IPS, which deployments opt in to for their scrapers.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    return request.META.get("REMOTE_ADDR") in metrics_config()["ALLOWED_IPS"]
+
+
+class RequestMetricsMiddleware:
+    """
+    Records each request's timings, adds the Server-Timing header and feeds the
+    per-view histograms. List it first in MIDDLEWARE so the timings cover the
+    other middleware too. Works with both WSGI and ASGI handlers.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = metrics_config()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = config["SERVER_TIMING"]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    def finish(self, request, response, timings, duration):
+        """
+        Records the finished request and adds the Server-Timing header.
+        """
+        match = getattr(request, "resolver_match", None)
+        registry.observe(match.view_name if match else UNMATCHED_VIEW, response.status_code, duration, timings)
+        if self.server_timing:
+            response.headers["Server-Timing"] = timings.server_timing(duration)
+        return response
+
+
+class TimedTemplate:
+    """
+    Wraps a Django template so rendering it adds to the current request's template time.
+    Templates rendered while another one renders are counted once, as part of the outer one.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None or timings._rendering:
+            return self.template.render(context, request)
+        timings._rendering = True
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings._rendering = False
+            timings.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with render times recorded for RequestMetricsMiddleware.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_airport_image_url'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure_code', models.CharField(max_length=10)),
+                ('arrival_code', models.CharField(max_length=10)),
+                ('outbound_date', models.DateField()),
+                ('departure_city', models.CharField(blank=True, max_length=100)),
+                ('departure_country', models.CharField(blank=True, max_length=100)),
+                ('arrival_city', models.CharField(blank=True, max_length=100)),
+                ('arrival_country', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='queued', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('counts', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='flight_import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_time', 'id'], name='flight_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_flight_departure_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_airport', 'arrival_airport', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_time', 'cost'], name='flight_departure_cost_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Full-text search index for flights (FTS5 on SQLite, tsvector on PostgreSQL)
+
+from django.db import migrations
+
+from flights.search import install_search_index, rebuild_search_index, drop_search_index
+
+
+def create_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+    rebuild_search_index(schema_editor.connection)
+
+
+def remove_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flights", "0007_flight_search_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, remove_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0008_flight_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_airport', 'departure_time'], name='flight_airport_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['arrival_airport', 'arrival_time'], name='flight_airport_arrival_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:32
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def fill_totals(apps, schema_editor):
+    """
+    Computes the new item_count and subtotal columns of existing carts from their lines.
+    """
+    ShoppingCart = apps.get_model('flights', 'ShoppingCart')
+    ShoppingCartFlight = apps.get_model('flights', 'ShoppingCartFlight')
+    ShoppingCartRental = apps.get_model('flights', 'ShoppingCartRental')
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    totals = {}
+    flights = ShoppingCartFlight.objects.values('cart').order_by().annotate(
+        items=Sum('quantity'), amount=Sum(ExpressionWrapper(F('quantity') * F('flight__cost'), money)),
+    )
+    rentals = ShoppingCartRental.objects.values('cart').order_by().annotate(
+        items=Count('id'), amount=Sum(ExpressionWrapper(F('rental_days') * F('rental__rental_cost'), money)),
+    )
+    for row in list(flights) + list(rentals):
+        items, amount = totals.get(row['cart'], (0, 0))
+        totals[row['cart']] = (items + row['items'], amount + row['amount'])
+    for cart_id, (items, amount) in totals.items():
+        ShoppingCart.objects.filter(pk=cart_id).update(item_count=items, subtotal=amount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0009_flight_airport_board_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0010_shoppingcart_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seats', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='flights.shoppingcart')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='flights.flight')),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from flights.search import drop_search_triggers, install_search_index
+
+
+def create_catalog_version(apps, schema_editor):
+    """
+    Creates the single CatalogVersion row.
+    """
+    CatalogVersion = apps.get_model('flights', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(pk=1)
+
+
+def pause_search_triggers(apps, schema_editor):
+    drop_search_triggers(schema_editor.connection)
+
+
+def resume_search_triggers(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0011_seathold'),
+    ]
+
+    operations = [
+        # SQLite rebuilds both tables to add the columns
+        migrations.RunPython(pause_search_triggers, resume_search_triggers),
+        migrations.AddField(
+            model_name='airport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(resume_search_triggers, pause_search_triggers),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_fares(apps, schema_editor):
+    """
+    Computes the cheapest fare of every route and day from the existing flights.
+    """
+    Flight = apps.get_model('flights', 'Flight')
+    RouteDayFare = apps.get_model('flights', 'RouteDayFare')
+    rows = (
+        Flight.objects.annotate(day=TruncDate('departure_time', tzinfo=timezone.get_default_timezone()))
+        .order_by().values_list('departure_airport_id', 'arrival_airport_id', 'day')
+        .annotate(min_cost=Min('cost'), flight_count=Count('id'))
+    )
+    RouteDayFare.objects.bulk_create([
+        RouteDayFare(departure_airport_id=departure_id, arrival_airport_id=arrival_id, date=day,
+                     min_cost=min_cost, flight_count=count)
+        for departure_id, arrival_id, day, min_cost, count in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0012_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDayFare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('min_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('flight_count', models.PositiveIntegerField()),
+                ('arrival_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flights.airport')),
+                ('departure_airport', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flights.airport')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('departure_airport', 'arrival_airport', 'date'), name='route_day_fare_unique')],
+            },
+        ),
+        migrations.RunPython(fill_fares, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:24
+
+from django.db import migrations, models
+
+from flights.search import drop_search_triggers, install_search_index
+
+
+def pause_search_triggers(apps, schema_editor):
+    drop_search_triggers(schema_editor.connection)
+
+
+def resume_search_triggers(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0013_routedayfare'),
+    ]
+
+    operations = [
+        # SQLite rebuilds the flight table to add the column. Existing flights
+        # get an empty hash, so their next import writes them once.
+        migrations.RunPython(pause_search_triggers, resume_search_triggers),
+        migrations.AddField(
+            model_name='flight',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(resume_search_triggers, pause_search_triggers),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0014_flight_source_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppingcartflight',
+            name='flight',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='flights.flight'),
+        ),
+        migrations.CreateModel(
+            name='FlightArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('flight_number', models.CharField(max_length=10)),
+                ('departure_time', models.DateTimeField()),
+                ('arrival_time', models.DateTimeField()),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amenities', models.TextField(blank=True, null=True)),
+                ('seats_left', models.PositiveIntegerField()),
+                ('source_hash', models.CharField(blank=True, editable=False, max_length=32)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('aircraft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flights.aircrafttype')),
+                ('arrival_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_arrivals', to='flights.airport')),
+                ('departure_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_departures', to='flights.airport')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shoppingcartflight',
+            name='archived_flight',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cart_lines', to='flights.flightarchive'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartflight',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('archived_flight__isnull', True), ('flight__isnull', False)), models.Q(('archived_flight__isnull', False), ('flight__isnull', True)), _connector='OR'), name='cart_flight_live_or_archived'),
+        ),
+        migrations.AddIndex(
+            model_name='flightarchive',
+            index=models.Index(fields=['departure_time', 'id'], name='flight_archive_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightarchive',
+            index=models.Index(fields=['departure_airport', 'arrival_airport', 'departure_time'], name='flight_archive_route_idx'),
+        ),
+    ]
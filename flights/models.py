@@ -4,7 +4,6 @@
 
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Sum
 from datetime import timedelta
 
 """
@@ -29,6 +28,7 @@ class Airport(models.Model):
     amenities = models.TextField(blank=True, null=True)  # List of amenities available
     avg_security_time = models.DurationField(default=timedelta(minutes=30))  # Default to 30 mins
     image_url = models.URLField(blank=True)  # Optional image URL for the airport
+    updated_at = models.DateTimeField(auto_now=True)  # Last change, for conditional GETs
 
     def __str__(self):
         """
@@ -69,6 +69,21 @@ class Flight(models.Model):
     aircraft = models.ForeignKey(AircraftType, on_delete=models.CASCADE)  # Aircraft used
     amenities = models.TextField(blank=True, null=True)  # Specific amenities for this flight
     seats_left = models.PositiveIntegerField()  # Number of seats left to book
+    updated_at = models.DateTimeField(auto_now=True)  # Last change, for conditional GETs
+    source_hash = models.CharField(max_length=32, blank=True, editable=False)  # Hash of the imported SerpAPI fields, see ingest.py
+
+    class Meta:
+        indexes = [
+            # Sort key of the flight list, used by keyset pagination
+            models.Index(fields=['departure_time', 'id'], name='flight_departure_idx'),
+            # Route searches, optionally narrowed to a departure date range
+            models.Index(fields=['departure_airport', 'arrival_airport', 'departure_time'], name='flight_route_departure_idx'),
+            # Date range searches filtered on price
+            models.Index(fields=['departure_time', 'cost'], name='flight_departure_cost_idx'),
+            # Airport departure and arrival boards
+            models.Index(fields=['departure_airport', 'departure_time'], name='flight_airport_departure_idx'),
+            models.Index(fields=['arrival_airport', 'arrival_time'], name='flight_airport_arrival_idx'),
+        ]
 
     def __str__(self):
         """
@@ -85,6 +100,51 @@ class Flight(models.Model):
         """
         return self.arrival_time - self.departure_time
 
+# Departed flights moved out of the flights table
+class FlightArchive(models.Model):
+    """
+    Represents a departed flight moved out of Flight by `archive_flights`
+    (see flights/archive.py). It keeps the flight's id, so cart lines and old
+    links still name the same flight, and the values the flight had when it
+    was archived.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The flight's id in Flight
+    flight_number = models.CharField(max_length=10)  # Flight numbers may be reused by later live flights
+    departure_airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='archived_departures')
+    arrival_airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='archived_arrivals')
+    departure_time = models.DateTimeField()  # Scheduled departure time
+    arrival_time = models.DateTimeField()  # Scheduled arrival time
+    cost = models.DecimalField(max_digits=10, decimal_places=2)  # Last cost of the flight
+    aircraft = models.ForeignKey(AircraftType, on_delete=models.CASCADE, related_name='+')  # Aircraft used
+    amenities = models.TextField(blank=True, null=True)  # Specific amenities for this flight
+    seats_left = models.PositiveIntegerField()  # Seats left when the flight was archived
+    source_hash = models.CharField(max_length=32, blank=True, editable=False)  # Copied from Flight
+    updated_at = models.DateTimeField()  # Last change while the flight was live
+    archived_at = models.DateTimeField(auto_now_add=True)  # When the flight was moved here
+
+    class Meta:
+        indexes = [
+            # Sort key of the flight list when it includes history
+            models.Index(fields=['departure_time', 'id'], name='flight_archive_departure_idx'),
+            # History searches on a route
+            models.Index(fields=['departure_airport', 'arrival_airport', 'departure_time'], name='flight_archive_route_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the archived flight, displaying its
+        flight number, departure airport code, and arrival airport code.
+        """
+        return f"{self.flight_number}: {self.departure_airport.code} to {self.arrival_airport.code} (archived)"
+
+    @property
+    def flight_duration(self):
+        """
+        Calculates and returns the duration of the flight as the
+        difference between the arrival and departure times.
+        """
+        return self.arrival_time - self.departure_time
+
 # Airplane Rentals model
 class AirplaneRental(models.Model):
     """
@@ -114,6 +174,9 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE, 
         related_name="shopping_cart"
     )  # Link each shopping cart to one user
+    # Running totals kept up to date by flights/cart_totals.py
+    item_count = models.PositiveIntegerField(default=0)  # Flight tickets plus rentals
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # Flights x quantity plus rentals x days
 
     def __str__(self):
         """
@@ -125,28 +188,48 @@ class ShoppingCart(models.Model):
     @property
     def total_price(self):
         """
-        Calculates and returns the total price of all flights in the 
-        shopping cart. Rentals can be added later.
+        Returns the total price of the flights and rentals in the shopping
+        cart, maintained on the row as lines and prices change.
         """
-        flights_total = self.cart_flights.filter(cart=self).aggregate(total=Sum('flight__cost'))['total'] or 0
-        return flights_total
+        return self.subtotal
 
 # Relationship between ShoppingCart and Flight
 class ShoppingCartFlight(models.Model):
     """
     Represents the relationship between a shopping cart and a flight, 
-    allowing users to add multiple flights to their cart.
+    allowing users to add multiple flights to their cart. Once the flight
+    is archived the line points at its FlightArchive row instead.
     """
     cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name='cart_flights')  # Cart reference
-    flight = models.ForeignKey(Flight, on_delete=models.CASCADE)  # Flight reference
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, null=True, blank=True)  # Flight reference
+    archived_flight = models.ForeignKey(
+        FlightArchive, on_delete=models.CASCADE, null=True, blank=True, related_name='cart_lines'
+    )  # Set instead of flight once the flight is archived
     quantity = models.PositiveIntegerField(default=1)  # Optional, e.g., if one user books multiple tickets
 
+    class Meta:
+        constraints = [
+            # Every line names exactly one flight, live or archived
+            models.CheckConstraint(
+                condition=models.Q(flight__isnull=False, archived_flight__isnull=True)
+                | models.Q(flight__isnull=True, archived_flight__isnull=False),
+                name='cart_flight_live_or_archived',
+            ),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the shopping cart flight, 
         displaying the username and flight number.
         """
-        return f"{self.cart.user.username}'s Cart - Flight {self.flight.flight_number}"
+        return f"{self.cart.user.username}'s Cart - Flight {self.flight_record.flight_number}"
+
+    @property
+    def flight_record(self):
+        """
+        Returns the line's Flight, or its FlightArchive row once the flight is archived.
+        """
+        return self.flight if self.flight_id is not None else self.archived_flight
 
 # Relationship between ShoppingCart and AirplaneRental
 class ShoppingCartRental(models.Model):
@@ -165,6 +248,25 @@ class ShoppingCartRental(models.Model):
         """
         return f"{self.cart.user.username}'s Cart - Rental {self.rental.aircraft}"
 
+# Seats held for a flight added to a shopping cart
+class SeatHold(models.Model):
+    """
+    Represents seats taken off a flight's seats_left for a shopping cart until
+    they expire. Created and released by flights/seat_holds.py.
+    """
+    cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name='seat_holds')  # Cart holding the seats
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name='seat_holds')  # Flight the seats are on
+    seats = models.PositiveIntegerField(default=1)  # Number of seats held
+    created_at = models.DateTimeField(auto_now_add=True)  # When the seats were held
+    expires_at = models.DateTimeField(db_index=True)  # When the sweeper gives the seats back
+
+    def __str__(self):
+        """
+        Returns a string representation of the seat hold, displaying the
+        seats, flight and expiry.
+        """
+        return f"{self.seats} seats on {self.flight_id} until {self.expires_at}"
+
 # Profile model for additional user preferences
 class Profile(models.Model):
     """
@@ -180,3 +282,107 @@ class Profile(models.Model):
         the username.
         """
         return f"{self.user.username}'s Profile"
+
+# Background flight import job
+class ImportJob(models.Model):
+    """
+    Represents a queued flight import for one route and date. Jobs are created
+    by the import form and processed by the `process_import_jobs` worker, which
+    records progress, per-entity counts and any error on the row.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='flight_import_jobs')
+    departure_code = models.CharField(max_length=10)  # Departure airport code to query
+    arrival_code = models.CharField(max_length=10)  # Arrival airport code to query
+    outbound_date = models.DateField()  # Date of the flights to import
+    departure_city = models.CharField(max_length=100, blank=True)  # City given to new departure airports
+    departure_country = models.CharField(max_length=100, blank=True)  # Country given to new departure airports
+    arrival_city = models.CharField(max_length=100, blank=True)  # City given to new arrival airports
+    arrival_country = models.CharField(max_length=100, blank=True)  # Country given to new arrival airports
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent complete
+    counts = models.JSONField(default=dict, blank=True)  # Created/updated counts from the ingest engine
+    error = models.TextField(blank=True)  # Error message if the import failed
+    created_at = models.DateTimeField(auto_now_add=True)  # When the job was queued
+    started_at = models.DateTimeField(null=True, blank=True)  # When a worker claimed the job
+    finished_at = models.DateTimeField(null=True, blank=True)  # When the job succeeded or failed
+
+    def __str__(self):
+        """
+        Returns a string representation of the import job, displaying the
+        route, date and status.
+        """
+        return f"Import {self.departure_code} to {self.arrival_code} on {self.outbound_date} ({self.status})"
+
+    @property
+    def is_finished(self):
+        """
+        Returns True once the job has succeeded or failed.
+        """
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def as_status(self):
+        """
+        Returns the job state as a JSON-serializable dict for status polling.
+        """
+        return {
+            "id": self.pk,
+            "status": self.status,
+            "progress": self.progress,
+            "counts": self.counts,
+            "error": self.error,
+            "finished": self.is_finished,
+        }
+
+# Catalog-wide change marker
+class CatalogVersion(models.Model):
+    """
+    A single row whose version goes up whenever a flight or airport is added,
+    changed or removed. List pages derive their ETags from it, so checking
+    whether anything changed is one primary key lookup (see flights/conditional.py).
+    """
+    version = models.PositiveBigIntegerField(default=0)  # Bumped on every catalog change
+    updated_at = models.DateTimeField(auto_now=True)  # When the catalog last changed
+
+    def __str__(self):
+        """
+        Returns a string representation of the catalog version.
+        """
+        return f"Catalog version {self.version} ({self.updated_at})"
+
+# Cheapest fare per route and day
+class RouteDayFare(models.Model):
+    """
+    Represents the flights on one route departing on one day, summarized as
+    their lowest cost and their number. Kept up to date from flight writes by
+    flights/fares.py and read by the fare calendar instead of Flight.
+    """
+    # The unique constraint below leads with the departure airport, so it needs no index of its own
+    departure_airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='+', db_index=False)
+    arrival_airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()  # Departure day in the site's time zone
+    min_cost = models.DecimalField(max_digits=10, decimal_places=2)  # Cheapest flight of the day
+    flight_count = models.PositiveIntegerField()  # Flights on the route that day
+
+    class Meta:
+        constraints = [
+            # One row per route and day; its index serves the calendar's month range scans
+            models.UniqueConstraint(fields=['departure_airport', 'arrival_airport', 'date'], name='route_day_fare_unique'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the route day, displaying the
+        airports, day and lowest cost.
+        """
+        return f"{self.departure_airport_id} to {self.arrival_airport_id} on {self.date}: from ${self.min_cost}"
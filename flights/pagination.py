@@ -0,0 +1,176 @@
+# File: pagination.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Keyset (seek) pagination for large flight querysets
+
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+"""
+Django's Paginator counts the whole queryset and then reads pages with
+OFFSET, so deep pages get slower as the table grows. KeysetPaginator instead
+remembers the sort key of the last row it returned and asks the database for
+the rows that sort after it. With an index on the sort key, every page costs
+the same no matter how deep it is.
+
+Cursors are opaque, URL-safe tokens that hold the sort key values of the
+boundary row and the direction to read in. The total count is optional:
+'exact' runs COUNT(*), 'approx' counts at most `approx_limit` rows, and
+'none' skips counting entirely.
+"""
+
+COUNT_MODES = ('none', 'approx', 'exact')
+
+
+class InvalidCursor(Exception):
+    """
+    Raised when a cursor token cannot be decoded for this paginator.
+    """
+
+
+class KeysetPage:
+    """
+    One page of results with the cursors needed to move forwards and backwards.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor, total_count=None, total_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total_count = total_count
+        self.total_is_estimate = total_is_estimate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset on a unique sort key such as ('departure_time', 'id').
+
+    `ordering` lists model field names, optionally prefixed with '-' for
+    descending order. The last field must be unique so that every row has a
+    distinct position.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('departure_time', 'id'), count='none', approx_limit=1000):
+        if count not in COUNT_MODES:
+            count = 'none'
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.count_mode = count
+        self.approx_limit = approx_limit
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        """
+        Returns the token that continues reading past `obj` in `direction` ('next' or 'prev').
+        `obj` is a model instance, or a dict from a values() queryset that includes the sort fields.
+        """
+        values = []
+        for name in self.fields:
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, self._attname(name))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        payload = json.dumps({"k": values, "d": direction}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """
+        Returns (values, direction) for a token, or raises InvalidCursor.
+        """
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            raw_values, direction = payload["k"], payload["d"]
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.fields):
+                raise ValueError("cursor does not match this ordering")
+            values = [
+                self.queryset.model._meta.get_field(name).to_python(raw)
+                for name, raw in zip(self.fields, raw_values)
+            ]
+        except (ValueError, KeyError, TypeError, binascii.Error, ValidationError) as e:
+            raise InvalidCursor(str(e))
+        if any(value is None for value in values):
+            raise InvalidCursor("cursor values cannot be null")
+        return values, direction
+
+    def page(self, cursor=None):
+        """
+        Returns the KeysetPage that starts at `cursor`, or the first page when it is empty.
+        """
+        direction = 'next'
+        queryset = self.queryset
+        if cursor:
+            values, direction = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._seek_filter(values, forwards=(direction == 'next')))
+
+        if direction == 'next':
+            ordering = self.ordering
+        else:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+
+        if direction == 'next':
+            has_next, has_previous = has_more, bool(cursor)
+        else:
+            has_next, has_previous = True, has_more
+
+        total_count, total_is_estimate = self.count()
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'next') if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'prev') if rows and has_previous else None,
+            total_count=total_count,
+            total_is_estimate=total_is_estimate,
+        )
+
+    def count(self):
+        """
+        Returns (count, is_estimate) according to the count mode.
+        """
+        if self.count_mode == 'exact':
+            return self.queryset.count(), False
+        if self.count_mode == 'approx':
+            capped = self.queryset.order_by()[:self.approx_limit + 1].count()
+            return min(capped, self.approx_limit), capped > self.approx_limit
+        return None, False
+
+    def _seek_filter(self, values, forwards):
+        """
+        Builds the row-value comparison (a, b) > (x, y) as
+        a > x OR (a = x AND b > y), honouring each field's direction.
+        """
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            after = forwards != self.descending[i]
+            term = Q(**{f'{name}__{"gt" if after else "lt"}': values[i]})
+            for prior, value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prior: value})
+            condition |= term
+        return condition
+
+    def _attname(self, name):
+        """
+        Returns the attribute holding a field's raw value ('departure_airport' -> 'departure_airport_id').
+        """
+        return self.queryset.model._meta.get_field(name).attname
@@ -0,0 +1,328 @@
+# File: search.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Full-text search over flights and their airports
+
+import re
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+"""
+The flight list used to search with `flight_number__icontains`, a leading
+wildcard LIKE that cannot use an index and only looks at one column. This
+module keeps a full-text index with one document per flight, covering the
+flight number, the code, name, city and country of both airports, and the
+flight and airport amenities.
+
+- SQLite: an FTS5 virtual table, flights_flight_fts, whose rowid is the flight id.
+- PostgreSQL: a side table, flights_flight_search, holding a weighted tsvector
+  per flight with a GIN index.
+
+Both are kept in sync by database triggers rather than Django signals, so
+bulk_create upserts from the ingest engine are indexed too. Table rebuilds
+during SQLite migrations drop triggers, so install_search_index() runs again
+after every migrate (see FlightsConfig.ready). Other backends fall back to
+case-insensitive matching without an index.
+"""
+
+SQLITE_TABLE = "flights_flight_fts"
+POSTGRES_TABLE = "flights_flight_search"
+
+# Columns the SQLite index is built from, for the flights matched by {where}
+SQLITE_DOCUMENT_SELECT = """
+    SELECT f.id,
+           f.flight_number || ' ' || replace(f.flight_number, ' ', ''),
+           d.code || ' ' || d.name || ' ' || d.city || ' ' || d.country || ' ' ||
+           a.code || ' ' || a.name || ' ' || a.city || ' ' || a.country,
+           coalesce(f.amenities, '') || ' ' || coalesce(d.amenities, '') || ' ' || coalesce(a.amenities, '')
+    FROM flights_flight f
+    JOIN flights_airport d ON d.id = f.departure_airport_id
+    JOIN flights_airport a ON a.id = f.arrival_airport_id
+    WHERE {where}
+"""
+SQLITE_INSERT = f"INSERT INTO {SQLITE_TABLE} (rowid, flight_number, airports, amenities) " + SQLITE_DOCUMENT_SELECT
+
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE}
+        USING fts5(flight_number, airports, amenities, tokenize = 'unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER IF NOT EXISTS flights_flight_fts_insert AFTER INSERT ON flights_flight BEGIN
+        {SQLITE_INSERT.format(where="f.id = new.id")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flights_flight_fts_update
+        AFTER UPDATE OF flight_number, departure_airport_id, arrival_airport_id, amenities ON flights_flight BEGIN
+        DELETE FROM {SQLITE_TABLE} WHERE rowid = old.id;
+        {SQLITE_INSERT.format(where="f.id = new.id")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flights_flight_fts_delete AFTER DELETE ON flights_flight BEGIN
+        DELETE FROM {SQLITE_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flights_airport_fts_update
+        AFTER UPDATE OF code, name, city, country, amenities ON flights_airport BEGIN
+        DELETE FROM {SQLITE_TABLE} WHERE rowid IN (
+            SELECT id FROM flights_flight WHERE departure_airport_id = new.id OR arrival_airport_id = new.id
+        );
+        {SQLITE_INSERT.format(where="f.departure_airport_id = new.id OR f.arrival_airport_id = new.id")};
+    END""",
+]
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS flights_flight_fts_insert",
+    "DROP TRIGGER IF EXISTS flights_flight_fts_update",
+    "DROP TRIGGER IF EXISTS flights_flight_fts_delete",
+    "DROP TRIGGER IF EXISTS flights_airport_fts_update",
+]
+SQLITE_DROP = SQLITE_DROP_TRIGGERS + [f"DROP TABLE IF EXISTS {SQLITE_TABLE}"]
+SQLITE_REBUILD = [
+    f"DELETE FROM {SQLITE_TABLE}",
+    SQLITE_INSERT.format(where="1 = 1"),
+]
+
+POSTGRES_INSTALL = [
+    f"""CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} (
+        flight_id bigint PRIMARY KEY REFERENCES flights_flight (id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_idx ON {POSTGRES_TABLE} USING GIN (document)",
+    f"""CREATE OR REPLACE FUNCTION flights_flight_search_refresh(ids bigint[]) RETURNS void AS $$
+    BEGIN
+        DELETE FROM {POSTGRES_TABLE} WHERE flight_id = ANY(ids);
+        INSERT INTO {POSTGRES_TABLE} (flight_id, document)
+        SELECT f.id,
+               setweight(to_tsvector('simple', f.flight_number || ' ' || replace(f.flight_number, ' ', '')), 'A') ||
+               setweight(to_tsvector('simple', concat_ws(' ', d.code, d.name, d.city, d.country,
+                                                        a.code, a.name, a.city, a.country)), 'B') ||
+               setweight(to_tsvector('simple', concat_ws(' ', f.amenities, d.amenities, a.amenities)), 'C')
+        FROM flights_flight f
+        JOIN flights_airport d ON d.id = f.departure_airport_id
+        JOIN flights_airport a ON a.id = f.arrival_airport_id
+        WHERE f.id = ANY(ids);
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION flights_flight_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM flights_flight_search_refresh(ARRAY[NEW.id]);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION flights_airport_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM flights_flight_search_refresh(ARRAY(
+            SELECT id FROM flights_flight WHERE departure_airport_id = NEW.id OR arrival_airport_id = NEW.id
+        ));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS flights_flight_search_sync ON flights_flight",
+    """CREATE TRIGGER flights_flight_search_sync
+        AFTER INSERT OR UPDATE OF flight_number, departure_airport_id, arrival_airport_id, amenities ON flights_flight
+        FOR EACH ROW EXECUTE FUNCTION flights_flight_search_trigger()""",
+    "DROP TRIGGER IF EXISTS flights_airport_search_sync ON flights_airport",
+    """CREATE TRIGGER flights_airport_search_sync
+        AFTER UPDATE OF code, name, city, country, amenities ON flights_airport
+        FOR EACH ROW EXECUTE FUNCTION flights_airport_search_trigger()""",
+]
+POSTGRES_DROP = [
+    "DROP TRIGGER IF EXISTS flights_flight_search_sync ON flights_flight",
+    "DROP TRIGGER IF EXISTS flights_airport_search_sync ON flights_airport",
+    "DROP FUNCTION IF EXISTS flights_airport_search_trigger()",
+    "DROP FUNCTION IF EXISTS flights_flight_search_trigger()",
+    "DROP FUNCTION IF EXISTS flights_flight_search_refresh(bigint[])",
+    f"DROP TABLE IF EXISTS {POSTGRES_TABLE}",
+]
+POSTGRES_REBUILD = [
+    "SELECT flights_flight_search_refresh(ARRAY(SELECT id FROM flights_flight))",
+]
+
+INSTALL_SQL = {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}
+DROP_SQL = {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}
+REBUILD_SQL = {"sqlite": SQLITE_REBUILD, "postgresql": POSTGRES_REBUILD}
+
+
+def has_search_index(using=None):
+    """
+    Returns True if the database behind `using` keeps a full-text index.
+    """
+    return (connections[using] if using else connection).vendor in INSTALL_SQL
+
+
+def _execute(statements, db_connection):
+    """
+    Runs a list of SQL statements on a connection.
+    """
+    with db_connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install_search_index(db_connection):
+    """
+    Creates the index table and triggers if they are missing. Safe to run repeatedly.
+    """
+    _execute(INSTALL_SQL.get(db_connection.vendor, []), db_connection)
+
+
+def rebuild_search_index(db_connection):
+    """
+    Re-indexes every flight from scratch.
+    """
+    _execute(REBUILD_SQL.get(db_connection.vendor, []), db_connection)
+
+
+def drop_search_index(db_connection):
+    """
+    Removes the index table and triggers.
+    """
+    _execute(DROP_SQL.get(db_connection.vendor, []), db_connection)
+
+
+def drop_search_triggers(db_connection):
+    """
+    Removes the SQLite triggers but keeps the index. Migrations that rebuild
+    the airport table run this first, since SQLite will not rename a table
+    while the flight triggers refer to it; install_search_index() puts the
+    triggers back.
+    """
+    if db_connection.vendor == "sqlite":
+        _execute(SQLITE_DROP_TRIGGERS, db_connection)
+
+
+def tokenize(text):
+    """
+    Splits user input into search terms, dropping punctuation and operators.
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def match_expression(text, vendor):
+    """
+    Builds a backend query that requires every term, each matched as a prefix.
+    Returns None when the input has no searchable terms.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return None
+    if vendor == "sqlite":
+        return " ".join(f'"{term}"*' for term in terms)
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def _match_sql(vendor):
+    """
+    Returns the SQL subquery selecting the ids of matching flights, taking the match expression.
+    """
+    if vendor == "sqlite":
+        return f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s"
+    return f"SELECT flight_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+
+
+def _rank_sql(vendor):
+    """
+    Returns (table, where clauses, rank expression) for joining the index to flights_flight.
+    Ranks sort ascending, best match first.
+    """
+    if vendor == "sqlite":
+        return (
+            SQLITE_TABLE,
+            [f"{SQLITE_TABLE} MATCH %s", f"{SQLITE_TABLE}.rowid = flights_flight.id"],
+            f"bm25({SQLITE_TABLE}, 10.0, 5.0, 1.0)",
+        )
+    return (
+        POSTGRES_TABLE,
+        [f"{POSTGRES_TABLE}.document @@ to_tsquery('simple', %s)", f"{POSTGRES_TABLE}.flight_id = flights_flight.id"],
+        f"-ts_rank({POSTGRES_TABLE}.document, to_tsquery('simple', %s))",
+    )
+
+
+def filter_flights(queryset, text):
+    """
+    Narrows a Flight queryset to the flights matching `text`.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor not in INSTALL_SQL:
+        return _fallback_filter(queryset, text)
+    expression = match_expression(text, vendor)
+    if expression is None:
+        return queryset
+    return queryset.filter(id__in=RawSQL(_match_sql(vendor), [expression]))
+
+
+def rank_flights(queryset, text):
+    """
+    Filters like filter_flights and adds `search_rank` (lower is a better match).
+    The index table is joined in the FROM clause so the match runs once per query,
+    not once per flight as a correlated subquery would.
+    """
+    vendor = connections[queryset.db].vendor
+    expression = match_expression(text, vendor)
+    if vendor not in INSTALL_SQL:
+        return _fallback_filter(queryset, text).annotate(search_rank=RawSQL("0", []))
+    if expression is None:
+        return queryset.annotate(search_rank=RawSQL("0", []))
+    table, where, rank = _rank_sql(vendor)
+    return queryset.extra(
+        tables=[table],
+        where=where,
+        params=[expression],
+        select={'search_rank': rank},
+        select_params=[expression] if vendor != "sqlite" else [],
+    )
+
+
+def filter_archived_flights(queryset, text):
+    """
+    Narrows a FlightArchive queryset to the flights matching `text`. Archived
+    flights are not in the index, so this matches them without it.
+    """
+    return _fallback_filter(queryset, text)
+
+
+def search_flights(text, limit=20):
+    """
+    Returns up to `limit` flights matching `text`, best match first.
+    """
+    from .models import Flight  # Imported here so migrations can import this module
+
+    vendor = connection.vendor
+    expression = match_expression(text, vendor)
+    if expression is None:
+        return []
+    if vendor not in INSTALL_SQL:
+        return list(_fallback_filter(Flight.objects.select_related('departure_airport', 'arrival_airport'), text)[:limit])
+
+    with connection.cursor() as cursor:
+        if vendor == "sqlite":
+            cursor.execute(
+                f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s "
+                f"ORDER BY bm25({SQLITE_TABLE}, 10.0, 5.0, 1.0) LIMIT %s",
+                [expression, limit],
+            )
+        else:
+            cursor.execute(
+                f"SELECT flight_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('simple', %s) "
+                f"ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC LIMIT %s",
+                [expression, expression, limit],
+            )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    flights = Flight.objects.select_related('departure_airport', 'arrival_airport').in_bulk(ids)
+    return [flights[pk] for pk in ids if pk in flights]
+
+
+def _fallback_filter(queryset, text):
+    """
+    Index-free matching for backends without a full-text index: every term
+    must appear in the flight number, an airport field or the amenities.
+    """
+    for term in tokenize(text):
+        queryset = queryset.filter(
+            Q(flight_number__icontains=term)
+            | Q(amenities__icontains=term)
+            | Q(departure_airport__code__icontains=term)
+            | Q(departure_airport__name__icontains=term)
+            | Q(departure_airport__city__icontains=term)
+            | Q(departure_airport__country__icontains=term)
+            | Q(arrival_airport__code__icontains=term)
+            | Q(arrival_airport__name__icontains=term)
+            | Q(arrival_airport__city__icontains=term)
+            | Q(arrival_airport__country__icontains=term)
+        )
+    return queryset
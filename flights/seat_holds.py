@@ -0,0 +1,114 @@
+# File: seat_holds.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Time-limited seat holds for flights added to shopping carts
+
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Flight, SeatHold
+
+"""
+Adding a flight to a cart holds seats on it for a while. The hold takes the
+seats off Flight.seats_left with a conditional UPDATE:
+
+    UPDATE flights_flight SET seats_left = seats_left - n WHERE id = ? AND seats_left >= n
+
+which the database applies atomically, so concurrent adders never take more
+seats than are left and never wait on a row lock held across a request.
+The SeatHold row records the seats and when they expire. Both the hold
+and its release also touch Flight.updated_at, since the flight page shows
+the seats left (see flights/conditional.py).
+
+Holds are released, and their seats given back, when the cart is deleted
+(see flights/signals.py) or, once expired, by the sweeper:
+
+    python manage.py release_expired_holds
+
+Releasing deletes the holds and returns their seats with one UPDATE per
+flight, a batch at a time. Each hold is deleted on its own and only the
+seats of the holds whose DELETE removed a row are given back, so when two
+sweepers (or a sweeper and a cart deletion) release the same hold, only one
+of them returns its seats. Holds are also locked first, skipping rows
+another sweeper already has, on databases that support it; SQLite does
+not, and relies on the delete counts alone.
+"""
+
+DEFAULT_CONFIG = {
+    "HOLD_MINUTES": 15,  # How long added seats stay held
+    "SWEEP_BATCH_SIZE": 1000,  # Expired holds released per transaction
+}
+
+
+class SeatsUnavailable(Exception):
+    """
+    Raised when a flight does not have enough seats left to hold.
+    """
+
+
+def hold_config():
+    """
+    Returns the seat hold settings merged over the defaults.
+    """
+    return {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_SEAT_HOLDS", {})}
+
+
+def hold_seats(cart, flight_id, seats=1):
+    """
+    Takes `seats` off a flight and records a SeatHold for the cart, expiring after
+    HOLD_MINUTES. Raises SeatsUnavailable, and changes nothing, when the flight
+    has fewer seats left.
+    """
+    with transaction.atomic():
+        taken = Flight.objects.filter(pk=flight_id, seats_left__gte=seats).update(
+            seats_left=F('seats_left') - seats, updated_at=timezone.now()
+        )
+        if not taken:
+            raise SeatsUnavailable(f"Not enough seats left on flight {flight_id}.")
+        return SeatHold.objects.create(
+            cart=cart,
+            flight_id=flight_id,
+            seats=seats,
+            expires_at=timezone.now() + timedelta(minutes=hold_config()["HOLD_MINUTES"]),
+        )
+
+
+def release_holds(holds):
+    """
+    Deletes the holds in a queryset and gives their seats back to their flights.
+    Returns the number of holds released; holds another caller released first
+    are skipped.
+    """
+    with transaction.atomic():
+        locked = holds.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+        released = 0
+        seats_per_flight = defaultdict(int)
+        for pk, flight_id, seats in locked.values_list('pk', 'flight_id', 'seats'):
+            deleted, _ = SeatHold.objects.filter(pk=pk).delete()
+            if deleted:  # Nobody else released this hold
+                released += 1
+                seats_per_flight[flight_id] += seats
+
+        # One UPDATE per flight, however many holds it had
+        for flight_id, seats in seats_per_flight.items():
+            Flight.objects.filter(pk=flight_id).update(seats_left=F('seats_left') + seats, updated_at=timezone.now())
+    return released
+
+
+def release_expired_holds(now=None, batch_size=None):
+    """
+    Releases every hold that expired by `now` (default: the current time),
+    `batch_size` holds per transaction. Returns the number released.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or hold_config()["SWEEP_BATCH_SIZE"]
+    released = 0
+    while True:
+        expired = SeatHold.objects.filter(expires_at__lte=now).order_by('expires_at', 'pk')
+        batch = list(expired.values_list('pk', flat=True)[:batch_size])
+        released += release_holds(SeatHold.objects.filter(pk__in=batch))
+        if len(batch) < batch_size:  # Not the number released, which drops when another sweeper got there first
+            return released
+
@@ -0,0 +1,192 @@
+# File: serpapi_cache.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Shared response cache for SerpAPI Google Flights lookups
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+"""
+Import, checkout and the import script all send the same `google_flights`
+query shape to SerpAPI. This module caches those responses under a key built
+from the normalized parameter set (the API key is never part of the key), so
+repeated lookups are answered without spending quota.
+
+Responses live in a Django cache backend, configured by the
+FLIGHTS_SERPAPI_CACHE setting. Point its ALIAS at a file or database cache and
+every gunicorn worker shares the same entries. Each process also keeps an LRU
+index of the keys it wrote or read, bounded by MAX_ENTRIES, and evicts the
+least recently used response once the bound is reached.
+"""
+
+DEFAULT_CONFIG = {
+    "ALIAS": "default",  # Django cache alias holding the responses
+    "TTL": 15 * 60,  # Seconds a response stays fresh
+    "MAX_ENTRIES": 512,  # Responses tracked per process before LRU eviction
+}
+
+# Parameters that never change the response and must not end up in a key
+IGNORED_PARAMS = {"api_key"}
+
+
+class GoogleFlightsCache:
+    """
+    TTL + LRU cache for SerpAPI responses with hit/miss/eviction counters.
+    """
+
+    def __init__(self, alias=None, ttl=None, max_entries=None, prefix="serpapi"):
+        config = {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_SERPAPI_CACHE", {})}
+        self.alias = alias or config["ALIAS"]
+        self.ttl = ttl if ttl is not None else config["TTL"]
+        self.max_entries = max_entries if max_entries is not None else config["MAX_ENTRIES"]
+        self.prefix = prefix
+        self._lru = OrderedDict()  # Cache key -> None, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def backend(self):
+        """
+        Returns the Django cache backend that stores the responses.
+        """
+        return caches[self.alias]
+
+    def make_key(self, params):
+        """
+        Builds a cache key from the normalized query parameters, leaving out the API key.
+        """
+        normalized = {
+            str(name).lower(): str(value).strip()
+            for name, value in params.items()
+            if name not in IGNORED_PARAMS and value is not None
+        }
+        digest = hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, params):
+        """
+        Returns the cached response for these parameters, or None.
+        """
+        key = self.make_key(params)
+        data = self.backend.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                self._lru.pop(key, None)
+                return None
+            self.hits += 1
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            evicted = self._trim()
+        self.backend.delete_many(evicted)
+        return data
+
+    def set(self, params, data):
+        """
+        Stores a response for these parameters for the configured TTL.
+        """
+        key = self.make_key(params)
+        self.backend.set(key, data, timeout=self.ttl)
+        with self._lock:
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            evicted = self._trim()
+        self.backend.delete_many(evicted)
+
+    def get_or_fetch(self, params, fetch):
+        """
+        Returns the cached response, or calls fetch() and caches what it returns.
+        Exceptions raised by fetch() propagate and nothing is cached.
+        """
+        data = self.get(params)
+        if data is None:
+            data = fetch()
+            self.set(params, data)
+        return data
+
+    async def aget(self, params):
+        """
+        Async version of get(), for the async views.
+        """
+        key = self.make_key(params)
+        data = await self.backend.aget(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                self._lru.pop(key, None)
+                return None
+            self.hits += 1
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            evicted = self._trim()
+        if evicted:
+            await self.backend.adelete_many(evicted)
+        return data
+
+    async def aset(self, params, data):
+        """
+        Async version of set().
+        """
+        key = self.make_key(params)
+        await self.backend.aset(key, data, timeout=self.ttl)
+        with self._lock:
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            evicted = self._trim()
+        if evicted:
+            await self.backend.adelete_many(evicted)
+
+    async def aget_or_fetch(self, params, fetch):
+        """
+        Async version of get_or_fetch(); fetch() returns an awaitable.
+        """
+        data = await self.aget(params)
+        if data is None:
+            data = await fetch()
+            await self.aset(params, data)
+        return data
+
+    def _trim(self):
+        """
+        Drops least recently used keys past max_entries. Must hold the lock.
+        Returns the evicted keys so they can be deleted from the backend.
+        """
+        evicted = []
+        while len(self._lru) > self.max_entries:
+            key, _ = self._lru.popitem(last=False)
+            evicted.append(key)
+        self.evictions += len(evicted)
+        return evicted
+
+    def clear(self):
+        """
+        Removes every response this process knows about and resets the counters.
+        """
+        with self._lock:
+            keys = list(self._lru)
+            self._lru.clear()
+            self.hits = self.misses = self.evictions = 0
+        self.backend.delete_many(keys)
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters for this process.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._lru),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache shared by every Google Flights lookup
+google_flights_cache = GoogleFlightsCache()
@@ -0,0 +1,191 @@
+# File: serpapi_client.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Pooled SerpAPI client shared by the flight app views and importers
+
+import threading
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .metrics import outbound_request
+from .serpapi_cache import google_flights_cache
+
+"""
+Every outbound SerpAPI call goes through a SerpApiClient. The client holds one
+requests.Session per process with a sized connection pool, so TLS connections
+to serpapi.com are kept alive and reused instead of being set up per call.
+Requests get connect/read timeouts and are retried with jittered exponential
+backoff on connection errors, 429 and 5xx responses. Callers working to a
+deadline, like the checkout page, pass retry=False and a timeout no longer
+than the time they have left, so a call never outlives its caller's budget.
+
+Configuration comes from the SERPAPI_API_KEY and FLIGHTS_SERPAPI_CLIENT
+settings. Use get_client() to get the process-wide instance.
+"""
+
+DEFAULT_CONFIG = {
+    "ENDPOINT": "https://serpapi.com/search.json",
+    "POOL_SIZE": 10,  # Keep-alive connections kept per host
+    "CONNECT_TIMEOUT": 3.05,  # Seconds to establish a connection
+    "READ_TIMEOUT": 20,  # Seconds to wait for the response
+    "RETRIES": 3,  # Retries after the first attempt
+    "BACKOFF_FACTOR": 0.5,  # Sleeps 0.5s, 1s, 2s, ... between retries
+    "BACKOFF_JITTER": 0.25,  # Random extra sleep of up to this many seconds
+    "ASYNC_POOL_SIZE": 100,  # Connections per event loop for the async client (see serpapi_async.py)
+    "ASYNC_POOLS": 10,  # httpx clients those connections are split across
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class SerpApiError(Exception):
+    """
+    Raised when SerpAPI cannot be reached or answers with an error status.
+    """
+
+
+class SerpApiClient:
+    """
+    Thread-safe SerpAPI client with a pooled keep-alive session, timeouts and retries.
+    """
+
+    def __init__(self, api_key=None, endpoint=None, pool_size=None, connect_timeout=None,
+                 read_timeout=None, retries=None, backoff_factor=None, backoff_jitter=None,
+                 cache=google_flights_cache):
+        config = {**DEFAULT_CONFIG, **getattr(settings, "FLIGHTS_SERPAPI_CLIENT", {})}
+        self.api_key = api_key if api_key is not None else getattr(settings, "SERPAPI_API_KEY", "")
+        self.endpoint = endpoint or config["ENDPOINT"]
+        self.pool_size = pool_size or config["POOL_SIZE"]
+        self.timeout = (
+            connect_timeout or config["CONNECT_TIMEOUT"],
+            read_timeout or config["READ_TIMEOUT"],
+        )
+        self.retries = retries if retries is not None else config["RETRIES"]
+        self.backoff_factor = backoff_factor if backoff_factor is not None else config["BACKOFF_FACTOR"]
+        self.backoff_jitter = backoff_jitter if backoff_jitter is not None else config["BACKOFF_JITTER"]
+        self.cache = cache
+        self._sessions = {}  # Retries -> pooled session
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """
+        Returns the pooled session that retries failed requests, creating it on first use.
+        """
+        return self._get_session(self.retries)
+
+    @property
+    def single_attempt_session(self):
+        """
+        Returns a pooled session that never retries, creating it on first use.
+        """
+        return self._get_session(0)
+
+    def _get_session(self, retries):
+        """
+        Returns the session making `retries` retries, creating it on first use.
+        """
+        session = self._sessions.get(retries)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(retries)
+                if session is None:
+                    session = self._sessions[retries] = self._build_session(retries)
+        return session
+
+    def _build_session(self, retries):
+        """
+        Creates a session whose adapters pool connections and retry failed requests.
+        """
+        retry = Retry(
+            total=retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Hand the last response back instead of raising
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def search(self, params, timeout=None, retry=True):
+        """
+        Sends one search request and returns the decoded JSON response.
+        `timeout` overrides the read timeout for this call and caps its connect
+        timeout; retry=False makes a single attempt.
+        Raises SerpApiError on connection failures, non-200 responses and
+        bodies that are not JSON.
+        """
+        params = {**params, "api_key": self.api_key}
+        request_timeout = (min(self.timeout[0], timeout), timeout) if timeout else self.timeout
+        session = self.session if retry else self.single_attempt_session
+        try:
+            with outbound_request():
+                response = session.get(self.endpoint, params=params, timeout=request_timeout)
+        except requests.RequestException as e:
+            raise SerpApiError(str(e)) from e
+        if response.status_code != 200:
+            raise SerpApiError(f"API Error: {response.status_code}, {response.text}")
+        try:
+            return response.json()
+        except ValueError as e:  # A proxy's HTML error page, say
+            raise SerpApiError(f"Invalid JSON response: {e}") from e
+
+    def google_flights(self, departure_id, arrival_id, outbound_date, use_cache=True, timeout=None, retry=True,
+                       **extra):
+        """
+        Runs a google_flights search for one route and date, reading through
+        the response cache unless use_cache is False. Extra keyword arguments
+        are added to (or, when None, removed from) the query parameters.
+        """
+        params = google_flights_params(departure_id, arrival_id, outbound_date, **extra)
+        if not use_cache or self.cache is None:
+            return self.search(params, timeout=timeout, retry=retry)
+        return self.cache.get_or_fetch(params, lambda: self.search(params, timeout=timeout, retry=retry))
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+def google_flights_params(departure_id, arrival_id, outbound_date, **extra):
+    """
+    Returns the query parameters of a one-way google_flights search. Extra keyword
+    arguments are added to (or, when None, removed from) the parameters.
+    """
+    params = {
+        "engine": "google_flights",
+        "departure_id": departure_id,
+        "arrival_id": arrival_id,
+        "outbound_date": str(outbound_date),
+        "currency": "USD",
+        "hl": "en",
+        "type": 2,  # One way
+    }
+    params.update(extra)
+    return {name: value for name, value in params.items() if value is not None}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide SerpApiClient.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SerpApiClient()
+    return _client
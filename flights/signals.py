@@ -0,0 +1,234 @@
+# File: signals.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Signals that keep cached copies of the flight catalog up to date
+
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import Signal, receiver
+from .airport_catalog import invalidate_airport_catalog
+from .boards import invalidate_boards
+from .conditional import bump_catalog_version
+from .cart_totals import LINE_FLIGHT_COST, adjust_cart, reprice_flights, reprice_rental
+from .fares import refresh_route_days, route_day
+from .fragments import invalidate_fragments
+from .itineraries import itinerary_graph
+from .models import Airport, Flight, AirplaneRental, ShoppingCart, ShoppingCartFlight, ShoppingCartRental
+from .seat_holds import release_holds
+
+"""
+The ingest engine writes flights with bulk_create, which skips the model
+save and delete signals, so it sends flights_ingested once its transaction
+commits instead. The receivers below forward both kinds of change to the
+caches that hold catalog data: the itinerary graph, the airport boards, the
+flight card and board row fragments and the airport dropdown catalog.
+That work is deferred until the surrounding transaction commits, so a cache
+is never refilled from rows that are about to be rolled back or are not yet
+visible to other connections.
+
+Flight and airport changes also bump the catalog version behind the ETags
+of catalog pages (see flights/conditional.py), flight changes recompute
+the cheapest fares of the route days they touch (see flights/fares.py),
+cart lines and flight and rental prices keep the stored cart totals up to
+date (see flights/cart_totals.py), and deleting a cart gives back the
+seats it held (see flights/seat_holds.py). Those updates run right away,
+inside the same transaction as the change that caused them. Receivers are
+connected when the app is ready (see FlightsConfig.ready).
+"""
+
+# Sent by flights.ingest after a batch of flights is written, and by flights.archive
+# after a batch is moved to the archive. Arguments: flight_ids (every flight created,
+# updated or archived), airport_ids (airports created), route_airport_ids (airports
+# at either end of those flights, before and after the write).
+flights_ingested = Signal()
+
+
+@receiver(pre_save, sender=Flight)
+def remember_flight(sender, instance, **kwargs):
+    """
+    Records the airports, cost and departure time an existing flight had before
+    this save: moving a flight changes the boards of the airports it leaves and
+    the fares of the route day it leaves as well, and a new cost reprices the
+    carts holding it.
+    """
+    instance._previous = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._previous = Flight.objects.filter(pk=instance.pk).values_list(
+            'departure_airport_id', 'arrival_airport_id', 'cost', 'departure_time'
+        ).first()
+
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def flight_changed(sender, instance, **kwargs):
+    """
+    Bumps the catalog version, reprices carts holding a flight whose cost changed,
+    recomputes the fares of the route days it was and is on, queues the flight for
+    the itinerary graph and retires the boards it was on and its cached fragments.
+    """
+    flight_id = instance.pk
+    airport_ids = {instance.departure_airport_id, instance.arrival_airport_id}
+    route_days = {route_day(instance.departure_airport_id, instance.arrival_airport_id, instance.departure_time)}
+    bump_catalog_version()
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        airport_ids.update(previous[:2])
+        route_days.add(route_day(*previous[:2], previous[3]))
+        if kwargs.get('signal') is post_save:
+            reprice_flights({flight_id: Decimal(str(instance.cost)) - previous[2]})
+    refresh_route_days(route_days)
+
+    def forward():
+        itinerary_graph.mark_changed([flight_id])
+        invalidate_boards(airport_ids)
+        invalidate_fragments(flight_ids=[flight_id])
+
+    transaction.on_commit(forward)
+
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+def airport_changed(sender, instance, **kwargs):
+    """
+    Bumps the catalog version and, once committed, reloads minimum connection
+    times after an airport changes, and retires the
+    boards showing its name (its own and those of airports it has flights to or
+    from), the fragments of its flights and the airport catalog.
+    """
+    airport_id = instance.pk
+    bump_catalog_version()
+
+    def forward():
+        itinerary_graph.mark_airports_changed()
+        invalidate_fragments(airport_ids=[airport_id])
+        invalidate_airport_catalog()
+        connected = Flight.objects.filter(Q(departure_airport_id=airport_id) | Q(arrival_airport_id=airport_id))
+        invalidate_boards(
+            {airport_id}
+            | set(connected.values_list('departure_airport_id', flat=True).distinct())
+            | set(connected.values_list('arrival_airport_id', flat=True).distinct())
+        )
+
+    transaction.on_commit(forward)
+
+
+@receiver(flights_ingested)
+def flights_were_ingested(sender, flight_ids, airport_ids, route_airport_ids=(), **kwargs):
+    """
+    Queues ingested flights, and new airports' connection times, for the itinerary graph,
+    and retires the boards of every airport the flights touched, the flights' fragments
+    and, when airports were added, the airport catalog.
+    """
+    itinerary_graph.mark_changed(flight_ids)
+    if airport_ids:
+        itinerary_graph.mark_airports_changed()
+        invalidate_airport_catalog()
+    invalidate_boards(route_airport_ids)
+    invalidate_fragments(flight_ids=flight_ids)
+
+
+@receiver(pre_save, sender=ShoppingCartFlight)
+@receiver(pre_save, sender=ShoppingCartRental)
+def remember_cart_line(sender, instance, **kwargs):
+    """
+    Records what an existing cart line added to its cart's totals before this save.
+    """
+    instance._previous = None
+    if instance.pk and not kwargs.get('raw'):
+        line = sender.objects.filter(pk=instance.pk)
+        if sender is ShoppingCartFlight:
+            instance._previous = line.values_list('cart_id', 'quantity', LINE_FLIGHT_COST).first()
+        else:
+            instance._previous = line.values_list('cart_id', 'rental_days', 'rental__rental_cost').first()
+
+
+@receiver(post_save, sender=ShoppingCartFlight)
+@receiver(post_save, sender=ShoppingCartRental)
+def cart_line_saved(sender, instance, raw=False, **kwargs):
+    """
+    Moves a cart line's contribution from its old values to its new ones.
+    """
+    if raw:
+        return
+    items, amount = _line_totals(sender, instance)
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        cart_id, units, price = previous
+        previous_items = units if sender is ShoppingCartFlight else 1
+        if cart_id != instance.cart_id:
+            adjust_cart(cart_id, -previous_items, -units * price)
+        else:
+            items, amount = items - previous_items, amount - units * price
+    adjust_cart(instance.cart_id, items, amount)
+
+
+@receiver(pre_delete, sender=ShoppingCartFlight)
+@receiver(pre_delete, sender=ShoppingCartRental)
+def remember_deleted_cart_line(sender, instance, **kwargs):
+    """
+    Records what a cart line adds to its cart before anything is deleted. When
+    the line goes because its flight or rental is deleted, the collector may
+    delete that row first, and its price is gone by post_delete.
+    """
+    instance._deleted_totals = _line_totals(sender, instance)
+
+
+@receiver(post_delete, sender=ShoppingCartFlight)
+@receiver(post_delete, sender=ShoppingCartRental)
+def cart_line_deleted(sender, instance, **kwargs):
+    """
+    Removes a deleted cart line's contribution from its cart.
+    """
+    items, amount = getattr(instance, '_deleted_totals', None) or _line_totals(sender, instance)
+    adjust_cart(instance.cart_id, -items, -amount)
+
+
+@receiver(pre_save, sender=AirplaneRental)
+def remember_rental_cost(sender, instance, **kwargs):
+    """
+    Records a rental's cost before this save.
+    """
+    instance._previous_cost = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._previous_cost = sender.objects.filter(pk=instance.pk).values_list('rental_cost', flat=True).first()
+
+
+@receiver(post_save, sender=AirplaneRental)
+def rental_saved(sender, instance, **kwargs):
+    """
+    Reprices carts holding a rental whose cost changed.
+    """
+    previous_cost = getattr(instance, '_previous_cost', None)
+    if previous_cost is not None:
+        reprice_rental(instance.pk, Decimal(str(instance.rental_cost)) - previous_cost)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_deleted(sender, instance, **kwargs):
+    """
+    Gives the seats a cart holds back to their flights before the cart, and with it
+    the holds, are deleted.
+    """
+    release_holds(instance.seat_holds.all())
+
+
+def _line_totals(sender, instance):
+    """
+    Returns (items, amount) a cart line adds to its cart, reading the price from
+    the loaded flight (or archived flight) or rental when there is one.
+    """
+    if sender is ShoppingCartFlight:
+        relation = 'flight' if instance.archived_flight_id is None else 'archived_flight'
+        units, items, price_field = instance.quantity, instance.quantity, 'cost'
+    else:
+        units, items, relation, price_field = instance.rental_days, 1, 'rental', 'rental_cost'
+    descriptor = getattr(sender, relation)
+    if descriptor.is_cached(instance):
+        price = getattr(getattr(instance, relation), price_field)
+    else:
+        related = descriptor.field.related_model
+        price = related.objects.filter(pk=getattr(instance, f'{relation}_id')).values_list(price_field, flat=True).first()
+    if price is None:  # Flight or rental already gone
+        return items, Decimal('0')
+    return items, units * Decimal(str(price))
@@ -1,3 +1,1524 @@
-from django.test import TestCase
+# File: tests.py
+# Author: Kevin Tan (ktan03@bu.edu)
+# Description: Tests for the flight app
+
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import urlparse, parse_qs
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.core.management import call_command, CommandError
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .models import (
+    Airport, AircraftType, AirplaneRental, Flight, SeatHold, ShoppingCart, ShoppingCartFlight, ShoppingCartRental,
+    FlightArchive, ImportJob, RouteDayFare,
+)
+from .serpapi_cache import GoogleFlightsCache, google_flights_cache
+from .serpapi_client import SerpApiClient, SerpApiError
+from .serpapi_async import AsyncSerpApiClient
+from .search import search_flights
+from .itineraries import find_itineraries, itinerary_graph
+from .airport_catalog import get_airport_catalog
+from .boards import board_version
+from .fragments import fragment_stats
+from .views import AsyncCheckoutView, AsyncFlightCreateView, CheckoutView, FlightListView
+from .ingest import ingest_payload
+from .metrics import registry as metrics_registry
+from .databases import sync_replica
+from .seat_holds import SeatsUnavailable, hold_seats, release_expired_holds, release_holds
+from .cart_totals import find_drift
+from .import_jobs import claim_next_job, fail_stale_jobs, run_job
+
+
+def make_payload(legs=(("KE 2", "HND", "ICN", 420),)):
+    """
+    Builds a minimal SerpAPI google_flights payload, one itinerary per leg.
+    Each leg is (flight_number, departure code, arrival code, price).
+    """
+    return {
+        "best_flights": [
+            {
+                "price": price,
+                "flights": [{
+                    "flight_number": number,
+                    "departure_airport": {"id": dep, "name": f"{dep} Airport", "time": "2024-12-23 08:00"},
+                    "arrival_airport": {"id": arr, "name": f"{arr} Airport", "time": "2024-12-23 10:30"},
+                    "airplane": "Boeing 777",
+                    "extensions": ["Wi-Fi", "Power"],
+                }],
+            }
+            for number, dep, arr, price in legs
+        ]
+    }
+
+
+class StubSerpApi:
+    """
+    Local stand-in for the SerpAPI endpoint. Answers every google_flights
+    query with a one-leg payload for the requested route and date after
+    `delay` seconds, and counts the requests it served.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = 0
+        self.connections = 0
+        self.status = lambda: 200  # Status code for the next response
+        self.body = None  # Raw body sent instead of the payload, e.g. a proxy's error page
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                stub.requests += 1
+                time.sleep(stub.delay)
+                dep, arr, day = query["departure_id"], query["arrival_id"], query["outbound_date"]
+                body = stub.body or json.dumps(
+                    make_payload([(f"{dep[:2]}{arr[:2]}{day[5:7]}{day[8:]}", dep, arr, 500)])
+                ).encode()
+                try:
+                    self.send_response(stub.status())
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    pass  # The client timed out and hung up
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/search"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class IngestTests(TestCase):
+    """
+    Tests for the batched SerpAPI ingest engine.
+    """
+
+    def test_creates_rows_in_a_fixed_number_of_queries(self):
+        legs = [(f"KE {n}", "HND", "ICN", 400 + n) for n in range(20)]
+        with self.assertNumQueries(12):
+            counts = ingest_payload(make_payload(legs))
+
+        self.assertEqual(counts["airports"], {"created": 2, "updated": 0})
+        self.assertEqual(counts["aircraft"], {"created": 1, "updated": 0})
+        self.assertEqual(counts["flights"], {"created": 20, "updated": 0, "unchanged": 0})
+        self.assertEqual(Flight.objects.count(), 20)
+        self.assertEqual(AircraftType.objects.count(), 1)
+
+    def test_reimport_updates_existing_flights(self):
+        ingest_payload(make_payload())
+        counts = ingest_payload(make_payload([("KE 2", "HND", "ICN", 380), ("KE 4", "ICN", "HND", 390)]))
+
+        self.assertEqual(counts["airports"]["created"], 0)
+        self.assertEqual(counts["flights"], {"created": 1, "updated": 1, "unchanged": 0})
+        self.assertEqual(Flight.objects.get(flight_number="KE 2").cost, 380)
+        self.assertEqual(Airport.objects.count(), 2)
+
+    def test_identical_reimport_writes_nothing(self):
+        legs = [(f"KE {n}", "HND", "ICN", 400 + n) for n in range(20)]
+        ingest_payload(make_payload(legs))
+        Flight.objects.filter(flight_number="KE 3").update(seats_left=7)  # As seat holds would
+        versions = list(Flight.objects.order_by('pk').values_list('updated_at', flat=True))
+
+        # Only the airport, aircraft and flight reads inside the transaction's savepoint
+        with self.assertNumQueries(5):
+            counts = ingest_payload(make_payload(legs))
+
+        self.assertEqual(counts["flights"], {"created": 0, "updated": 0, "unchanged": 20})
+        self.assertEqual(list(Flight.objects.order_by('pk').values_list('updated_at', flat=True)), versions)
+        self.assertEqual(Flight.objects.get(flight_number="KE 3").seats_left, 7)
+
+    def test_reimport_writes_only_changed_flights(self):
+        legs = [(f"KE {n}", "HND", "ICN", 400 + n) for n in range(20)]
+        ingest_payload(make_payload(legs))
+        Flight.objects.filter(flight_number="KE 3").update(seats_left=7)
+        untouched = Flight.objects.get(flight_number="KE 5").updated_at
+
+        legs[3] = ("KE 3", "HND", "ICN", 350)
+        legs[5] = ("KE 5", "HND", "ICN", 405.0)  # Same price as a float
+        counts = ingest_payload(make_payload(legs))
+
+        self.assertEqual(counts["flights"], {"created": 0, "updated": 1, "unchanged": 19})
+        flight = Flight.objects.get(flight_number="KE 3")
+        self.assertEqual((flight.cost, flight.seats_left), (350, 7))
+        self.assertEqual(Flight.objects.get(flight_number="KE 5").updated_at, untouched)
+        self.assertEqual(RouteDayFare.objects.get().min_cost, 350)
+
+
+class ImportFlightMatrixCommandTests(TestCase):
+    """
+    Tests for the import_flight_matrix management command against a stub endpoint.
+    """
+
+    def run_matrix(self, endpoint, concurrency):
+        out = StringIO()
+        call_command(
+            "import_flight_matrix", "--routes", "BOS-HND,HND-ICN",
+            "--start-date", "2024-12-20", "--end-date", "2024-12-27",
+            "--concurrency", str(concurrency), "--batch-size", "5",
+            "--endpoint", endpoint, "--api-key", "test", stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_imports_every_route_and_date(self):
+        with StubSerpApi() as stub:
+            output = self.run_matrix(stub.endpoint, concurrency=4)
+
+        self.assertEqual(stub.requests, 16)
+        self.assertEqual(Flight.objects.count(), 16)
+        self.assertIn("16 flights created", output)
+
+    def test_queries_run_concurrently(self):
+        with StubSerpApi(delay=0.05) as stub:
+            started = time.perf_counter()
+            self.run_matrix(stub.endpoint, concurrency=8)
+            elapsed = time.perf_counter() - started
+
+        # 16 queries at 50 ms each take 0.8 s serially
+        self.assertLess(elapsed, 0.5)
+
+
+class CheckoutViewTests(TestCase):
+    """
+    Tests for the concurrent, deduplicated SerpAPI fan-out on the checkout page.
+    """
+
+    def setUp(self):
+        google_flights_cache.clear()
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 420), ("KE 4", "ICN", "HND", 390)]))
+        self.user = User.objects.create_user("traveler", password="pw")
+        cart = ShoppingCart.objects.create(user=self.user)
+        for number in ("KE 2", "KE 2", "KE 4"):
+            ShoppingCartFlight.objects.create(cart=cart, flight=Flight.objects.get(flight_number=number))
+        self.client.force_login(self.user)
+
+    def stub_client(self, stub):
+        """
+        Points the views at a SerpApiClient that talks to the stub server.
+        """
+        client = SerpApiClient(api_key="test", endpoint=stub.endpoint, retries=0)
+        return mock.patch("flights.views.get_client", return_value=client)
+
+    def test_identical_queries_are_sent_once(self):
+        with StubSerpApi() as stub, self.stub_client(stub):
+            response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(stub.requests, 2)
+        self.assertEqual(len(response.context["serpapi_results"]), 3)
+        # Requests sent from the worker threads still count towards the page
+        self.assertIn('desc="2 requests"', response["Server-Timing"])
+
+    def test_slow_queries_return_partial_results(self):
+        with StubSerpApi(delay=0.5) as stub, \
+                self.stub_client(stub), \
+                mock.patch.object(CheckoutView, "checkout_deadline", 0.1):
+            started = time.perf_counter()
+            response = self.client.get(reverse("checkout"))
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.4)
+        for result in response.context["serpapi_results"]:
+            self.assertIn("Timed out", result["error"])
+
+    def test_failed_queries_are_not_retried(self):
+        with StubSerpApi() as stub, \
+                mock.patch("flights.views.get_client", return_value=SerpApiClient(
+                    api_key="test", endpoint=stub.endpoint, retries=3, backoff_factor=0, backoff_jitter=0,
+                )):
+            stub.status = lambda: 503
+            response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(stub.requests, 2)
+        for result in response.context["serpapi_results"]:
+            self.assertIn("503", result["error"])
+
+    def test_queries_past_the_deadline_are_not_sent(self):
+        with StubSerpApi() as stub, self.stub_client(stub):
+            result = CheckoutView().fetch("BOS", "JFK", "2026-12-01", deadline=time.monotonic())
+
+        self.assertEqual(stub.requests, 0)
+        self.assertIn("Timed out", result["error"])
+
+    def test_repeat_checkout_is_served_from_cache(self):
+        with StubSerpApi() as stub, self.stub_client(stub):
+            self.client.get(reverse("checkout"))
+            self.client.get(reverse("checkout"))
+
+        self.assertEqual(stub.requests, 2)
+        self.assertEqual(google_flights_cache.stats()["hits"], 2)
+
+
+class GoogleFlightsCacheTests(TestCase):
+    """
+    Tests for the SerpAPI response cache.
+    """
+
+    def setUp(self):
+        caches["default"].clear()
+        self.cache = GoogleFlightsCache(alias="default", ttl=60, max_entries=2, prefix="test")
+
+    def params(self, arrival, api_key="secret"):
+        return {"engine": "google_flights", "departure_id": "HND", "arrival_id": arrival, "api_key": api_key}
+
+    def test_key_ignores_api_key_and_parameter_order(self):
+        params = self.params("ICN")
+        reordered = dict(reversed(list(self.params("ICN", api_key="other").items())))
+        self.assertEqual(self.cache.make_key(params), self.cache.make_key(reordered))
+        self.assertNotIn("secret", self.cache.make_key(params))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set(self.params("ICN"), {"n": 1})
+        self.cache.set(self.params("BOS"), {"n": 2})
+        self.cache.get(self.params("ICN"))
+        self.cache.set(self.params("LAX"), {"n": 3})
+
+        self.assertIsNone(self.cache.get(self.params("BOS")))
+        self.assertEqual(self.cache.get(self.params("ICN")), {"n": 1})
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+
+class SerpApiClientTests(TestCase):
+    """
+    Tests for the pooled SerpAPI client.
+    """
+
+    def test_retries_server_errors(self):
+        with StubSerpApi() as stub:
+            failures = iter([503, 503])
+            stub.status = lambda: next(failures, 200)
+            client = SerpApiClient(api_key="test", endpoint=stub.endpoint, retries=3,
+                                   backoff_factor=0, backoff_jitter=0, cache=None)
+            data = client.google_flights("HND", "ICN", "2024-12-23")
+
+        self.assertEqual(stub.requests, 3)
+        self.assertEqual(data["best_flights"][0]["flights"][0]["departure_airport"]["id"], "HND")
+
+    def test_reuses_connections(self):
+        with StubSerpApi() as stub:
+            client = SerpApiClient(api_key="test", endpoint=stub.endpoint, cache=None)
+            for _ in range(3):
+                client.google_flights("HND", "ICN", "2024-12-23")
+
+        self.assertEqual(stub.connections, 1)
+
+    def test_non_json_bodies_raise_serpapi_error(self):
+        with StubSerpApi() as stub:
+            stub.body = b"<html>Bad gateway</html>"
+            client = SerpApiClient(api_key="test", endpoint=stub.endpoint, cache=None)
+            with self.assertRaisesMessage(SerpApiError, "Invalid JSON"):
+                client.google_flights("HND", "ICN", "2024-12-23")
+
+    async def test_async_client_raises_serpapi_error_for_non_json_bodies(self):
+        with StubSerpApi() as stub:
+            stub.body = b"<html>Bad gateway</html>"
+            client = AsyncSerpApiClient(api_key="test", endpoint=stub.endpoint, cache=None)
+            with self.assertRaisesMessage(SerpApiError, "Invalid JSON"):
+                await client.google_flights("HND", "ICN", "2024-12-23")
+
+
+class ImportJobTests(TestCase):
+    """
+    Tests for queued imports and the background worker.
+    """
+
+    def setUp(self):
+        google_flights_cache.clear()
+        self.user = User.objects.create_user("importer", password="pw")
+        self.client.force_login(self.user)
+
+    def queue_import(self):
+        response = self.client.post(
+            reverse("import-flights"),
+            {"departure_id": "HND", "arrival_id": "ICN", "outbound_date": "2024-12-23"},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_post_queues_a_job_without_fetching(self):
+        with mock.patch("flights.import_jobs.get_client") as get_client:
+            queued = self.queue_import()
+
+        get_client.assert_not_called()
+        page = self.client.get(f"{reverse('import-flights')}?job={queued['job_id']}")
+        self.assertContains(page, queued["status_url"])
+        status = self.client.get(queued["status_url"]).json()
+        self.assertEqual(status["status"], ImportJob.STATUS_QUEUED)
+        self.assertFalse(status["finished"])
+
+    def test_worker_runs_queued_jobs(self):
+        queued = self.queue_import()
+        with StubSerpApi() as stub, mock.patch(
+            "flights.import_jobs.get_client",
+            return_value=SerpApiClient(api_key="test", endpoint=stub.endpoint, retries=0),
+        ):
+            call_command("process_import_jobs", "--once", stdout=StringIO())
+
+        status = self.client.get(queued["status_url"]).json()
+        self.assertEqual(status["status"], ImportJob.STATUS_SUCCEEDED)
+        self.assertEqual(status["progress"], 100)
+        self.assertEqual(status["counts"]["flights"]["created"], 1)
+        self.assertTrue(Flight.objects.filter(departure_airport__code="HND").exists())
+
+    def test_stale_claims_of_dead_workers_are_failed(self):
+        queued = self.queue_import()
+        claimed = claim_next_job()  # The worker then dies
+        self.assertEqual(claimed.status, ImportJob.STATUS_RUNNING)
+        fresh = ImportJob.objects.create(user=self.user, departure_code="ICN", arrival_code="HND",
+                                         outbound_date=date(2024, 12, 24), status=ImportJob.STATUS_RUNNING,
+                                         started_at=claimed.started_at + timedelta(minutes=10))
+
+        self.assertEqual(fail_stale_jobs(), 0)
+        self.assertEqual(fail_stale_jobs(now=claimed.started_at + timedelta(minutes=16)), 1)
+        status = self.client.get(queued["status_url"]).json()
+        self.assertEqual(status["status"], ImportJob.STATUS_FAILED)
+        self.assertTrue(status["finished"])
+        self.assertIn("stopped before finishing", status["error"])
+        self.assertEqual(ImportJob.objects.get(pk=fresh.pk).status, ImportJob.STATUS_RUNNING)
+
+    def test_finishing_keeps_a_job_failed_as_stale(self):
+        queued = self.queue_import()
+        claimed = claim_next_job()
+        fail_stale_jobs(now=claimed.started_at + timedelta(minutes=16))  # Another worker gave up on it
+
+        with StubSerpApi() as stub, mock.patch(
+            "flights.import_jobs.get_client",
+            return_value=SerpApiClient(api_key="test", endpoint=stub.endpoint, retries=0),
+        ):
+            finished = run_job(claimed)
+
+        self.assertEqual(finished.status, ImportJob.STATUS_FAILED)
+        status = self.client.get(queued["status_url"]).json()
+        self.assertEqual(status["status"], ImportJob.STATUS_FAILED)
+        self.assertIn("stopped before finishing", status["error"])
+
+    def test_status_is_private_to_the_owner(self):
+        queued = self.queue_import()
+        self.client.force_login(User.objects.create_user("someone-else", password="pw"))
+        self.assertEqual(self.client.get(queued["status_url"]).status_code, 404)
+
+
+def make_catalog(airports=6, flights=60):
+    """
+    Bulk-creates a small but realistic catalog: airports, one aircraft type and
+    flights spread over every airport pair, departing an hour apart.
+    """
+    codes = [f"A{n:02d}" for n in range(airports)]
+    Airport.objects.bulk_create([
+        Airport(code=code, name=f"{code} International", city=f"City {code}", country="Country")
+        for code in codes
+    ])
+    airport_ids = list(Airport.objects.order_by('pk').values_list('pk', flat=True))
+    aircraft = AircraftType.objects.create(model="A320", seat_capacity=180)
+    start = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+    Flight.objects.bulk_create([
+        Flight(
+            flight_number=f"CT {n}",
+            departure_airport_id=airport_ids[n % airports],
+            arrival_airport_id=airport_ids[(n + 1 + n // airports) % airports],
+            departure_time=start + timedelta(hours=n),
+            arrival_time=start + timedelta(hours=n + 3),
+            cost=100 + n,
+            aircraft=aircraft,
+            amenities="Wi-Fi",
+            seats_left=100,
+        )
+        for n in range(flights)
+    ])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Pins the number of queries each flights page runs, so template edits cannot
+    silently reintroduce per-row lookups. Every page is rendered for a
+    logged-in user with a cart, which costs a session, user and cart summary lookup.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog()
+        cls.user = User.objects.create_user("budget", password="pw")
+        cart = ShoppingCart.objects.create(user=cls.user)
+        ShoppingCartFlight.objects.bulk_create([
+            ShoppingCartFlight(cart=cart, flight=flight) for flight in Flight.objects.all()[:8]
+        ])
+        cls.flight = Flight.objects.first()
+        cls.airport = Airport.objects.first()
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client.force_login(self.user)
+
+    def assertPageQueries(self, budget, url):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_flight_list(self):
+        # session, user, catalog version, cart summary, count, page of flights, airport catalog
+        self.assertPageQueries(7, reverse("all_flights"))
+        # The airport catalog now comes from the cache
+        self.assertPageQueries(6, reverse("all_flights") + "?page=3&q=CT")
+
+    def test_flight_detail(self):
+        # session, user, flight versions, cart summary, flight with both airports
+        self.assertPageQueries(5, reverse("flight_detail", args=[self.flight.pk]))
+
+    def test_airport_detail(self):
+        url = reverse("airport_detail", args=[self.airport.pk]) + "?start=2030-01-01"
+        # session, user, catalog version, cart summary, airport, a count and a page for each board
+        response = self.assertPageQueries(9, url)
+        self.assertEqual(len(response.context["departing_flights"]), 4)
+        # session, user, catalog version, cart summary, airport: both boards come from the cache
+        self.assertPageQueries(5, url)
+
+    def test_airport_list(self):
+        # session, user, catalog version, cart summary, airports
+        self.assertPageQueries(5, reverse("airport_list"))
+
+    def test_shopping_cart(self):
+        # session, user, cart with its totals, flight lines with airports, rental lines
+        self.assertPageQueries(5, reverse("shopping_cart"))
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Tests for cursor pagination of the flight list.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(flights=35)
+        # Two flights sharing a departure time must still page in id order
+        Flight.objects.filter(flight_number="CT 11").update(departure_time=datetime(2030, 1, 1, 10, tzinfo=dt_timezone.utc))
+
+    def walk(self, url):
+        """
+        Follows next links from url and returns the flight numbers in page order.
+        """
+        seen, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            page = response.context["page_obj"]
+            seen += [flight.flight_number for flight in page]
+            url = reverse("all_flights") + response.context["page_link_prefix"] + f"cursor={page.next_cursor}" if page.has_next() else None
+            pages += 1
+        return seen, pages
+
+    def test_walks_every_flight_once_in_order(self):
+        seen, pages = self.walk(reverse("all_flights") + "?pagination=keyset")
+        expected = list(Flight.objects.order_by("departure_time", "id").values_list("flight_number", flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 4)
+
+    def test_previous_cursor_returns_the_prior_page(self):
+        first = self.client.get(reverse("all_flights") + "?pagination=keyset").context["page_obj"]
+        second = self.client.get(reverse("all_flights") + f"?pagination=keyset&cursor={first.next_cursor}").context["page_obj"]
+        back = self.client.get(reverse("all_flights") + f"?pagination=keyset&cursor={second.previous_cursor}").context["page_obj"]
+        self.assertEqual(list(back), list(first))
+
+    def test_filters_are_kept_and_counting_is_optional(self):
+        airport = Airport.objects.first()
+        url = reverse("all_flights") + f"?pagination=keyset&departure_airport={airport.pk}"
+        caches["default"].clear()
+        with self.assertNumQueries(3):  # Catalog version, a page of flights and the airport catalog; no COUNT
+            response = self.client.get(url)
+        self.assertIsNone(response.context["page_obj"].total_count)
+        self.assertIn(f"departure_airport={airport.pk}", response.context["page_link_prefix"])
+
+        response = self.client.get(url + "&count=exact")
+        self.assertEqual(response.context["page_obj"].total_count, Flight.objects.filter(departure_airport=airport).count())
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse("all_flights") + "?pagination=keyset&cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+
+class FlightFilterTests(TestCase):
+    """
+    Tests for the date, price and sort filters on the flight list, and for the
+    indexes that serve them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(flights=72)  # Three days of hourly departures
+        cls.origin, cls.destination = Airport.objects.order_by("pk")[:2]
+
+    def listed(self, query):
+        response = self.client.get(reverse("all_flights") + "?" + query)
+        return list(response.context["flights"])
+
+    def test_date_and_price_range(self):
+        flights = self.listed("date_from=2030-01-02&date_to=2030-01-02&min_cost=130&max_cost=140")
+        self.assertEqual([f.flight_number for f in flights], [f"CT {n}" for n in range(30, 40)])  # First page of 11
+        for flight in flights:
+            self.assertEqual(flight.departure_time.date().isoformat(), "2030-01-02")
+            self.assertTrue(130 <= flight.cost <= 140)
+
+    def test_last_representable_date(self):
+        self.assertEqual(len(self.listed("date_from=2030-01-03&date_to=9999-12-31")), 10)
+
+    def test_sort_by_price_descending(self):
+        costs = [f.cost for f in self.listed("sort=-price")]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+        self.assertEqual(costs[0], 171)
+
+    def test_keyset_pages_follow_the_sort_order(self):
+        first = self.client.get(reverse("all_flights") + "?pagination=keyset&sort=-price").context["page_obj"]
+        second = self.client.get(
+            reverse("all_flights") + f"?pagination=keyset&sort=-price&cursor={first.next_cursor}"
+        ).context["page_obj"]
+        self.assertEqual([f.cost for f in second], list(range(161, 151, -1)))
+
+    def assertUsesIndex(self, query):
+        """
+        Asserts the EXPLAIN plan for the list query reads flights through an index.
+        """
+        request = self.client.get(reverse("all_flights") + "?" + query).wsgi_request
+        view = FlightListView()
+        view.setup(request)
+        plan = view.get_queryset().explain()
+        self.assertRegex(plan, r"flights_flight USING (COVERING )?INDEX flight_", plan)
+        self.assertNotRegex(plan, r"SCAN flights_flight\b(?! USING)", plan)
+
+    def test_route_and_dates_use_the_route_index(self):
+        self.assertUsesIndex(
+            f"departure_airport={self.origin.pk}&arrival_airport={self.destination.pk}"
+            "&date_from=2030-01-01&date_to=2030-01-02"
+        )
+
+    def test_dates_and_price_use_an_index(self):
+        self.assertUsesIndex("date_from=2030-01-01&date_to=2030-01-02&max_cost=1500")
+
+    def test_route_dates_and_price_use_an_index(self):
+        self.assertUsesIndex(
+            f"departure_airport={self.origin.pk}&arrival_airport={self.destination.pk}"
+            "&date_from=2030-01-01&max_cost=1500&sort=price"
+        )
+
+
+class FlightSearchTests(TestCase):
+    """
+    Tests for the full-text search index over flights and airports.
+    """
+
+    def setUp(self):
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 420), ("NH 7", "HND", "BOS", 900)]),
+                       departure_city="Tokyo", arrival_city="Seoul")
+
+    def numbers(self, text):
+        return [flight.flight_number for flight in search_flights(text)]
+
+    def test_matches_flight_numbers_airports_and_amenities(self):
+        self.assertEqual(self.numbers("KE2"), ["KE 2"])
+        self.assertEqual(sorted(self.numbers("tokyo")), ["KE 2", "NH 7"])
+        self.assertEqual(self.numbers("BOS wi-fi"), ["NH 7"])
+        self.assertEqual(sorted(self.numbers("toky")), ["KE 2", "NH 7"])  # Prefix match
+        self.assertEqual(self.numbers("'\"*"), [])
+
+    def test_index_follows_airport_and_flight_changes(self):
+        Airport.objects.filter(code="ICN").update(city="Incheon")
+        self.assertEqual(self.numbers("incheon"), ["KE 2"])
+
+        Flight.objects.filter(flight_number="NH 7").update(amenities="Lie-flat seats")
+        self.assertEqual(self.numbers("lie flat"), ["NH 7"])
+
+        Flight.objects.filter(flight_number="KE 2").delete()
+        self.assertEqual(self.numbers("incheon"), [])
+
+    def test_ranks_flight_number_matches_first(self):
+        ingest_payload(make_payload([("HND 1", "ICN", "BOS", 300)]))
+        self.assertEqual(self.numbers("HND")[0], "HND 1")
+
+        response = self.client.get(reverse("all_flights") + "?q=hnd&sort=relevance")
+        self.assertEqual(response.context["flights"][0].flight_number, "HND 1")
+        self.assertEqual(len(response.context["flights"]), 3)
+
+    def test_flight_list_search(self):
+        response = self.client.get(reverse("all_flights") + "?q=tokyo+bos&sort=relevance")
+        self.assertEqual([f.flight_number for f in response.context["flights"]], ["NH 7"])
+
+        response = self.client.get(reverse("all_flights") + "?q=tokyo&sort=relevance&pagination=keyset")
+        self.assertEqual([f.flight_number for f in response.context["flights"]], ["KE 2", "NH 7"])
+
+
+class ItinerarySearchTests(TestCase):
+    """
+    Tests for the multi-leg itinerary search over the in-memory flight graph.
+    """
+
+    def setUp(self):
+        self.aircraft = AircraftType.objects.create(model="A320", seat_capacity=180)
+        self.airports = {
+            code: Airport.objects.create(code=code, name=f"{code} Airport", city=code, country="X",
+                                         avg_security_time=timedelta(minutes=30))
+            for code in ("BOS", "JFK", "LHR", "ICN")
+        }
+        self.add_flight("D1", "BOS", "ICN", "10:00", 28 * 60, 1500)  # Nonstop
+        self.add_flight("A1", "BOS", "JFK", "08:00", 90, 100)
+        self.add_flight("A2", "JFK", "ICN", "10:30", 28 * 60 + 30, 800)  # 60 minute connection from A1
+        self.add_flight("B1", "BOS", "JFK", "09:00", 80, 50)  # Lands 10 minutes before A2 leaves
+        self.add_flight("C1", "BOS", "LHR", "07:00", 8 * 60, 300)
+        self.add_flight("C2", "LHR", "ICN", "17:00", 15 * 60, 400)
+        itinerary_graph.invalidate()
+
+    def add_flight(self, number, dep, arr, departs, minutes, cost):
+        hour, minute = map(int, departs.split(":"))
+        departure_time = datetime(2030, 1, 1, hour, minute, tzinfo=dt_timezone.utc)
+        return Flight.objects.create(
+            flight_number=number, departure_airport=self.airports[dep], arrival_airport=self.airports[arr],
+            departure_time=departure_time, arrival_time=departure_time + timedelta(minutes=minutes),
+            cost=cost, aircraft=self.aircraft, amenities="", seats_left=10,
+        )
+
+    def search(self, **kwargs):
+        itineraries = find_itineraries(self.airports["BOS"].pk, self.airports["ICN"].pk, date(2030, 1, 1), **kwargs)
+        return [[flight.flight_number for flight in itinerary.flights] for itinerary in itineraries]
+
+    def test_cheapest_and_fastest(self):
+        self.assertEqual(self.search(), [["C1", "C2"], ["A1", "A2"], ["D1"]])
+        self.assertEqual(self.search(sort="fastest"), [["C1", "C2"], ["D1"], ["A1", "A2"]])
+        self.assertEqual(self.search(max_legs=1), [["D1"]])
+        self.assertEqual(self.search(k=1), [["C1", "C2"]])
+
+        itinerary = find_itineraries(self.airports["BOS"].pk, self.airports["ICN"].pk, date(2030, 1, 1))[0]
+        self.assertEqual(itinerary.total_cost, 700)
+        self.assertEqual(itinerary.stops, 1)
+        self.assertEqual(itinerary.layovers, [(self.airports["LHR"], timedelta(hours=2))])
+        self.assertEqual(self.search(max_layover=timedelta(hours=1)), [["A1", "A2"], ["D1"]])
+
+    def test_minimum_connection_time_comes_from_security_time(self):
+        jfk = self.airports["JFK"]
+        jfk.avg_security_time = timedelta(minutes=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            jfk.save()
+        self.assertEqual(self.search()[1], ["B1", "A2"])
+
+    def test_graph_refreshes_incrementally(self):
+        self.search()
+        built_at = itinerary_graph.built_at
+
+        cheap = self.add_flight("E1", "BOS", "ICN", "12:00", 20 * 60, 200)
+        self.assertEqual(self.search()[0], ["E1"])
+        cheap.cost = 2000
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.save()
+        self.assertEqual(self.search()[-1], ["E1"])
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.delete()
+        self.assertNotIn(["E1"], self.search())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_payload(make_payload([("E2", "BOS", "ICN", 10)]))  # Departs 2024-12-23
+        Flight.objects.filter(flight_number="E2").update(
+            departure_time=datetime(2030, 1, 1, 6, tzinfo=dt_timezone.utc),
+            arrival_time=datetime(2030, 1, 2, 6, tzinfo=dt_timezone.utc),
+        )
+        itinerary_graph.mark_changed(Flight.objects.filter(flight_number="E2").values_list("pk", flat=True))
+        self.assertEqual(self.search()[0], ["E2"])
+        self.assertEqual(itinerary_graph.built_at, built_at)
+
+    def test_search_view(self):
+        url = reverse("itinerary_search")
+        response = self.client.get(url)
+        self.assertIsNone(response.context["itineraries"])
+
+        response = self.client.get(url, {
+            "origin": self.airports["BOS"].pk, "destination": self.airports["ICN"].pk,
+            "date": "2030-01-01", "sort": "fastest", "max_legs": "2",
+        })
+        self.assertEqual(len(response.context["itineraries"]), 3)
+        self.assertContains(response, "LHR Airport (LHR): 2:00:00")
+
+        # The last representable date searches an empty day instead of overflowing
+        response = self.client.get(url, {
+            "origin": self.airports["BOS"].pk, "destination": self.airports["ICN"].pk, "date": "9999-12-31",
+        })
+        self.assertEqual(response.context["itineraries"], [])
+
+
+@override_settings(FLIGHTS_AIRPORT_BOARDS={"PAGE_SIZE": 5})
+class AirportBoardTests(TestCase):
+    """
+    Tests for the cached departure and arrival boards on the airport page.
+    """
+
+    def setUp(self):
+        caches["default"].clear()
+        make_catalog(airports=2, flights=100)  # A00 departures leave every two hours from 2030-01-01
+        self.airport = Airport.objects.get(code="A00")
+        self.url = reverse("airport_detail", args=[self.airport.pk])
+
+    def boards(self, query):
+        response = self.client.get(self.url + query)
+        return response.context["departing_flights"], response.context["arriving_fligths"]
+
+    def test_boards_are_windowed_and_paginated_independently(self):
+        departures, arrivals = self.boards("?start=2030-01-01&dep_page=3")
+        self.assertEqual((departures.count, departures.num_pages, departures.number), (12, 3, 3))
+        self.assertEqual([f.departure_time.hour for f in departures], [20, 22])
+        self.assertEqual(arrivals.number, 1)
+        self.assertTrue(all(f.arrival_airport_id == self.airport.pk for f in arrivals))
+
+        departures, _ = self.boards("?start=2030-01-01T01:00&hours=6&dep_page=9")
+        self.assertEqual([f.departure_time.hour for f in departures], [2, 4, 6])  # Clamped to the last page
+
+        response = self.client.get(self.url + "?start=2030-01-01")
+        self.assertContains(response, "?start=2030-01-01&amp;dep_page=2")
+
+    def test_window_on_the_last_representable_day(self):
+        response = self.client.get(self.url + "?start=9999-12-31T12:00&hours=72")
+        self.assertEqual(response.status_code, 200)
+        departures = response.context["departing_flights"]
+        self.assertEqual((departures.count, departures.window_end.date()), (0, date.max))
+
+    def test_flight_changes_invalidate_cached_boards(self):
+        self.boards("?start=2030-01-01")
+        flight = Flight.objects.get(flight_number="CT 0")
+        flight.flight_number = "CT X"
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.save()
+        departures, _ = self.boards("?start=2030-01-01")
+        self.assertEqual(departures.object_list[0].flight_number, "CT X")
+
+        # Moving a flight retires the boards of the airport it left as well
+        other = Airport.objects.create(code="A99", name="A99", city="X", country="X")
+        version = board_version(self.airport.pk)
+        flight.departure_airport = other
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.save()
+        self.assertNotEqual(board_version(self.airport.pk), version)
+        self.assertEqual(self.boards("?start=2030-01-01")[0].count, 11)
+
+    def test_boards_read_through_their_indexes(self):
+        start = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+        for airport, time_field, index in (("departure_airport", "departure_time", "flight_airport_departure_idx"),
+                                           ("arrival_airport", "arrival_time", "flight_airport_arrival_idx")):
+            plan = Flight.objects.filter(**{
+                airport: self.airport, f"{time_field}__gte": start, f"{time_field}__lt": start + timedelta(days=1),
+            }).order_by(time_field, "id").explain()
+            self.assertIn(index, plan)
+
+    def test_ingest_invalidates_cached_boards(self):
+        version = board_version(self.airport.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_payload(make_payload([("KE 2", "A00", "ICN", 420)]))
+        self.assertNotEqual(board_version(self.airport.pk), version)
+
+
+class CartTotalsTests(TestCase):
+    """
+    Tests for the stored shopping cart totals.
+    """
+
+    def setUp(self):
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 400), ("KE 4", "ICN", "HND", 250)]))
+        self.user = User.objects.create_user("cart", password="pw")
+        self.cart = ShoppingCart.objects.create(user=self.user)
+        self.first, self.second = Flight.objects.order_by("flight_number")
+        self.rental = AirplaneRental.objects.create(aircraft=AircraftType.objects.get(), rental_cost="1000.00")
+
+    def assertTotals(self, items, subtotal):
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (items, Decimal(subtotal)))
+
+    def test_follows_line_changes(self):
+        line = ShoppingCartFlight.objects.create(cart=self.cart, flight=self.first, quantity=2)
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.second)
+        rental = ShoppingCartRental.objects.create(cart=self.cart, rental=self.rental, rental_days=3)
+        self.assertTotals(4, "4050.00")
+
+        line.quantity = 1
+        line.save()
+        rental.rental_days = 2
+        rental.save()
+        self.assertTotals(3, "2650.00")
+
+        line.delete()
+        rental.delete()
+        self.assertTotals(1, "250.00")
+
+    def test_follows_price_changes(self):
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.first, quantity=2)
+        ShoppingCartRental.objects.create(cart=self.cart, rental=self.rental, rental_days=3)
+
+        self.first.cost = 450
+        self.first.save()
+        self.assertTotals(3, "3900.00")
+
+        self.rental.rental_cost = Decimal("900.00")
+        self.rental.save()
+        self.assertTotals(3, "3600.00")
+
+        # The ingest engine reprices carts without model signals
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 380)]))
+        self.assertTotals(3, "3460.00")
+
+    def test_deleting_a_flight_removes_its_lines(self):
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.first, quantity=2)
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.second)
+        ShoppingCartRental.objects.create(cart=self.cart, rental=self.rental, rental_days=3)
+
+        Flight.objects.get(pk=self.first.pk).delete()
+        self.assertTotals(2, "3250.00")
+        AirplaneRental.objects.get(pk=self.rental.pk).delete()
+        self.assertTotals(1, "250.00")
+
+    def test_reconcile_reports_and_repairs_drift(self):
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.first)
+        ShoppingCart.objects.filter(pk=self.cart.pk).update(item_count=7, subtotal=0)
+
+        out = StringIO()
+        call_command("reconcile_cart_totals", stdout=out)
+        self.assertIn("1 carts have drifted", out.getvalue())
+        self.assertTotals(7, "0.00")
+
+        call_command("reconcile_cart_totals", "--fix", stdout=StringIO())
+        self.assertTotals(1, "400.00")
+        out = StringIO()
+        call_command("reconcile_cart_totals", stdout=out)
+        self.assertIn("All cart totals match", out.getvalue())
+
+    def test_header_shows_stored_totals(self):
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.second, quantity=2)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("airport_list"))
+        self.assertContains(response, "Cart (2) $500.00")
+
+
+class RouteDayFareTests(TestCase):
+    """
+    Tests for the cheapest fare per route and day and the fare calendar.
+    """
+
+    def setUp(self):
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 400), ("KE 4", "HND", "ICN", 250), ("KE 6", "ICN", "HND", 300)]))
+        self.hnd, self.icn = Airport.objects.get(code="HND"), Airport.objects.get(code="ICN")
+
+    def fares(self):
+        return sorted(RouteDayFare.objects.values_list(
+            'departure_airport__code', 'arrival_airport__code', 'date', 'min_cost', 'flight_count'
+        ))
+
+    def test_follows_imports_and_flight_writes(self):
+        day = date(2024, 12, 23)
+        self.assertEqual(self.fares(), [
+            ("HND", "ICN", day, Decimal("250.00"), 2),
+            ("ICN", "HND", day, Decimal("300.00"), 1),
+        ])
+
+        # The cheapest flight gets dearer, as through FlightUpdateView
+        cheapest = Flight.objects.get(flight_number="KE 4")
+        cheapest.cost = 500
+        cheapest.save()
+        self.assertEqual(self.fares()[0], ("HND", "ICN", day, Decimal("400.00"), 2))
+
+        # and moves to the next day, leaving one flight behind
+        cheapest.departure_time += timedelta(days=1)
+        cheapest.save()
+        self.assertEqual(self.fares()[:2], [
+            ("HND", "ICN", day, Decimal("400.00"), 1),
+            ("HND", "ICN", day + timedelta(days=1), Decimal("500.00"), 1),
+        ])
+
+        # Deleting the last flight of a day removes the day
+        Flight.objects.get(flight_number="KE 6").delete()
+        self.assertNotIn("ICN", [row[0] for row in self.fares()])
+
+        # Re-imports recompute the days flights leave and join
+        ingest_payload(make_payload([("KE 4", "HND", "ICN", 100)]))
+        self.assertEqual(self.fares(), [("HND", "ICN", day, Decimal("100.00"), 2)])
+
+    def test_recompute_locks_its_route_days(self):
+        # SQLite has no row locks; pretend it does to run the locking path
+        features = mock.Mock(has_select_for_update=True)
+        day = date(2024, 12, 23)
+        with mock.patch("flights.fares.connection", mock.Mock(features=features)), \
+                CaptureQueriesContext(connection) as queries:
+            cheapest = Flight.objects.get(flight_number="KE 4")
+            cheapest.departure_time += timedelta(days=1)
+            cheapest.save()
+            Flight.objects.get(flight_number="KE 6").delete()
+
+        self.assertEqual(self.fares(), [
+            ("HND", "ICN", day, Decimal("400.00"), 1),
+            ("HND", "ICN", day + timedelta(days=1), Decimal("250.00"), 1),
+        ])
+        placeholders = [q["sql"] for q in queries if q["sql"].startswith('INSERT OR IGNORE INTO "flights_routedayfare"')]
+        self.assertEqual(len(placeholders), 2)  # One per recompute, before the flights are read
+
+    def test_rebuild_matches_incremental_rows(self):
+        make_catalog()  # bulk_create, which skips the signals
+        incremental = self.fares()
+        self.assertEqual(len(incremental), 2)
+
+        out = StringIO()
+        call_command("rebuild_route_fares", stdout=out)
+        rebuilt = self.fares()
+        self.assertIn(f"Wrote {len(rebuilt)} route days", out.getvalue())
+        self.assertGreater(len(rebuilt), len(incremental))
+        self.assertTrue(set(incremental) <= set(rebuilt))
+        first = Flight.objects.get(flight_number="CT 0")
+        self.assertIn(
+            (first.departure_airport.code, first.arrival_airport.code, date(2030, 1, 1), Decimal("100.00"), 1), rebuilt
+        )
+
+    def test_calendar_reads_the_month_in_one_query(self):
+        Flight.objects.filter(flight_number="KE 2").update(cost=999)  # Behind the app's back: the table still says 250
+        url = reverse("fare_calendar") + f"?departure_airport={self.hnd.pk}&arrival_airport={self.icn.pk}&month=2024-12"
+        get_airport_catalog()
+        # catalog version, the month's fares
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, "Cheapest day: Mon, Dec 23 from $250.00")
+        self.assertContains(response, "2 flights")
+        self.assertContains(response, "&date_from=2024-12-23&date_to=2024-12-23&sort=price")
+
+        response = self.client.get(url.replace("2024-12", "2025-01"))
+        self.assertContains(response, "No flights on this route in January 2025.")
+        self.assertContains(response, "month=2024-12")  # Link back to December
+
+
+class SeatHoldTests(TestCase):
+    """
+    Tests for seat holds taken when flights are added to carts.
+    """
+
+    def setUp(self):
+        ingest_payload(make_payload(), seats_left=2)
+        self.flight = Flight.objects.get()
+        self.user = User.objects.create_user("holder", password="pw")
+        self.cart = ShoppingCart.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def add(self):
+        return self.client.post(reverse("add_to_cart", args=[self.flight.pk]))
+
+    def seats_left(self):
+        return Flight.objects.values_list("seats_left", flat=True).get(pk=self.flight.pk)
+
+    def test_adding_holds_seats_until_sold_out(self):
+        self.assertRedirects(self.add(), reverse("shopping_cart"))
+        self.assertRedirects(self.add(), reverse("shopping_cart"))
+        self.assertEqual(self.seats_left(), 0)
+        self.assertEqual(SeatHold.objects.filter(cart=self.cart).count(), 2)
+
+        response = self.add()
+        self.assertRedirects(response, reverse("flight_detail", args=[self.flight.pk]), fetch_redirect_response=False)
+        self.assertContains(self.client.get(response.url), "no seats left")
+        self.assertEqual(self.seats_left(), 0)
+        self.assertEqual(ShoppingCartFlight.objects.filter(cart=self.cart).count(), 2)
+        self.assertEqual(self.client.post(reverse("add_to_cart", args=[0])).status_code, 404)
+
+    def test_hold_is_all_or_nothing(self):
+        with self.assertRaises(SeatsUnavailable):
+            hold_seats(self.cart, self.flight.pk, seats=3)
+        self.assertEqual(self.seats_left(), 2)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_sweeper_releases_only_expired_holds(self):
+        expired = hold_seats(self.cart, self.flight.pk)
+        hold_seats(self.cart, self.flight.pk)
+        SeatHold.objects.filter(pk=expired.pk).update(expires_at=expired.created_at - timedelta(minutes=1))
+
+        out = StringIO()
+        call_command("release_expired_holds", stdout=out)
+        self.assertIn("Released 1 expired", out.getvalue())
+        self.assertEqual(self.seats_left(), 1)
+        self.assertEqual(release_expired_holds(), 0)
+
+    def test_hold_released_twice_returns_its_seats_once(self):
+        hold = hold_seats(self.cart, self.flight.pk)
+        self.assertEqual(release_holds(SeatHold.objects.filter(pk=hold.pk)), 1)
+
+        # A second sweeper that read the hold before the first one deleted it
+        stale = mock.Mock()
+        stale.select_for_update.return_value.values_list.return_value = [(hold.pk, self.flight.pk, hold.seats)]
+        self.assertEqual(release_holds(stale), 0)
+        self.assertEqual(self.seats_left(), 2)
+
+    def test_deleting_the_cart_releases_its_holds(self):
+        self.add()
+        self.add()
+        self.client.post(reverse("delete_cart"))
+        self.assertEqual(self.seats_left(), 2)
+        self.assertFalse(SeatHold.objects.exists())
+
+
+class FlightArchiveTests(TestCase):
+    """
+    Tests for moving departed flights into the archive.
+    """
+
+    def setUp(self):
+        google_flights_cache.clear()
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 400), ("KE 4", "HND", "ICN", 250), ("KE 6", "ICN", "HND", 300)]))
+        departed = Flight.objects.get(flight_number="KE 2")
+        self.upcoming = Flight.objects.create(
+            flight_number="KE 8", departure_airport=departed.departure_airport, arrival_airport=departed.arrival_airport,
+            departure_time=datetime(2030, 1, 1, 8, tzinfo=dt_timezone.utc),
+            arrival_time=datetime(2030, 1, 1, 10, tzinfo=dt_timezone.utc),
+            cost=500, aircraft=departed.aircraft, seats_left=10,
+        )
+        self.user = User.objects.create_user("archivist", password="pw")
+        self.cart = ShoppingCart.objects.create(user=self.user)
+        hold_seats(self.cart, departed.pk)
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=departed, quantity=2)
+        ShoppingCartFlight.objects.create(cart=self.cart, flight=self.upcoming)
+        self.client.force_login(self.user)
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command("archive_flights", "--before", "2025-01-01", *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_departed_flights_in_batches(self):
+        ids = set(Flight.objects.filter(flight_number__in=["KE 2", "KE 4", "KE 6"]).values_list('pk', flat=True))
+        output = self.archive("--batch-size", "2")
+
+        self.assertIn("Archived 2 flights...", output)
+        self.assertIn("Archived 3 flights departing before", output)
+        self.assertEqual(list(Flight.objects.values_list('flight_number', flat=True)), ["KE 8"])
+        self.assertEqual(set(FlightArchive.objects.values_list('pk', flat=True)), ids)
+        self.assertEqual(FlightArchive.objects.get(flight_number="KE 4").cost, 250)
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(list(RouteDayFare.objects.values_list('date', flat=True)), [date(2030, 1, 1)])
+        self.assertEqual(search_flights("KE"), [self.upcoming])
+
+        # Nothing is left to move on a second run
+        self.assertIn("Archived 0 flights", self.archive())
+        with self.assertRaises(CommandError):
+            call_command("archive_flights", "--before", "2999-01-01", stdout=StringIO())
+
+    def test_carts_keep_archived_flights(self):
+        self.archive()
+        line = ShoppingCartFlight.objects.get(quantity=2)
+        self.assertIsNone(line.flight_id)
+        self.assertEqual(line.flight_record.flight_number, "KE 2")
+        self.assertEqual(list(find_drift()), [])
+        self.assertEqual(ShoppingCart.objects.get().subtotal, Decimal("1300.00"))
+
+        response = self.client.get(reverse("shopping_cart"))
+        self.assertContains(response, "KE 2 (departed)")
+        self.assertContains(response, "$400.00 x 2")
+
+        # Departed lines are reported without asking SerpAPI
+        with StubSerpApi() as stub, mock.patch(
+            "flights.views.get_client", return_value=SerpApiClient(api_key="test", endpoint=stub.endpoint, retries=0),
+        ):
+            response = self.client.get(reverse("checkout"))
+        self.assertEqual(stub.requests, 1)
+        self.assertEqual(response.context["serpapi_results"][0], {"error": "This flight has already departed."})
+
+        # Removing the line takes its cost off the cart
+        line.delete()
+        self.assertEqual(ShoppingCart.objects.get().subtotal, Decimal("500.00"))
+
+    def test_flight_list_unions_the_archive_on_request(self):
+        self.archive()
+        live = self.client.get(reverse("all_flights"))
+        self.assertEqual([flight.flight_number for flight in live.context["flights"]], ["KE 8"])
+
+        # Session, user, catalog version and cart, then the union's count and page and one query per table
+        with self.assertNumQueries(8):
+            history = self.client.get(reverse("all_flights"), {"history": "1", "sort": "-price", "pagination": "keyset"})
+        self.assertEqual(
+            [flight.flight_number for flight in history.context["flights"]], ["KE 8", "KE 2", "KE 6", "KE 4"],
+        )
+        self.assertEqual(history.context["pagination_mode"], "offset")
+        self.assertContains(history, "KE 4 <small>(departed)</small>")
+
+        searched = self.client.get(reverse("all_flights"), {"history": "1", "q": "KE 4", "sort": "relevance"})
+        self.assertEqual([flight.flight_number for flight in searched.context["flights"]], ["KE 4"])
+
+
+class FragmentCacheTests(TestCase):
+    """
+    Tests for the cached flight cards and board rows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(flights=12)
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def card_stats(self):
+        return fragment_stats()["flights/flight_card.html"]
+
+    def test_second_render_comes_from_the_cache(self):
+        first = self.client.get(reverse("all_flights")).content
+        self.assertEqual(self.card_stats(), {"hits": 0, "misses": 10, "hit_rate": 0.0})
+        self.assertEqual(self.client.get(reverse("all_flights")).content, first)
+        self.assertEqual(self.card_stats(), {"hits": 10, "misses": 10, "hit_rate": 0.5})
+        out = StringIO()
+        call_command("fragment_cache_stats", stdout=out)
+        self.assertIn("flights/flight_card.html: 10 hits, 10 misses, hit rate 50.0%", out.getvalue())
+
+    def test_flight_and_airport_changes_retire_their_fragments(self):
+        self.client.get(reverse("all_flights"))
+        flight = Flight.objects.order_by("departure_time").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.cost = 999
+            flight.save()
+        self.assertContains(self.client.get(reverse("all_flights")), "$999.00")
+        self.assertEqual(self.card_stats()["misses"], 11)
+
+        airport = flight.arrival_airport
+        with self.captureOnCommitCallbacks(execute=True):
+            airport.name = "Renamed Field"
+            airport.save()
+        response = self.client.get(reverse("airport_detail", args=[airport.pk]) + "?start=2030-01-01")
+        self.assertContains(response, "Renamed Field")
+        self.assertContains(self.client.get(reverse("all_flights")), "Renamed Field")
+
+    def test_ingest_retires_fragments(self):
+        ingest_payload(make_payload())
+        self.assertContains(self.client.get(reverse("all_flights") + "?q=KE"), "$420.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_payload(make_payload([("KE 2", "HND", "ICN", 380)]))
+        self.assertContains(self.client.get(reverse("all_flights") + "?q=KE"), "$380.00")
+
+
+class AirportCatalogTests(TestCase):
+    """
+    Tests for the cached airport catalog behind the airport dropdowns.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(airports=3, flights=3)
+        cls.user = User.objects.create_user("catalog", password="pw")
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_loads_once_and_marks_the_selection(self):
+        with self.assertNumQueries(1):
+            get_airport_catalog()
+        with self.assertNumQueries(0):
+            catalog = get_airport_catalog()
+
+        airport = Airport.objects.get(code="A01")
+        self.assertEqual(len(catalog), 3)
+        self.assertIn(f'<option value="{airport.pk}" selected>A01 International (A01)</option>', catalog.options(airport.pk))
+        self.assertIn('<option value="A01" selected>', catalog.options("A01", value="code"))
+        self.assertNotIn("selected", catalog.options("999"))
+
+    def test_airport_changes_retire_the_catalog(self):
+        airport = Airport.objects.get(code="A01")
+        get_airport_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            airport.name = "Ben & Jerry Field"
+            airport.save()
+        self.assertContains(self.client.get(reverse("all_flights")), "Ben &amp; Jerry Field (A01)</option>", count=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_payload(make_payload())
+        self.assertContains(self.client.get(reverse("itinerary_search")), "HND Airport (HND)</option>", count=2)
+
+    def test_update_form_uses_the_catalog(self):
+        flight = Flight.objects.first()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("flight-update", args=[flight.pk]))
+        self.assertContains(response, f'<option value="{flight.departure_airport_id}" selected>')
+        self.assertEqual(len(response.context["form"].fields["arrival_airport"].choices), 4)
+
+
+class FlightDataTests(TestCase):
+    """
+    Tests for the JSON API and the streaming exports.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(flights=25)
+        cls.origin = Airport.objects.order_by("pk").first()
+
+    def test_api_walks_every_flight_with_cursors(self):
+        url, seen = reverse("api-flights") + "?limit=10&sort=-price&count=exact", []
+        while url:
+            data = self.client.get(url).json()
+            self.assertEqual(data["count"], 25)
+            seen += [row["flight_number"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(seen, list(Flight.objects.order_by("-cost", "-id").values_list("flight_number", flat=True)))
+
+        row = self.client.get(reverse("api-flights") + "?limit=1").json()["results"][0]
+        self.assertEqual(row["departure_airport"], "A00")
+        self.assertEqual(row["cost"], "100.00")
+        self.assertEqual(self.client.get(reverse("api-flights") + "?cursor=junk").status_code, 400)
+
+    def test_exports_stream_values_with_the_list_filters(self):
+        params = f"?departure_airport={self.origin.pk}&min_cost=105"
+        expected = list(
+            Flight.objects.filter(departure_airport=self.origin, cost__gte=105)
+            .order_by("departure_time", "id").values_list("flight_number", flat=True)
+        )
+        # Rows are read as values(), never as Flight instances
+        with mock.patch.object(Flight, "from_db", side_effect=AssertionError("model instance built")):
+            response = self.client.get(reverse("export-ndjson") + params)
+            self.assertTrue(response.streaming)
+            lines = b"".join(response.streaming_content).decode().splitlines()
+            self.assertEqual([json.loads(line)["flight_number"] for line in lines], expected)
+
+            response = self.client.get(reverse("export-csv") + params)
+            self.assertEqual(response["Content-Type"], "text/csv")
+            rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(",")[:3], ["id", "flight_number", "departure_airport"])
+        self.assertEqual([row.split(",")[1] for row in rows[1:]], expected)
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Tests for ETag and Last-Modified handling on catalog pages.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(flights=12)
+        cls.flight = Flight.objects.first()
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def revalidate(self, url, response, queries):
+        """
+        Repeats a GET with the validators of `response` and returns the status code.
+        """
+        with self.assertNumQueries(queries):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code
+
+    def test_flight_page_answers_304_until_the_flight_changes(self):
+        url = reverse("flight_detail", args=[self.flight.pk])
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+        self.assertEqual(self.revalidate(url, response, 1), 304)  # Just the flight versions
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+        # Seats taken by a hold show on the page, so they change the ETag too
+        user = User.objects.create_user("etag", password="pw")
+        hold_seats(ShoppingCart.objects.create(user=user), self.flight.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_list_pages_follow_the_catalog_version(self):
+        url = reverse("all_flights") + "?sort=price"
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response, 1), 304)  # Just the catalog version
+        self.assertEqual(self.client.get(reverse("all_flights"), HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+        ingest_payload(make_payload())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+        airport_url = reverse("airport_detail", args=[self.flight.departure_airport_id])
+        response = self.client.get(airport_url)
+        self.assertNotIn("Last-Modified", response)  # Boards move with the clock
+        self.assertEqual(self.revalidate(airport_url, response, 1), 304)
+        airport = Airport.objects.get(pk=self.flight.departure_airport_id)
+        airport.save()
+        self.assertEqual(self.client.get(airport_url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_etags_cover_the_logged_in_user_and_cart(self):
+        url = reverse("airport_list")
+        anonymous = self.client.get(url)
+        user = User.objects.create_user("viewer", password="pw")
+        self.client.force_login(user)
+        self.client.get(url)  # Sets the CSRF cookie the next ETags include
+        response = self.client.get(url)
+        self.assertNotEqual(response["ETag"], anonymous["ETag"])
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        ShoppingCartFlight.objects.create(cart=ShoppingCart.objects.create(user=user), flight=self.flight)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+
+class RequestMetricsTests(TestCase):
+    """
+    Tests for the request timing middleware and the Prometheus metrics endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(flights=12)
+
+    def setUp(self):
+        caches["default"].clear()
+        metrics_registry.reset()
+
+    def test_server_timing_splits_the_request(self):
+        with self.assertNumQueries(4) as queries:
+            response = self.client.get(reverse("all_flights"))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertRegex(timing, r"tpl;dur=\d+\.\d, total;dur=\d+\.\d$")
+        self.assertNotIn("http;", timing)  # No outbound requests
+
+    @override_settings(FLIGHTS_METRICS={**settings.FLIGHTS_METRICS, "ALLOWED_IPS": ("127.0.0.1",)})
+    def test_metrics_endpoint_serves_per_view_histograms(self):
+        self.client.get(reverse("all_flights"))
+        self.client.get(reverse("all_flights"))
+        self.client.get("/flights/no-such-page/")
+        body = self.client.get(reverse("metrics")).content.decode()
+
+        self.assertIn("# TYPE flights_request_duration_seconds histogram", body)
+        self.assertIn('flights_request_duration_seconds_count{view="all_flights"} 2', body)
+        self.assertIn('flights_db_queries_bucket{view="all_flights",le="+Inf"} 2', body)
+        self.assertIn('flights_responses_total{view="<unmatched>",status="404"} 1', body)
+        self.assertIn('flights_fragment_cache_misses_total{template="flights/flight_card.html"} 10', body)
+
+    def test_metrics_are_limited_to_staff_and_allowed_addresses(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.1.2.3").status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code, 403)  # A proxy's address
+        with override_settings(FLIGHTS_METRICS={**settings.FLIGHTS_METRICS, "ALLOWED_IPS": ("10.1.2.3",)}):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR="10.1.2.3").status_code, 200)
+        staff = User.objects.create_user("ops", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.1.2.3").status_code, 200)
+
+
+@override_settings(FLIGHTS_DATABASES={**settings.FLIGHTS_DATABASES, "REPLICAS": ["replica"]})
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Tests for the primary/replica router, with the replica synced from the primary by hand.
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        caches["default"].clear()
+        make_catalog(flights=3)
+        self.flight = Flight.objects.order_by("pk").first()
+        self.user = User.objects.create_user("reader", password="pw")
+        self.client.force_login(self.user)
+        sync_replica("replica")
+
+    def test_read_only_requests_read_the_replica(self):
+        url = reverse("flight_detail", args=[self.flight.pk])
+        Flight.objects.filter(pk=self.flight.pk).delete()
+        self.assertEqual(self.client.get(url).status_code, 200)  # The replica has not caught up
+        self.assertEqual(self.client.post(reverse("add_to_cart", args=[self.flight.pk])).status_code, 404)
+
+        sync_replica("replica")
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_users_read_their_own_writes(self):
+        response = self.client.post(reverse("add_to_cart", args=[self.flight.pk]))
+        self.assertIn("flights_primary", response.cookies)
+        self.assertContains(self.client.get(reverse("airport_list")), "Cart (1)")
+
+        del self.client.cookies["flights_primary"]  # Once the cookie expires the replica is read again
+        self.assertNotContains(self.client.get(reverse("airport_list")), "Cart (1)")
+
+    def test_caches_are_filled_from_the_primary(self):
+        airport = self.flight.departure_airport
+        airport.name = "Renamed Field"
+        airport.save()
+        self.flight.flight_number = "CT NEW"
+        self.flight.save()
+
+        # The replica has not caught up, but nothing cached shows its old rows
+        self.assertContains(self.client.get(reverse("all_flights")), "Renamed Field")
+        response = self.client.get(reverse("airport_detail", args=[airport.pk]) + "?start=2030-01-01")
+        self.assertContains(response, "CT NEW")
+        self.assertEqual(response.context["departing_flights"].object_list[0].flight_number, "CT NEW")
+
+    def test_sqlite_connections_wait_for_locks(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+
+class AsyncViewTests(TestCase):
+    """
+    Tests for the async checkout and import views served under ASGI.
+    """
+
+    def setUp(self):
+        google_flights_cache.clear()
+        ingest_payload(make_payload([("KE 2", "HND", "ICN", 420), ("KE 4", "ICN", "HND", 390)]))
+        self.user = User.objects.create_user("traveler", password="pw")
+        cart = ShoppingCart.objects.create(user=self.user)
+        for number in ("KE 2", "KE 2", "KE 4"):
+            ShoppingCartFlight.objects.create(cart=cart, flight=Flight.objects.get(flight_number=number))
+
+    def make_request(self, method, path, user=None, **kwargs):
+        """
+        Builds an async request as the session and auth middleware would leave it.
+        """
+        request = getattr(AsyncRequestFactory(), method)(path, **kwargs)
+        request.user = user or self.user
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        request._messages = CookieStorage(request)
+        return request
+
+    async def test_checkout_sends_queries_concurrently(self):
+        with StubSerpApi(delay=0.5) as stub, mock.patch(
+            "flights.views.get_async_client",
+            return_value=AsyncSerpApiClient(api_key="test", endpoint=stub.endpoint, retries=0),
+        ):
+            started = time.perf_counter()
+            response = await AsyncCheckoutView.as_view()(self.make_request("get", "/flights/checkout/"))
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stub.requests, 2)  # Two unique queries for three cart lines
+        self.assertLess(elapsed, 0.9)  # Not 1 s one after the other
+        self.assertContains(response, "ICN Airport")
+
+    async def test_import_is_queued_through_the_async_orm(self):
+        request = self.make_request(
+            "post", "/flights/flights/import/", headers={"accept": "application/json"},
+            data={"departure_id": "HND", "arrival_id": "ICN", "outbound_date": "2024-12-30"},
+        )
+        response = await AsyncFlightCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 202)
+        job = await ImportJob.objects.aget(pk=json.loads(response.content)["job_id"])
+        self.assertEqual((job.user_id, job.status), (self.user.pk, ImportJob.STATUS_QUEUED))
+
+        response = await AsyncFlightCreateView.as_view()(self.make_request("get", f"/flights/flights/import/?job={job.pk}"))
+        self.assertContains(response, "Import HND to ICN")
+
+    async def test_anonymous_users_are_sent_to_log_in(self):
+        request = self.make_request("get", "/flights/checkout/", user=AnonymousUser())
+        response = await AsyncCheckoutView.as_view()(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("?next=/flights/checkout/", response.url)
 
-# Create your tests here.
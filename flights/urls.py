@@ -6,6 +6,12 @@ from django.conf import settings
 from . import views
 from django.contrib.auth import views as auth_views
 
+# Under ASGI (cs412/asgi.py) the async views wait on SerpAPI without holding a thread
+if getattr(settings, 'FLIGHTS_ASYNC_VIEWS', False):
+    checkout_view, import_view = views.AsyncCheckoutView, views.AsyncFlightCreateView
+else:
+    checkout_view, import_view = views.CheckoutView, views.FlightCreateView
+
 # all of the URLs that are part of this app
 urlpatterns = [
     # All URLs for the flight app
@@ -20,12 +26,22 @@ urlpatterns = [
     path(r'cart/create/', views.ShoppingCartCreateView.as_view(), name='create_cart'), # Create Shopping Cart
     path(r'cart/add/<int:pk>/', views.AddFlightToCartView.as_view(), name='add_to_cart'), # Add things to Shopping Cart
     path(r'cart/delete/', views.DeleteShoppingCartView.as_view(), name='delete_cart'), # Delete Shopping Cart
-    path(r'checkout/', views.CheckoutView.as_view(), name='checkout'),  # Checkout view
+    path(r'checkout/', checkout_view.as_view(), name='checkout'),  # Checkout view
+
+    path(r'api/flights/', views.FlightApiView.as_view(), name='api-flights'),  # JSON API with cursor pagination
+    path(r'export.ndjson', views.FlightExportView.as_view(), {'format': 'ndjson'}, name='export-ndjson'),  # Streamed NDJSON export
+    path(r'export.csv', views.FlightExportView.as_view(), {'format': 'csv'}, name='export-csv'),  # Streamed CSV export
+
+    path(r'metrics', views.MetricsView.as_view(), name='metrics'),  # Prometheus request metrics
+
+    path(r'itineraries/', views.ItinerarySearchView.as_view(), name='itinerary_search'),  # Connecting flight search
+    path(r'fares/', views.FareCalendarView.as_view(), name='fare_calendar'),  # Cheapest fare per day on a route
 
     path(r'airports/', views.AirportListView.as_view(), name='airport_list'),  # URL for the list of airports
     path(r'airports/<int:pk>/', views.AirportDetailView.as_view(), name='airport_detail'),  # URL for airport details
 
-    path(r'flights/import/', views.FlightCreateView.as_view(), name='import-flights'), # Create new flights
+    path(r'flights/import/', import_view.as_view(), name='import-flights'), # Create new flights
+    path(r'flights/import/jobs/<int:pk>/', views.ImportJobStatusView.as_view(), name='import-job-status'), # Poll an import job
     path(r'flights/<int:pk>/update/', views.FlightUpdateView.as_view(), name='flight-update'), # Update flights
     path(r'flights/<int:pk>/delete/', views.FlightDeleteView.as_view(), name='flight-delete'), # Delete a flight
 ]
\ No newline at end of file
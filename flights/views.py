@@ -5,25 +5,54 @@
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
 from django.urls import reverse_lazy
 from django.shortcuts import render
-from .models import Flight, Airport, AirplaneRental, ShoppingCart, ShoppingCartFlight, ShoppingCartRental, AircraftType
+from .models import Flight, FlightArchive, Airport, AirplaneRental, ShoppingCart, ShoppingCartFlight, ShoppingCartRental, AircraftType, ImportJob
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
 from django.contrib.auth.forms import UserCreationForm
 from django.http.response import HttpResponse as HttpResponse
 from django.http import HttpRequest
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import login
+from django.contrib.auth.views import redirect_to_login
 from typing import Any
+from datetime import date, MINYEAR, MAXYEAR
 from django.urls import reverse
-from django.http import HttpResponseRedirect
-import requests
+from django.http import HttpResponseRedirect, JsonResponse, Http404, StreamingHttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import asyncio
+import threading
+import time
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
 from django.contrib import messages
-from datetime import timedelta
-import random
+from django.core.exceptions import PermissionDenied
+from .import_jobs import aenqueue_import, enqueue_import
+from .pagination import KeysetPaginator, InvalidCursor
+from .filters import FlightFilter, SORT_CHOICES, SORT_ORDERINGS, DEFAULT_SORT, start_of_day
+from .serpapi_client import get_client, SerpApiError
+from .serpapi_async import get_async_client
+from .airport_catalog import get_airport_catalog
+from .boards import get_board
+from .fragments import render_fragments
+from .conditional import airport_etag, catalog_etag, catalog_last_modified, fare_calendar_etag, flight_etag, flight_last_modified
+from .context_processors import get_cart_summary
+from .export import flight_rows, flight_values, to_row, ndjson_lines, csv_lines
+from .seat_holds import hold_seats, SeatsUnavailable
+from .metrics import metrics_allowed, registry as metrics_registry
+from .itineraries import find_itineraries, SORT_OPTIONS as ITINERARY_SORT_OPTIONS, DEFAULT_MAX_LEGS
+from .fares import month_grid, shift_month
+from .archive import history_rows, load_history_page
 
 
 
 # List view for flights
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='dispatch')
 class FlightListView(ListView):
     """
     Displays a paginated list of all flights.
@@ -31,6 +60,17 @@ class FlightListView(ListView):
     This view is responsible for showing the available flights in the system.
     It supports searching by flight number and filtering based on departure 
     and arrival airports. The results are paginated for better user experience.
+
+    Flights are ordered by (departure_time, id) unless another sort order is
+    chosen with ?sort=. Pages use Django's numbered
+    paginator by default; with pagination mode 'keyset' (?pagination=keyset,
+    or the FLIGHTS_LIST_PAGINATION setting) they are read with cursors instead,
+    so deep pages cost the same as the first one. In keyset mode ?count=exact
+    or ?count=approx adds a total count, which is skipped by default.
+
+    Only live flights are listed unless ?history=1 asks for departed flights
+    from the archive as well (see flights/archive.py). That list is a UNION
+    of both tables, paginated by page number, and cannot be sorted by relevance.
     """
     model = Flight
     template_name = 'flights/show_all_flights.html'
@@ -41,24 +81,62 @@ class FlightListView(ListView):
         """
         Retrieves the queryset of flights to display based on search filters.
 
-        If a search query is provided (flight number, departure airport, or arrival airport),
-        it filters the flights accordingly.
+        Filters on a full-text search over flights and airports, departure and
+        arrival airports, the departure date range and the cost range (see
+        FlightFilter), ordered by the selected sort option.
         """
-        queryset = super().get_queryset()
-        query = self.request.GET.get('q')  # Text search
-        departure_airport = self.request.GET.get('departure_airport')  # Selected departure airport
-        arrival_airport = self.request.GET.get('arrival_airport')  # Selected arrival airport
+        self.filter = FlightFilter(self.request.GET)
+        if self.include_history():
+            if self.filter.sort == 'relevance':
+                self.filter.sort = DEFAULT_SORT  # Archived flights have no search rank
+            rows = history_rows(self.filter.apply(Flight.objects.all()), self.filter.apply_archive(FlightArchive.objects.all()))
+            return rows.order_by(*self.get_ordering())
+        queryset = Flight.objects.select_related('departure_airport', 'arrival_airport')
+        return self.filter.apply(queryset).order_by(*self.get_ordering())
 
-        if query:
-            queryset = queryset.filter(
-                Q(flight_number__icontains=query)  # Search by flight number
-            )
-        if departure_airport and departure_airport != "all":
-            queryset = queryset.filter(departure_airport__id=departure_airport)
-        if arrival_airport and arrival_airport != "all":
-            queryset = queryset.filter(arrival_airport__id=arrival_airport)
+    def include_history(self):
+        """
+        Returns True when the list should include archived flights.
+        """
+        return self.request.GET.get('history') == '1'
+
+    def get_ordering(self):
+        """
+        Returns the ordering for the selected sort option.
+        """
+        return self.filter.ordering
 
-        return queryset
+    def get_pagination_mode(self):
+        """
+        Returns 'keyset' or 'offset' for this request.
+        """
+        mode = self.request.GET.get('pagination') or getattr(settings, 'FLIGHTS_LIST_PAGINATION', 'offset')
+        return 'keyset' if mode == 'keyset' and not self.include_history() else 'offset'
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginates with cursors in keyset mode, and with Django's paginator otherwise.
+        """
+        if self.include_history():
+            # Turn the page of union rows into flights and archived flights
+            paginator, page, rows, is_paginated = super().paginate_queryset(queryset, page_size)
+            page.object_list = load_history_page(rows)
+            return (paginator, page, page.object_list, is_paginated)
+        if self.get_pagination_mode() != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        ordering = self.get_ordering()
+        if self.filter.sort == 'relevance':
+            # Search ranks are not columns a cursor can seek on
+            ordering = SORT_ORDERINGS[DEFAULT_SORT]
+        paginator = KeysetPaginator(
+            queryset, page_size, ordering=ordering, count=self.request.GET.get('count', 'none')
+        )
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         """
@@ -71,16 +149,41 @@ class FlightListView(ListView):
         context['search_query'] = self.request.GET.get('q', '')  # Pass search term to template
         context['selected_departure_airport'] = self.request.GET.get('departure_airport', 'all')  # Selected departure airport
         context['selected_arrival_airport'] = self.request.GET.get('arrival_airport', 'all')  # Selected arrival airport
-        context['airports'] = Airport.objects.all()  # Pass all airports to template
+        # Airport dropdowns, pre-rendered by the airport catalog
+        airports = get_airport_catalog()
+        context['departure_airport_options'] = airports.options(context['selected_departure_airport'])
+        context['arrival_airport_options'] = airports.options(context['selected_arrival_airport'])
         context['user'] = self.request.user # Return a user
-
-        if self.request.user.is_authenticated: # Checking if user is authenticated to create carts
-            context['has_cart'] = ShoppingCart.objects.filter(user=self.request.user).exists()
-        else:
-            context['has_cart'] = False
+        context['pagination_mode'] = self.get_pagination_mode()
+        context['date_from'] = self.request.GET.get('date_from', '')  # Departure date range
+        context['date_to'] = self.request.GET.get('date_to', '')
+        context['min_cost'] = self.request.GET.get('min_cost', '')  # Cost range
+        context['max_cost'] = self.request.GET.get('max_cost', '')
+        context['sort'] = self.filter.sort  # Selected sort order
+        context['sort_choices'] = SORT_CHOICES
+        context['include_history'] = self.include_history()
+
+        # Page links keep every filter parameter and only swap the page or cursor
+        filters = self.request.GET.copy()
+        filters.pop('page', None)
+        filters.pop('cursor', None)
+        context['page_link_prefix'] = f"?{filters.urlencode()}&" if filters else "?"
+
+        # Flight cards come from the fragment cache, rendering only the ones it misses
+        flights = context['flights']
+        cards = iter(render_fragments('flights/flight_card.html', [f for f in flights if isinstance(f, Flight)]))
+        context['flight_cards'] = [
+            next(cards) if isinstance(flight, Flight)
+            else render_to_string('flights/archived_flight_card.html', {'flight': flight})
+            for flight in flights
+        ]
+
+        # Checking if the user has a cart, from the same row the navigation bar uses
+        context['has_cart'] = get_cart_summary(self.request) is not None
         return context
 
 # Detail view for a specific flight
+@method_decorator(condition(etag_func=flight_etag, last_modified_func=flight_last_modified), name='dispatch')
 class FlightDetailView(DetailView):
     """
     Displays detailed information about a specific flight.
@@ -90,6 +193,7 @@ class FlightDetailView(DetailView):
     """
 
     model = Flight
+    queryset = Flight.objects.select_related('departure_airport', 'arrival_airport')
     template_name = 'flights/flight_detail.html'
     context_object_name = 'flight'
 
@@ -106,10 +210,8 @@ class FlightDetailView(DetailView):
         context['departure_airport'] = self.object.departure_airport
         context['arrival_airport'] = self.object.arrival_airport
 
-        if self.request.user.is_authenticated: # Checking if user is authenticated to create carts
-            context['has_cart'] = ShoppingCart.objects.filter(user=self.request.user).exists()
-        else:
-            context['has_cart'] = False
+        # Checking if the user has a cart, from the same row the navigation bar uses
+        context['has_cart'] = get_cart_summary(self.request) is not None
         return context
 
 
@@ -118,112 +220,130 @@ class FlightCreateView(LoginRequiredMixin, CreateView):
     """
     Allows authenticated users to add flights by fetching data from an external API.
 
-    Users can specify departure and arrival airports and dates, and the system
-    fetches relevant flight data from an external service and saves it to the database.
+    Users can specify departure and arrival airports and dates. The request is
+    queued as an ImportJob and answered straight away; a background worker
+    fetches the flights from the external service and saves them to the
+    database while the form page polls the job status.
     """
 
     template_name = 'flights/import_flights.html'
+    use_primary_database = True  # Job status is written by the worker moments before (see flights/databases.py)
 
     def get(self, request, *args, **kwargs):
         """
-        Render the flight import form with available airports.
+        Render the flight import form with available airports, and the
+        status of a queued job when its id is passed as ?job=<id>.
         """
-        airports = Airport.objects.all()
-        return render(request, self.template_name, {"airports": airports})
+        context = {"airport_options": get_airport_catalog().options(value='code')}
+        job_id = request.GET.get("job")
+        if job_id and job_id.isdigit():
+            context["job"] = ImportJob.objects.filter(pk=job_id, user=request.user).first()
+        return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         """
-        Handle the flight import request triggered by the user.
+        Queue the flight import request triggered by the user and return immediately.
         """
         departure_id = request.POST.get("departure_id")
         arrival_id = request.POST.get("arrival_id")
-        outbound_date = request.POST.get("outbound_date")
-        departure_city = request.POST.get("departure_city")
-        departure_country = request.POST.get("departure_country")
-        arrival_city = request.POST.get("arrival_city")
-        arrival_country = request.POST.get("arrival_country")
-
-
-        # API setup
-        api_key = "d764904413d0f85fcb35954a94356a3cb2c27e21726f437941bcdbfdeb166d3d"
-        endpoint = "https://serpapi.com/search"
-        params = {
-            "engine": "google_flights",
-            "departure_id": departure_id,
-            "arrival_id": arrival_id,
-            "outbound_date": outbound_date,
-            "currency": "USD",
-            "hl": "en",
-            "type": 2,
-            "api_key": api_key,
-        }
+        outbound_date = parse_date(request.POST.get("outbound_date") or "")
+
+        if not departure_id or not arrival_id or outbound_date is None:
+            messages.error(request, "Error importing flights: choose both airports and a valid date.")
+            return render(request, self.template_name, {"airport_options": get_airport_catalog().options(value='code')})
+
+        job = enqueue_import(
+            request.user, departure_id, arrival_id, outbound_date,
+            departure_city=request.POST.get("departure_city"),
+            departure_country=request.POST.get("departure_country"),
+            arrival_city=request.POST.get("arrival_city"),
+            arrival_country=request.POST.get("arrival_country"),
+        )
+
+        status_url = reverse('import-job-status', kwargs={'pk': job.pk})
+        if "application/json" in request.headers.get("Accept", ""):
+            return JsonResponse({"job_id": job.pk, "status_url": status_url}, status=202)
+        return redirect(f"{reverse('import-flights')}?job={job.pk}")
+
+
+class AsyncLoginRequiredMixin:
+    """
+    LoginRequiredMixin for async views: loads the user without blocking the event loop.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncFlightCreateView(AsyncLoginRequiredMixin, View):
+    """
+    Async version of FlightCreateView for ASGI servers, routed to when
+    FLIGHTS_ASYNC_VIEWS is on. It reads and queues jobs through the async
+    queryset API; the SerpAPI fetch stays with the import worker.
+    """
+
+    template_name = FlightCreateView.template_name
+    use_primary_database = True
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Render the flight import form, and the status of the job passed as ?job=<id>.
+        """
+        context = {"airport_options": await self.airport_options()}
+        job_id = request.GET.get("job")
+        if job_id and job_id.isdigit():
+            context["job"] = await ImportJob.objects.filter(pk=job_id, user=await request.auser()).afirst()
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    async def post(self, request, *args, **kwargs):
+        """
+        Queue the flight import request triggered by the user and return immediately.
+        """
+        departure_id = request.POST.get("departure_id")
+        arrival_id = request.POST.get("arrival_id")
+        outbound_date = parse_date(request.POST.get("outbound_date") or "")
+
+        if not departure_id or not arrival_id or outbound_date is None:
+            messages.error(request, "Error importing flights: choose both airports and a valid date.")
+            return await sync_to_async(render)(request, self.template_name, {"airport_options": await self.airport_options()})
+
+        job = await aenqueue_import(
+            await request.auser(), departure_id, arrival_id, outbound_date,
+            departure_city=request.POST.get("departure_city"),
+            departure_country=request.POST.get("departure_country"),
+            arrival_city=request.POST.get("arrival_city"),
+            arrival_country=request.POST.get("arrival_country"),
+        )
+
+        status_url = reverse('import-job-status', kwargs={'pk': job.pk})
+        if "application/json" in request.headers.get("Accept", ""):
+            return JsonResponse({"job_id": job.pk, "status_url": status_url}, status=202)
+        return redirect(f"{reverse('import-flights')}?job={job.pk}")
+
+    async def airport_options(self):
+        """
+        Returns the airport <option> tags, loading the catalog in a thread when it is not in memory.
+        """
+        catalog = await sync_to_async(get_airport_catalog)()
+        return catalog.options(value='code')
 
-        try:
-            # Fetch data from API
-            response = requests.get(endpoint, params=params)
-            if response.status_code != 200:
-                raise Exception(f"API Error: {response.status_code}, {response.text}")
-
-            data = response.json()
-            self.import_flights(data, departure_city, departure_country, arrival_city, arrival_country)
-            messages.success(request, "Flights imported successfully!")
-            return redirect("all_flights")
-        except Exception as e:
-            messages.error(request, f"Error importing flights: {str(e)}")
-            return render(request, self.template_name, {"airports": Airport.objects.all()})
-
-    def import_flights(self, data, departure_city, departure_country, arrival_city, arrival_country):
-        """
-        Manually Parses and imports flight data into the database.
-        """
-        for flight_data in data.get("best_flights", []):
-            for leg in flight_data["flights"]:
-                # Handle departure airport
-                departure_airport, _ = Airport.objects.get_or_create(
-                    name=leg["departure_airport"]["name"],
-                    code=leg["departure_airport"]["id"],
-                    defaults={
-                        "city": departure_city,
-                        "country": departure_country,
-                        "amenities": "",
-                        "avg_security_time": timedelta(minutes=random.randint(5, 30)),
-                    },
-                )
-
-
-                # Handle arrival airport
-                arrival_airport, _ = Airport.objects.get_or_create(
-                    name=leg["arrival_airport"]["name"],
-                    code=leg["arrival_airport"]["id"],
-                    defaults={
-                        "city": arrival_city,
-                        "country": arrival_country,
-                        "amenities": "",
-                        "avg_security_time": timedelta(minutes=random.randint(5, 30)),
-                    },
-                )
-
-
-                # Handle aircraft type
-                aircraft, _ = AircraftType.objects.get_or_create(
-                    model=leg.get("airplane", "Unknown"),
-                    seat_capacity=200,
-                )
-
-                # Create or update the flight
-                Flight.objects.update_or_create(
-                    flight_number=leg["flight_number"],
-                    defaults={
-                        "departure_airport": departure_airport,
-                        "arrival_airport": arrival_airport,
-                        "departure_time": leg["departure_airport"]["time"],
-                        "arrival_time": leg["arrival_airport"]["time"],
-                        "cost": flight_data.get("price", 0.0),
-                        "aircraft": aircraft,
-                        "amenities": ", ".join(leg.get("extensions", [])),
-                        "seats_left": random.randint(50, 200),
-                    },
-                )
+
+# Status of a queued flight import
+class ImportJobStatusView(LoginRequiredMixin, View):
+    """
+    Reports the progress, counts and error of one of the user's import jobs as JSON.
+    """
+    use_primary_database = True  # The worker updates the job on the primary
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the job status, or 404 if the job does not belong to the user.
+        """
+        job = get_object_or_404(ImportJob, pk=kwargs['pk'], user=request.user)
+        return JsonResponse(job.as_status())
 
 
 # Update view for editing a flight
@@ -239,12 +359,21 @@ class FlightUpdateView(LoginRequiredMixin, UpdateView):
         'amenities', 'seats_left'
     ]
 
+    def get_form(self, form_class=None):
+        """
+        Fills the airport dropdowns from the airport catalog instead of a query per field.
+        """
+        form = super().get_form(form_class)
+        choices = [('', '---------')] + get_airport_catalog().choices()
+        for name in ('departure_airport', 'arrival_airport'):
+            form.fields[name].choices = choices
+        return form
+
     def get_context_data(self, **kwargs):
         """
         Add additional context to the template.
         """
         context = super().get_context_data(**kwargs)
-        context['airports'] = Airport.objects.all()
         context['aircrafts'] = AircraftType.objects.all()
         return context
 
@@ -269,7 +398,208 @@ class FlightDeleteView(LoginRequiredMixin, DeleteView):
         return reverse('all_flights')
 
 
+# Multi-leg itinerary search
+class ItinerarySearchView(View):
+    """
+    Finds itineraries of up to three connecting flights between two airports
+    on a given day, cheapest or fastest first (see flights/itineraries.py).
+    """
+    template_name = 'flights/itinerary_search.html'
+    max_results = 10  # Itineraries shown per search
+
+    def get(self, request, *args, **kwargs):
+        """
+        Shows the search form, and the matching itineraries once an origin,
+        destination and date are given.
+        """
+        origin = request.GET.get('origin', '')
+        destination = request.GET.get('destination', '')
+        date = request.GET.get('date', '')
+        sort = request.GET.get('sort', 'cheapest')
+        if sort not in ITINERARY_SORT_OPTIONS:
+            sort = 'cheapest'
+        max_legs = request.GET.get('max_legs', '')
+        max_legs = int(max_legs) if max_legs in ('1', '2', '3') else DEFAULT_MAX_LEGS
+
+        itineraries = None  # None until a complete search is submitted
+        try:
+            day = parse_date(date) if date else None
+        except ValueError:
+            day = None
+        if origin.isdigit() and destination.isdigit() and day:
+            itineraries = find_itineraries(
+                int(origin), int(destination), day, k=self.max_results, max_legs=max_legs, sort=sort
+            )
+
+        airports = get_airport_catalog()
+        context = {
+            'origin_options': airports.options(origin),
+            'destination_options': airports.options(destination),
+            'origin': origin,
+            'destination': destination,
+            'date': date,
+            'sort': sort,
+            'sort_options': ITINERARY_SORT_OPTIONS,
+            'max_legs': max_legs,
+            'leg_options': [1, 2, 3],
+            'itineraries': itineraries,
+        }
+        return render(request, self.template_name, context)
+
+
+# Cheapest fare per day on a route
+@method_decorator(condition(etag_func=fare_calendar_etag, last_modified_func=catalog_last_modified), name='dispatch')
+class FareCalendarView(View):
+    """
+    Shows a month of a route as a calendar with the cheapest fare and number
+    of flights of each day, read from RouteDayFare in one query (see
+    flights/fares.py). Each day links to the flight list for that day.
+    """
+    template_name = 'flights/fare_calendar.html'
+
+    def get(self, request, *args, **kwargs):
+        """
+        Shows the route form, and the calendar once both airports are chosen.
+
+        ?departure_airport= and ?arrival_airport= are airport ids, ?month=
+        (YYYY-MM, default this month) the month shown.
+        """
+        departure = request.GET.get('departure_airport', '')
+        arrival = request.GET.get('arrival_airport', '')
+        month = self.parse_month(request.GET.get('month', ''))
+
+        weeks = cheapest = None  # None until a route is chosen
+        if departure.isdigit() and arrival.isdigit():
+            weeks, cheapest = month_grid(int(departure), int(arrival), month.year, month.month)
+
+        airports = get_airport_catalog()
+        route = f"departure_airport={departure}&arrival_airport={arrival}"
+        context = {
+            'departure_options': airports.options(departure),
+            'arrival_options': airports.options(arrival),
+            'departure_airport': departure,
+            'arrival_airport': arrival,
+            'month': month,
+            'route_query': route,
+            'previous_query': f"{route}&month={shift_month(month, -1):%Y-%m}",
+            'next_query': f"{route}&month={shift_month(month, 1):%Y-%m}",
+            'weekdays': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+            'weeks': weeks,
+            'cheapest': cheapest,
+        }
+        return render(request, self.template_name, context)
+
+    def parse_month(self, value):
+        """
+        Returns the first day of the month in ?month=, or of this month if it is missing or invalid.
+        """
+        try:
+            year, month = (int(part) for part in value.split('-'))
+            if MINYEAR < year < MAXYEAR:  # Leave room for the previous and next month links
+                return date(year, month, 1)
+        except ValueError:
+            pass
+        return timezone.localdate().replace(day=1)
+
+
+# Machine-readable flight catalog
+class FlightDataMixin:
+    """
+    Builds the flight queryset for the API and exports from the same query
+    parameters, and with the same FlightFilter, as the flight list.
+    Relevance sorting falls back to the default sort, since search ranks are
+    neither a stable cursor key nor an exported column.
+    """
+
+    def get_flight_filter(self):
+        """
+        Returns the FlightFilter for this request.
+        """
+        flight_filter = FlightFilter(self.request.GET)
+        if flight_filter.sort == 'relevance':
+            flight_filter.sort = DEFAULT_SORT
+        return flight_filter
+
+    def get_flights(self, flight_filter):
+        """
+        Returns the filtered, ordered flights.
+        """
+        return flight_filter.apply(Flight.objects.all()).order_by(*flight_filter.ordering)
+
+
+# JSON API for the flight catalog
+class FlightApiView(FlightDataMixin, View):
+    """
+    Returns one page of flights as JSON, read with cursors (see flights/pagination.py):
+
+        {"results": [...], "next": <url or null>, "previous": <url or null>, "count": <int or null>}
+
+    Takes the flight list filters, ?limit= (default 50, at most 500), ?cursor=
+    and ?count=exact or ?count=approx for a total.
+    """
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the page of flights that starts at ?cursor=.
+        """
+        flight_filter = self.get_flight_filter()
+        limit = request.GET.get('limit', '')
+        limit = min(int(limit), self.max_limit) if limit.isdigit() and int(limit) > 0 else self.default_limit
+        paginator = KeysetPaginator(
+            flight_values(self.get_flights(flight_filter)), limit,
+            ordering=flight_filter.ordering, count=request.GET.get('count', 'none'),
+        )
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return JsonResponse({"error": "Invalid page cursor."}, status=400)
+
+        params = request.GET.copy()
+        params.pop('cursor', None)
+
+        def link(cursor):
+            if cursor is None:
+                return None
+            params['cursor'] = cursor
+            return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+        return JsonResponse({
+            "results": [to_row(values) for values in page],
+            "next": link(page.next_cursor),
+            "previous": link(page.previous_cursor),
+            "count": page.total_count,
+        })
+
+
+# Streaming export of the flight catalog
+class FlightExportView(FlightDataMixin, View):
+    """
+    Streams every flight matching the flight list filters as NDJSON or CSV.
+    Rows are read in chunks as values() dicts and written as they are read,
+    so exports of any size use constant memory (see flights/export.py).
+    """
+    formats = {
+        # Format -> (content type, line generator)
+        'ndjson': ('application/x-ndjson', ndjson_lines),
+        'csv': ('text/csv', csv_lines),
+    }
+    chunk_size = 2000  # Rows fetched from the database at a time
+
+    def get(self, request, *args, **kwargs):
+        """
+        Starts streaming the export in the format named in the URL.
+        """
+        content_type, lines = self.formats[kwargs['format']]
+        rows = flight_rows(self.get_flights(self.get_flight_filter()), chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(lines(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="flights.{kwargs["format"]}"'
+        return response
+
+
 # List view for airports
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='dispatch')
 class AirportListView(ListView):
     """
     Handles the display of a list of all airports.
@@ -287,9 +617,11 @@ class AirportListView(ListView):
 
 
 # Detail view for a specific airport
+@method_decorator(condition(etag_func=airport_etag), name='dispatch')
 class AirportDetailView(DetailView):
     """
-    Handles the display of details for a specific airport.
+    Handles the display of details for a specific airport, with boards of the
+    flights departing and arriving in a time window (see flights/boards.py).
     """
     model = Airport
     template_name = 'flights/airport_detail.html' 
@@ -297,13 +629,55 @@ class AirportDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         """
-        Adds extra context data to the detail view if needed.
+        Adds the departure and arrival boards, each paginated on its own.
+
+        ?start= (YYYY-MM-DD or an ISO datetime, default now) and ?hours= choose the
+        window, ?dep_page= and ?arr_page= the page of each board.
         """
         context = super().get_context_data(**kwargs)
-        context['departing_flights'] = Flight.objects.filter(departure_airport=self.object)
-        context['arriving_fligths'] = Flight.objects.filter(arrival_airport=self.object)
+        params = self.request.GET
+        start = self.parse_start(params.get('start', ''))
+        hours = int(params['hours']) if params.get('hours', '').isdigit() else None
+
+        context['departing_flights'] = get_board(
+            self.object.pk, 'departures', page=self.parse_page(params.get('dep_page')), start=start, hours=hours
+        )
+        context['arriving_fligths'] = get_board(
+            self.object.pk, 'arrivals', page=self.parse_page(params.get('arr_page')), start=start, hours=hours
+        )
+
+        # Board rows come from the fragment cache
+        context['departure_rows'] = render_fragments('flights/board_departure_row.html', context['departing_flights'])
+        context['arrival_rows'] = render_fragments('flights/board_arrival_row.html', context['arriving_fligths'])
+
+        # Page links keep the window and the other board's page
+        for name in ('dep_page', 'arr_page'):
+            others = params.copy()
+            others.pop(name, None)
+            context[f'{name}_prefix'] = f"?{others.urlencode()}&" if others else "?"
         return context
 
+    def parse_start(self, value):
+        """
+        Returns the window start from ?start=, or None (now) if it is missing or invalid.
+        """
+        try:
+            start = parse_datetime(value)
+            day = None if start else parse_date(value)
+        except ValueError:
+            return None
+        if day:
+            return start_of_day(day)
+        if start and timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        return start
+
+    def parse_page(self, value):
+        """
+        Returns a page number, defaulting to the first page.
+        """
+        return int(value) if value and value.isdigit() else 1
+
 
 # Shopping cart creation view
 class ShoppingCartCreateView(LoginRequiredMixin, CreateView):
@@ -340,12 +714,17 @@ class ShoppingCartView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         """
-        Retrieves the shopping cart data, including flights and total price, for the logged-in user.
+        Retrieves the shopping cart data, including flights, rentals and total price, for the logged-in user.
         """
         context = super().get_context_data(**kwargs)
         # Ensure a shopping cart exists for the user
         cart, created = ShoppingCart.objects.get_or_create(user=self.request.user)
-        context['cart_flights'] = ShoppingCartFlight.objects.filter(cart=cart)
+        self.request._cart_summary = cart  # The navigation bar shows the same totals
+        context['cart_flights'] = ShoppingCartFlight.objects.filter(cart=cart).select_related(
+            'flight__departure_airport', 'flight__arrival_airport',
+            'archived_flight__departure_airport', 'archived_flight__arrival_airport',
+        )
+        context['cart_rentals'] = ShoppingCartRental.objects.filter(cart=cart).select_related('rental__aircraft')
         context['total_price'] = cart.total_price
         return context
 
@@ -353,7 +732,19 @@ class CheckoutView(LoginRequiredMixin, View):
     """
     Handles the checkout process for the shopping cart.
     Queries the SerpAPI for purchasing options for flights in the shopping cart.
+
+    Cart lines that share a (departure code, arrival code, date) query are
+    answered by a single request, and the unique queries run concurrently on
+    a thread pool shared by all checkouts. The whole fan-out has a deadline:
+    each request is made once, without retries, with a timeout no longer than
+    the time left before the deadline, so no request outlives the page that
+    made it. Lines whose query did not finish in time get an error entry
+    instead of holding the page up. Lines of archived (departed) flights get
+    an error entry without a query.
     """
+    request_timeout = 10  # Seconds allowed for each SerpAPI request
+    checkout_deadline = 15  # Seconds allowed for all SerpAPI requests together
+    max_workers = 8  # Concurrent SerpAPI requests across all checkouts in the process
 
     def get(self, request, *args, **kwargs):
         """
@@ -361,45 +752,168 @@ class CheckoutView(LoginRequiredMixin, View):
         Retrieves flights in the shopping cart and queries SerpAPI.
         """
         cart = request.user.shopping_cart
-        cart_flights = cart.cart_flights.all()
-        serpapi_results = []
-
-        for cart_flight in cart_flights:
-            # Prepare parameters for SerpAPI
-            print(cart_flight.flight.departure_airport.code)
-            print(cart_flight.flight.arrival_airport.code)
-            print(cart_flight.flight.departure_time.strftime("%Y-%m-%d"))
-            airline_code = cart_flight.flight.flight_number[:2]
-            params = {
-                "engine": "google_flights",
-                "departure_id": cart_flight.flight.departure_airport.code,
-                "arrival_id": cart_flight.flight.arrival_airport.code,
-                "outbound_date": cart_flight.flight.departure_time.strftime("%Y-%m-%d"),
-                "currency": "USD",
-                "hl": "en",
-                "type": "2",
-                # "include_airlines": airline_code,
-                # "deep_search": "true",
-                "api_key": "d764904413d0f85fcb35954a94356a3cb2c27e21726f437941bcdbfdeb166d3d",
-            }
-
-            # Make the request to SerpAPI
-            try:
-                response = requests.get("https://serpapi.com/search.json", params=params)
-                if response.status_code == 200:
-                    flight_data = response.json()
-                    for best_flight in flight_data.get("best_flights", []):
-                        best_flight["last_arrival_airport"] = best_flight["flights"][-1]["arrival_airport"]["name"]
-                    serpapi_results.append(flight_data)
-                else:
-                    serpapi_results.append({"error": response.text})  # Log full error
-            except requests.RequestException as e:
-                serpapi_results.append({"error": str(e)})
+        cart_flights = cart.cart_flights.select_related(
+            'flight__departure_airport', 'flight__arrival_airport'
+        )
+
+        # Group cart lines by the query they need
+        query_keys = [checkout_query(cart_flight) for cart_flight in cart_flights]
+        results = self.fetch_all(dict.fromkeys(key for key in query_keys if key))
 
+        # One result per cart line, shared between lines with the same query
+        serpapi_results = [results[key] if key else DEPARTED_RESULT for key in query_keys]
 
         # Render the checkout page with SerpAPI results
         return render(request, "flights/checkout.html", {"serpapi_results": serpapi_results})
 
+    def fetch_all(self, query_keys):
+        """
+        Runs the unique queries concurrently and returns a key -> result map.
+        Queries still running when the deadline passes are reported as timed out.
+        """
+        results = {}
+        if not query_keys:
+            return results
+
+        deadline = time.monotonic() + self.checkout_deadline
+        executor = checkout_executor(self.max_workers)
+        # Each thread runs in a copy of the request's context, so its SerpAPI time is recorded (see flights/metrics.py)
+        futures = {executor.submit(copy_context().run, self.fetch, *key, deadline): key for key in query_keys}
+        done, not_done = wait(futures, timeout=self.checkout_deadline)
+
+        for future in done:
+            results[futures[future]] = future.result()
+        for future in not_done:
+            future.cancel()  # Queries still queued are dropped; running ones end by the deadline
+            results[futures[future]] = CHECKOUT_TIMEOUT_RESULT
+        return results
+
+    def fetch(self, departure_code, arrival_code, outbound_date, deadline):
+        """
+        Queries SerpAPI for one route and date, giving up at `deadline` (a
+        time.monotonic() value). Errors are returned, not raised, so one
+        failing query does not affect the other cart lines.
+        """
+        budget = min(self.request_timeout, deadline - time.monotonic())
+        if budget <= 0:
+            return CHECKOUT_TIMEOUT_RESULT
+        try:
+            flight_data = get_client().google_flights(
+                departure_code, arrival_code, outbound_date, timeout=budget, retry=False
+            )
+        except SerpApiError as e:
+            if time.monotonic() >= deadline:  # Cut short by the deadline
+                return CHECKOUT_TIMEOUT_RESULT
+            return {"error": str(e)}
+        return add_last_arrival_airports(flight_data)
+
+
+# Checkout result of a cart line whose flight has been archived
+DEPARTED_RESULT = {"error": "This flight has already departed."}
+
+# Checkout result of a query that did not finish before the deadline
+CHECKOUT_TIMEOUT_RESULT = {"error": "Timed out waiting for flight options."}
+
+_checkout_executor = None
+_checkout_executor_lock = threading.Lock()
+
+
+def checkout_executor(max_workers):
+    """
+    Returns the thread pool that runs the SerpAPI queries of every checkout in
+    the process, creating it with `max_workers` threads on first use.
+    """
+    global _checkout_executor
+    if _checkout_executor is None:
+        with _checkout_executor_lock:
+            if _checkout_executor is None:
+                _checkout_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="checkout")
+    return _checkout_executor
+
+
+def checkout_query(cart_flight):
+    """
+    Returns the (departure code, arrival code, date) SerpAPI query of a cart
+    line, or None when its flight has been archived.
+    """
+    if cart_flight.flight_id is None:
+        return None
+    return (
+        cart_flight.flight.departure_airport.code,
+        cart_flight.flight.arrival_airport.code,
+        cart_flight.flight.departure_time.strftime("%Y-%m-%d"),
+    )
+
+
+def add_last_arrival_airports(flight_data):
+    """
+    Marks each itinerary of a SerpAPI response with the airport its last leg arrives at.
+    """
+    for best_flight in flight_data.get("best_flights", []):
+        best_flight["last_arrival_airport"] = best_flight["flights"][-1]["arrival_airport"]["name"]
+    return flight_data
+
+
+class AsyncCheckoutView(AsyncLoginRequiredMixin, View):
+    """
+    Async version of CheckoutView for ASGI servers, routed to when
+    FLIGHTS_ASYNC_VIEWS is on.
+
+    The cart is read through the async queryset API and the unique SerpAPI
+    queries run concurrently with asyncio.gather on the pooled async client
+    (see flights/serpapi_async.py), so a checkout waiting on the network
+    holds no thread and one worker serves many of them at once. Timeouts
+    and the overall deadline are those of CheckoutView.
+    """
+    request_timeout = CheckoutView.request_timeout
+    checkout_deadline = CheckoutView.checkout_deadline
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Handles the GET request for the checkout page.
+        """
+        user = await request.auser()
+        cart_flights = ShoppingCartFlight.objects.filter(cart__user=user).select_related(
+            'flight__departure_airport', 'flight__arrival_airport'
+        )
+        query_keys = [checkout_query(cart_flight) async for cart_flight in cart_flights]
+        results = await self.fetch_all(dict.fromkeys(key for key in query_keys if key))
+        serpapi_results = [results[key] if key else DEPARTED_RESULT for key in query_keys]
+
+        # Rendering may still touch the database (context processors), so it runs in a thread
+        return await sync_to_async(render)(request, "flights/checkout.html", {"serpapi_results": serpapi_results})
+
+    async def fetch_all(self, query_keys):
+        """
+        Runs the unique queries concurrently and returns a key -> result map.
+        Queries still running when the deadline passes are reported as timed out.
+        """
+        keys = list(query_keys)
+        results = await asyncio.gather(*(self.fetch_before_deadline(*key) for key in keys))
+        return dict(zip(keys, results))
+
+    async def fetch_before_deadline(self, *key):
+        """
+        Runs one query, giving up when the checkout deadline passes.
+        """
+        try:
+            return await asyncio.wait_for(self.fetch(*key), timeout=self.checkout_deadline)
+        except asyncio.TimeoutError:
+            return CHECKOUT_TIMEOUT_RESULT
+
+    async def fetch(self, departure_code, arrival_code, outbound_date):
+        """
+        Queries SerpAPI for one route and date. Errors are returned, not raised,
+        so one failing query does not affect the other cart lines.
+        """
+        try:
+            flight_data = await get_async_client().google_flights(
+                departure_code, arrival_code, outbound_date, timeout=self.request_timeout
+            )
+        except SerpApiError as e:
+            return {"error": str(e)}
+        return add_last_arrival_airports(flight_data)
+
 
 # Add flight to shopping cart view
 class AddFlightToCartView(LoginRequiredMixin, UpdateView):
@@ -413,10 +927,21 @@ class AddFlightToCartView(LoginRequiredMixin, UpdateView):
         """
         Adds a flight to the user's shopping cart and redirects back to the shopping cart view.
         Ensures the cart exists for the user before adding the flight.
+
+        A seat is held for the cart first (see flights/seat_holds.py); when the
+        flight has no seats left the user is sent back to it with an error.
         """
         cart, created = ShoppingCart.objects.get_or_create(user=self.request.user)
-        flight = Flight.objects.get(pk=kwargs['pk'])
-        ShoppingCartFlight.objects.create(cart=cart, flight=flight)
+        flight_id = kwargs['pk']
+        try:
+            with transaction.atomic():
+                hold_seats(cart, flight_id)
+                ShoppingCartFlight.objects.create(cart=cart, flight_id=flight_id)
+        except SeatsUnavailable:
+            if not Flight.objects.filter(pk=flight_id).exists():
+                raise Http404("No flight matches the given query.")
+            messages.error(request, "Sorry, there are no seats left on this flight.")
+            return redirect('flight_detail', pk=flight_id)
         return redirect('shopping_cart')
 
 
@@ -473,4 +998,21 @@ class RegistrationView(CreateView):
             return redirect(reverse('all_flights'))
 
         # let CreateView.dispatch handle the HTTP GET request
-        return super().dispatch(request, *args, **kwargs)
\ No newline at end of file
+        return super().dispatch(request, *args, **kwargs)
+
+
+# Prometheus metrics
+class MetricsView(View):
+    """
+    Serves the per-view request histograms recorded by RequestMetricsMiddleware
+    (see flights/metrics.py) in the Prometheus text format. Only staff users and
+    the addresses in FLIGHTS_METRICS["ALLOWED_IPS"] may read them.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the metrics of this worker process.
+        """
+        if not metrics_allowed(request):
+            raise PermissionDenied
+        return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")